@@ -0,0 +1,303 @@
+"""Append-only, hash-chained audit log with Merkle checkpoints.
+
+The log lives in the store's `audit` table.
+
+Chain: every entry records the previous entry's hash, and
+
+    entry_hash = SHA-256(prev_hash | seq | created_at | entity | entity_id | hash)
+
+so editing, inserting or deleting any entry breaks every later link.
+UPDATE/DELETE on the table are also refused by triggers.
+
+Merkle tree: entries are the leaves of an RFC 6962 (Certificate Transparency)
+tree, with leaf = H(0x00 | entry_hash) and node = H(0x01 | left | right).
+Each perfect subtree is stored in audit_nodes as soon as it completes, so an
+append writes O(1) nodes amortized. The root for any tree size, and an
+inclusion proof for any entry, are then assembled from O(log N) stored nodes.
+Nothing is ever rehashed.
+
+Checkpoints: every `checkpoint_every` entries (and on request) the tree
+size, root and chain head are recorded in audit_checkpoints. An auditor who
+holds a checkpoint root can verify any claim with a ~log2(N)-hash inclusion
+proof. Chain re-verification only needs to start at the last trusted
+checkpoint.
+
+All functions take a sqlite3 connection. Appends must run inside the
+caller's write transaction (Store does this in its writer thread), so
+concurrent writers — including other worker processes — serialize on
+SQLite's write lock.
+"""
+import hashlib
+import sqlite3
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+GENESIS = "0" * 64
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS audit_nodes (
+    level INTEGER NOT NULL,
+    idx INTEGER NOT NULL,
+    hash BLOB NOT NULL,
+    PRIMARY KEY (level, idx)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS audit_checkpoints (
+    tree_size INTEGER PRIMARY KEY,
+    root TEXT NOT NULL,
+    chain_head TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+TRIGGERS = """
+CREATE TRIGGER IF NOT EXISTS audit_no_update BEFORE UPDATE ON audit
+BEGIN SELECT RAISE(ABORT, 'audit log is append-only'); END;
+CREATE TRIGGER IF NOT EXISTS audit_no_delete BEFORE DELETE ON audit
+BEGIN SELECT RAISE(ABORT, 'audit log is append-only'); END;
+"""
+
+
+def entry_hash(prev_hash: str, seq: int, created_at: float, entity: str, entity_id: str, record_hash: str) -> str:
+    payload = f"{prev_hash}|{seq}|{created_at!r}|{entity}|{entity_id}|{record_hash}"
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def leaf_hash(entry_hex: str) -> bytes:
+    return hashlib.sha256(b"\x00" + bytes.fromhex(entry_hex)).digest()
+
+
+def node_hash(left: bytes, right: bytes) -> bytes:
+    return hashlib.sha256(b"\x01" + left + right).digest()
+
+
+def _split(n: int) -> int:
+    """Largest power of two strictly below n (n >= 2)."""
+    return 1 << ((n - 1).bit_length() - 1)
+
+
+# ---- writes (inside the caller's transaction) ----
+
+def migrate(conn: sqlite3.Connection) -> None:
+    """Create the Merkle tables and chain any entries written before the log was hash-chained."""
+    cols = {r[1] for r in conn.execute("PRAGMA table_info(audit)")}
+    for col in ("prev_hash", "entry_hash"):
+        if col not in cols:
+            conn.execute(f"ALTER TABLE audit ADD COLUMN {col} TEXT")
+    conn.executescript(SCHEMA)
+    legacy = conn.execute("SELECT seq, created_at, entity, entity_id, hash FROM audit "
+                          "WHERE entry_hash IS NULL ORDER BY seq").fetchall()
+    if legacy:
+        if conn.execute("SELECT COUNT(*) FROM audit WHERE entry_hash IS NOT NULL").fetchone()[0]:
+            raise RuntimeError("audit log has unchained entries after chained ones; refusing to rewrite it")
+        conn.execute("DELETE FROM audit_nodes")
+        prev, cache = GENESIS, {}
+        for i, (seq, created_at, entity, entity_id, record_hash) in enumerate(legacy):
+            eh = entry_hash(prev, i + 1, created_at, entity, entity_id, record_hash)
+            conn.execute("UPDATE audit SET seq = ?, prev_hash = ?, entry_hash = ? WHERE seq = ?",
+                         (i + 1, prev, eh, seq))
+            _add_leaf(conn, i, leaf_hash(eh), cache)
+            prev = eh
+    conn.executescript(TRIGGERS)
+
+
+def _node(conn: sqlite3.Connection, level: int, idx: int, cache: Optional[Dict] = None) -> bytes:
+    if cache is not None and (level, idx) in cache:
+        return cache[(level, idx)]
+    row = conn.execute("SELECT hash FROM audit_nodes WHERE level = ? AND idx = ?", (level, idx)).fetchone()
+    if row is None:
+        raise LookupError(f"missing Merkle node ({level}, {idx})")
+    return bytes(row[0])
+
+
+def _add_leaf(conn: sqlite3.Connection, index: int, leaf: bytes, cache: Dict) -> None:
+    """Store leaf `index` and every perfect subtree it completes."""
+    level, idx, h = 0, index, leaf
+    while True:
+        conn.execute("INSERT INTO audit_nodes (level, idx, hash) VALUES (?, ?, ?)", (level, idx, h))
+        cache[(level, idx)] = h
+        if idx % 2 == 0:
+            return
+        h = node_hash(_node(conn, level, idx - 1, cache), h)
+        level, idx = level + 1, idx // 2
+
+
+def tree_size(conn: sqlite3.Connection) -> int:
+    return conn.execute("SELECT COALESCE(MAX(seq), 0) FROM audit").fetchone()[0]
+
+
+def chain_head(conn: sqlite3.Connection, size: Optional[int] = None) -> str:
+    size = tree_size(conn) if size is None else size
+    if size == 0:
+        return GENESIS
+    return conn.execute("SELECT entry_hash FROM audit WHERE seq = ?", (size,)).fetchone()[0]
+
+
+def append(conn: sqlite3.Connection, rows: Sequence[Dict], checkpoint_every: int = 0) -> List[Tuple[int, str]]:
+    """Chain `rows` ({created_at, entity, entity_id, hash}) onto the log; returns (seq, entry_hash) per row."""
+    size = tree_size(conn)
+    prev = chain_head(conn, size)
+    cache: Dict = {}
+    out = []
+    for row in rows:
+        seq = size + 1
+        eh = entry_hash(prev, seq, row["created_at"], row["entity"], row["entity_id"], row["hash"])
+        conn.execute("INSERT INTO audit (seq, created_at, entity, entity_id, hash, prev_hash, entry_hash) "
+                     "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                     (seq, row["created_at"], row["entity"], row["entity_id"], row["hash"], prev, eh))
+        _add_leaf(conn, size, leaf_hash(eh), cache)
+        size, prev = seq, eh
+        out.append((seq, eh))
+        if checkpoint_every and size % checkpoint_every == 0:
+            checkpoint(conn, cache=cache)
+    return out
+
+
+def checkpoint(conn: sqlite3.Connection, cache: Optional[Dict] = None) -> Optional[Dict]:
+    """Record the current tree head (no-op if the log is empty or unchanged since the last checkpoint)."""
+    size = tree_size(conn)
+    if size == 0:
+        return None
+    row = {"tree_size": size, "root": root(conn, size, cache).hex(), "chain_head": chain_head(conn, size),
+           "created_at": time.time()}
+    conn.execute("INSERT OR IGNORE INTO audit_checkpoints (tree_size, root, chain_head, created_at) "
+                 "VALUES (:tree_size, :root, :chain_head, :created_at)", row)
+    return row
+
+
+# ---- reads ----
+
+def subtree_hash(conn: sqlite3.Connection, lo: int, hi: int, cache: Optional[Dict] = None) -> bytes:
+    """Merkle Tree Hash of leaves [lo, hi), RFC 6962 shape, from stored perfect subtrees."""
+    n = hi - lo
+    if n & (n - 1) == 0 and lo % n == 0:
+        return _node(conn, n.bit_length() - 1, lo // n, cache)
+    k = _split(n)
+    return node_hash(subtree_hash(conn, lo, lo + k, cache), subtree_hash(conn, lo + k, hi, cache))
+
+
+def root(conn: sqlite3.Connection, size: int, cache: Optional[Dict] = None) -> bytes:
+    if size == 0:
+        return hashlib.sha256(b"").digest()
+    return subtree_hash(conn, 0, size, cache)
+
+
+def inclusion_proof(conn: sqlite3.Connection, index: int, size: int) -> List[bytes]:
+    """Audit path for leaf `index` (0-based) in the tree of the first `size` leaves (RFC 6962 PATH)."""
+    if not 0 <= index < size:
+        raise ValueError(f"leaf {index} is not in a tree of size {size}")
+    path = []
+    lo, hi = 0, size
+    while hi - lo > 1:
+        k = _split(hi - lo)
+        if index < lo + k:
+            path.append(subtree_hash(conn, lo + k, hi))
+            hi = lo + k
+        else:
+            path.append(subtree_hash(conn, lo, lo + k))
+            lo = lo + k
+    return path[::-1]
+
+
+def verify_inclusion(leaf: bytes, index: int, size: int, proof: Sequence[bytes], expected_root: bytes) -> bool:
+    """RFC 9162 §2.1.3.2 inclusion check; needs only the leaf, the proof and a trusted root."""
+    if index >= size:
+        return False
+    fn, sn, r = index, size - 1, leaf
+    for p in proof:
+        if sn == 0:
+            return False
+        if fn & 1 or fn == sn:
+            r = node_hash(p, r)
+            if not fn & 1:
+                while fn and not fn & 1:
+                    fn, sn = fn >> 1, sn >> 1
+        else:
+            r = node_hash(r, p)
+        fn, sn = fn >> 1, sn >> 1
+    return sn == 0 and r == expected_root
+
+
+def covering_checkpoint(conn: sqlite3.Connection, seq: int) -> Optional[Dict]:
+    """The earliest checkpoint that includes entry `seq`, if any."""
+    row = conn.execute("SELECT tree_size, root, chain_head, created_at FROM audit_checkpoints "
+                       "WHERE tree_size >= ? ORDER BY tree_size LIMIT 1", (seq,)).fetchone()
+    return dict(zip(("tree_size", "root", "chain_head", "created_at"), row)) if row else None
+
+
+def prove(conn: sqlite3.Connection, seq: int, size: Optional[int] = None) -> Dict:
+    """Entry `seq` with its inclusion proof against tree `size` (default: covering checkpoint, else the head)."""
+    entry = conn.execute("SELECT seq, created_at, entity, entity_id, hash, prev_hash, entry_hash FROM audit "
+                         "WHERE seq = ?", (seq,)).fetchone()
+    if entry is None:
+        raise LookupError(f"audit entry {seq} not found")
+    entry = dict(zip(("seq", "created_at", "entity", "entity_id", "hash", "prev_hash", "entry_hash"), entry))
+    head = tree_size(conn)
+    cp = None
+    if size is None:
+        cp = covering_checkpoint(conn, seq)
+        size = cp["tree_size"] if cp else head
+    if not seq <= size <= head:
+        raise ValueError(f"tree_size must be between {seq} and {head}")
+    r = root(conn, size)
+    if cp is not None and cp["root"] != r.hex():
+        raise RuntimeError(f"checkpoint {size} root does not match the stored tree")
+    path = inclusion_proof(conn, seq - 1, size)
+    return {"entry": entry, "leaf_index": seq - 1, "tree_size": size, "root": r.hex(),
+            "checkpoint": cp, "path": [p.hex() for p in path]}
+
+
+def verify_entry(conn: sqlite3.Connection, seq: int, record_hash: Optional[str] = None,
+                 size: Optional[int] = None) -> Dict:
+    """O(log N) check of one entry: link to its predecessor, its own hash, and Merkle inclusion.
+
+    With `record_hash`, also check that the entry still matches the live record.
+    """
+    proof = prove(conn, seq, size)
+    e = proof["entry"]
+    prev = GENESIS if seq == 1 else conn.execute("SELECT entry_hash FROM audit WHERE seq = ?",
+                                                  (seq - 1,)).fetchone()[0]
+    checks = {
+        "record_matches": None if record_hash is None else record_hash == e["hash"],
+        "entry_hash_valid": entry_hash(e["prev_hash"], seq, e["created_at"], e["entity"], e["entity_id"],
+                                       e["hash"]) == e["entry_hash"],
+        "linked_to_previous": e["prev_hash"] == prev,
+        "included_in_root": verify_inclusion(leaf_hash(e["entry_hash"]), seq - 1, proof["tree_size"],
+                                             [bytes.fromhex(p) for p in proof["path"]],
+                                             bytes.fromhex(proof["root"])),
+    }
+    return {"verified": all(v is not False for v in checks.values()), "checks": checks, **proof}
+
+
+def verify_chain(conn: sqlite3.Connection, start: int = 1, end: Optional[int] = None) -> Dict:
+    """Linear re-verification of entries start..end: links, entry hashes and stored leaves.
+
+    Start from the last trusted checkpoint to keep this proportional to what is new.
+    Root checks confirm every checkpoint in range against the stored tree.
+    """
+    end = tree_size(conn) if end is None else end
+    prev = GENESIS if start <= 1 else chain_head(conn, start - 1)
+    checked = 0
+    cur = conn.execute("SELECT seq, created_at, entity, entity_id, hash, prev_hash, entry_hash FROM audit "
+                       "WHERE seq BETWEEN ? AND ? ORDER BY seq", (max(1, start), end))
+    expected = max(1, start)
+    for seq, created_at, entity, entity_id, record_hash, prev_hash, eh in cur:
+        problem = None
+        if seq != expected:
+            problem = f"gap: expected seq {expected}"
+        elif prev_hash != prev:
+            problem = "broken link to previous entry"
+        elif entry_hash(prev_hash, seq, created_at, entity, entity_id, record_hash) != eh:
+            problem = "entry hash mismatch"
+        elif _node(conn, 0, seq - 1) != leaf_hash(eh):
+            problem = "Merkle leaf mismatch"
+        if problem:
+            return {"ok": False, "checked": checked, "first_bad_seq": seq, "reason": problem}
+        prev, expected, checked = eh, seq + 1, checked + 1
+    if expected <= end:
+        return {"ok": False, "checked": checked, "first_bad_seq": expected, "reason": "missing entries"}
+    for size, cp_root, cp_head in conn.execute("SELECT tree_size, root, chain_head FROM audit_checkpoints "
+                                               "WHERE tree_size BETWEEN ? AND ?", (max(1, start), end)).fetchall():
+        if root(conn, size).hex() != cp_root or chain_head(conn, size) != cp_head:
+            return {"ok": False, "checked": checked, "first_bad_seq": size, "reason": "checkpoint mismatch"}
+    return {"ok": True, "checked": checked, "first_bad_seq": None, "reason": None}
@@ -0,0 +1,92 @@
+"""Pluggable inference runtimes for the served models.
+
+INFERENCE_BACKEND chooses how a checkpoint is executed:
+
+    auto         ONNX Runtime if an up-to-date .onnx export and onnxruntime exist,
+                 else TorchScript, else eager PyTorch (default)
+    onnx         ONNX Runtime export
+    torchscript  frozen TorchScript export
+    eager        the nn.Module from the .pt state dict
+
+A forced backend whose artifact is missing or stale falls back to eager.
+Artifacts come from `python export_models.py` and sit next to the checkpoint
+(best_unet.pt -> best_unet.onnx, best_unet.torchscript.pt). An export older
+than its checkpoint is ignored. The ONNX path never imports torch, so it can
+serve from an image without the torch wheel.
+
+A runner is fn(*numpy inputs) -> numpy output (the model's first output).
+"""
+import importlib.util
+import os
+from typing import Callable, Optional, Tuple
+
+import numpy as np
+
+ORT_AVAILABLE = importlib.util.find_spec("onnxruntime") is not None
+TORCH_AVAILABLE = importlib.util.find_spec("torch") is not None
+BACKENDS = ("auto", "onnx", "torchscript", "eager")
+
+Runner = Callable[..., np.ndarray]
+
+
+def artifact_path(checkpoint: str, kind: str) -> str:
+    stem = checkpoint[:-3] if checkpoint.endswith(".pt") else checkpoint
+    return stem + (".onnx" if kind == "onnx" else ".torchscript.pt")
+
+
+def _fresh(artifact: str, checkpoint: str) -> bool:
+    if not os.path.exists(artifact):
+        return False
+    return not os.path.exists(checkpoint) or os.path.getmtime(artifact) >= os.path.getmtime(checkpoint)
+
+
+def onnx_runner(path: str, threads: int = 0) -> Runner:
+    import onnxruntime as ort
+    opts = ort.SessionOptions()
+    opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if threads > 0:
+        opts.intra_op_num_threads = threads
+    sess = ort.InferenceSession(path, sess_options=opts, providers=["CPUExecutionProvider"])
+    names = [i.name for i in sess.get_inputs()]
+
+    def run(*arrays):
+        return sess.run(None, {n: np.ascontiguousarray(a) for n, a in zip(names, arrays)})[0]
+    return run
+
+
+def torch_runner(module) -> Runner:
+    import torch
+
+    def run(*arrays):
+        with torch.no_grad():
+            out = module(*(torch.from_numpy(np.ascontiguousarray(a)) for a in arrays))
+        return out.cpu().numpy()
+    return run
+
+
+def load_runner(checkpoint: str, build_eager: Callable[[], object], preference: str = "auto",
+                quantize: Optional[Callable[[object], object]] = None, threads: int = 0) -> Optional[Tuple[str, Runner]]:
+    """(backend name, runner) for a checkpoint, or None when no runtime can serve it.
+    build_eager() returns the eval-mode nn.Module loaded from the checkpoint. With
+    `quantize` the eager module is converted (see quant.py) and served as "eager-int8".
+    `threads` caps ONNX Runtime's intra-op pool (torch threads are set per calling thread)."""
+    if preference not in BACKENDS:
+        raise ValueError(f"INFERENCE_BACKEND must be one of {', '.join(BACKENDS)}")
+    if quantize is not None:
+        return ("eager-int8", torch_runner(quantize(build_eager()))) if TORCH_AVAILABLE else None
+    kinds = ("onnx", "torchscript") if preference == "auto" else (preference,)
+    for kind in kinds:
+        path = artifact_path(checkpoint, kind)
+        if kind == "eager" or not _fresh(path, checkpoint):
+            continue
+        try:
+            if kind == "onnx" and ORT_AVAILABLE:
+                return "onnx", onnx_runner(path, threads)
+            if kind == "torchscript" and TORCH_AVAILABLE:
+                import torch
+                return "torchscript", torch_runner(torch.jit.load(path, map_location="cpu").eval())
+        except Exception as e:
+            print(f"Could not load {path} ({e}); falling back")
+    if not TORCH_AVAILABLE:
+        return None
+    return "eager", torch_runner(build_eager())
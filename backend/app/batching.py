@@ -0,0 +1,112 @@
+"""Dynamic micro-batching for model inference.
+
+The FastAPI handlers are sync `def`s, so every request runs in its own worker
+thread. Instead of each thread doing its own batch-of-one forward pass, a
+handler submits its inputs to a shared MicroBatcher and blocks on a Future. A
+single batching thread collects whatever arrives within `max_wait_ms` (or
+until `max_batch` items are queued) and runs one forward pass for all of them.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, List, Optional
+
+
+class MicroBatcher:
+    def __init__(self, name: str, batch_fn: Callable[[List[Any]], List[Any]],
+                 max_batch: int = 16, max_wait_ms: float = 5.0, enabled: bool = True):
+        self.name = name
+        self.batch_fn = batch_fn
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait_ms = max(0.0, float(max_wait_ms))
+        self.enabled = enabled
+        self._q: "queue.Queue" = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        # metrics
+        self._batches = 0
+        self._items = 0
+        self._peak_depth = 0
+        self._wait_ms_total = 0.0
+        self._run_ms_total = 0.0
+        self._last_batch_size = 0
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._loop, name=f"batcher-{self.name}", daemon=True)
+                    self._thread.start()
+
+    def submit(self, item: Any) -> Future:
+        """Queue one input; the Future resolves to its slot of batch_fn's output."""
+        fut: Future = Future()
+        if not self.enabled:
+            try:
+                fut.set_result(self.batch_fn([item])[0])
+            except Exception as e:
+                fut.set_exception(e)
+            return fut
+        self._ensure_thread()
+        self._q.put((item, fut, time.perf_counter()))
+        depth = self._q.qsize()
+        if depth > self._peak_depth:
+            self._peak_depth = depth
+        return fut
+
+    def map(self, items: List[Any]) -> List[Any]:
+        """Submit several inputs (e.g. the tiles of one scene) and wait for all of them."""
+        if not self.enabled:
+            return list(self.batch_fn(list(items)))
+        futs = [self.submit(it) for it in items]
+        return [f.result() for f in futs]
+
+    def _loop(self):
+        while True:
+            first = self._q.get()
+            batch = [first]
+            deadline = time.perf_counter() + self.max_wait_ms / 1000.0
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                try:
+                    batch.append(self._q.get(timeout=remaining) if remaining > 0 else self._q.get_nowait())
+                except queue.Empty:
+                    break
+            self._run(batch)
+
+    def _run(self, batch):
+        start = time.perf_counter()
+        try:
+            results = self.batch_fn([it for it, _, _ in batch])
+            if len(results) != len(batch):
+                raise RuntimeError(f"{self.name}: batch_fn returned {len(results)} results for {len(batch)} inputs")
+            for (_, fut, _), res in zip(batch, results):
+                fut.set_result(res)
+        except Exception as e:
+            for _, fut, _ in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+        end = time.perf_counter()
+        self._batches += 1
+        self._items += len(batch)
+        self._last_batch_size = len(batch)
+        self._wait_ms_total += sum(start - t0 for _, _, t0 in batch) * 1000.0
+        self._run_ms_total += (end - start) * 1000.0
+
+    def stats(self) -> dict:
+        batches, items = self._batches, self._items
+        return {
+            "name": self.name,
+            "enabled": self.enabled,
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait_ms,
+            "queue_depth": self._q.qsize(),
+            "peak_queue_depth": self._peak_depth,
+            "batches": batches,
+            "items": items,
+            "avg_batch_size": round(items / batches, 2) if batches else 0.0,
+            "last_batch_size": self._last_batch_size,
+            "avg_queue_wait_ms": round(self._wait_ms_total / items, 3) if items else 0.0,
+            "avg_forward_ms": round(self._run_ms_total / batches, 3) if batches else 0.0,
+        }
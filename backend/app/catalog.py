@@ -0,0 +1,138 @@
+"""Memory-resident, spatially indexed catalog of preprocessed tiles.
+
+The manifests (processed/manifests/{tiles,train,val}.csv) are read once into
+arrays, with an STRtree over the tile footprints and a per-date index. Lookups
+no longer re-read and concatenate the CSVs on every request. The files are
+re-stat'ed at most every `check_interval` seconds, and the catalog reloads
+when any of them changes on disk.
+"""
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+MANIFEST_NAMES = ("tiles.csv", "train.csv", "val.csv")
+BOUNDS_COLS = ("south", "west", "north", "east")
+
+
+def normalize_date(value) -> Optional[str]:
+    """'2025-10-26', '2025-10-26T05:12:00', '20251026' -> '2025-10-26' (None if blank)."""
+    if value is None:
+        return None
+    s = str(value).strip()
+    if not s or s.lower() == "nan":
+        return None
+    if len(s) >= 8 and s[:8].isdigit():
+        return f"{s[:4]}-{s[4:6]}-{s[6:8]}"
+    return s[:10]
+
+
+class _Snapshot:
+    """Immutable loaded state; swapped atomically on reload."""
+
+    def __init__(self, signature, rows: List[dict], error: Optional[str] = None):
+        self.signature = signature
+        self.rows = rows
+        self.error = error
+        self.has_dates = bool(rows) and any(r.get("date") for r in rows)
+        if rows and not error:
+            from shapely import box as shapely_box
+            from shapely.strtree import STRtree
+            b = np.array([[float(r[c]) for c in BOUNDS_COLS] for r in rows], dtype=np.float64)
+            self.bounds = b  # south, west, north, east
+            self.tree = STRtree(shapely_box(b[:, 1], b[:, 0], b[:, 3], b[:, 2]))
+            self.by_date: Dict[str, np.ndarray] = {}
+            for i, r in enumerate(rows):
+                self.by_date.setdefault(r.get("date"), []).append(i)
+            self.by_date = {d: np.array(ix, dtype=np.int64) for d, ix in self.by_date.items()}
+        else:
+            self.bounds = np.zeros((0, 4))
+            self.tree = None
+            self.by_date = {}
+
+
+class TileCatalog:
+    def __init__(self, manifest_dir: str, names=MANIFEST_NAMES, check_interval: float = 2.0):
+        self.manifest_dir = manifest_dir
+        self.names = names
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+        self._snap = _Snapshot(None, [], error="not loaded")
+        self.reloads = 0
+
+    def _signature(self) -> Tuple:
+        sig = []
+        for name in self.names:
+            p = os.path.join(self.manifest_dir, name)
+            try:
+                st = os.stat(p)
+            except OSError:
+                continue
+            sig.append((p, st.st_mtime_ns, st.st_size))
+        return tuple(sig)
+
+    def _load(self, signature) -> _Snapshot:
+        if not signature:
+            return _Snapshot(signature, [], error="No manifests found; run preprocessing first.")
+        import pandas as pd
+        df = pd.concat([pd.read_csv(p) for p, _, _ in signature], ignore_index=True)
+        if not all(c in df.columns for c in BOUNDS_COLS):
+            return _Snapshot(signature, [], error="Manifests missing bounds columns (south,west,north,east). Re-run preprocessing to include tile bounds.")
+        df = df.dropna(subset=list(BOUNDS_COLS))
+        if "image_path" in df.columns:
+            df = df.drop_duplicates(subset=["image_path"])
+        df = df.astype(object).where(df.notna(), None)
+        rows = df.to_dict("records")
+        for r in rows:
+            r["date"] = normalize_date(r.get("date"))
+        return _Snapshot(signature, rows)
+
+    def snapshot(self) -> _Snapshot:
+        """Current state, reloading first if a manifest changed on disk."""
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_interval:
+            with self._lock:
+                if now - self._checked_at >= self.check_interval:
+                    sig = self._signature()
+                    if sig != self._snap.signature:
+                        self._snap = self._load(sig)
+                        self.reloads += 1
+                    self._checked_at = now
+        return self._snap
+
+    @property
+    def error(self) -> Optional[str]:
+        return self.snapshot().error
+
+    def query(self, minx: float, miny: float, maxx: float, maxy: float, date: Optional[str] = None) -> List[dict]:
+        """Manifest rows whose tile footprint intersects the lon/lat box.
+
+        With `date`, only tiles acquired that day are returned. Without it,
+        all dates are returned, newest first. Rows keep their manifest order
+        within one date.
+        """
+        snap = self.snapshot()
+        if snap.tree is None:
+            return []
+        from shapely import box as shapely_box
+        idx = np.sort(snap.tree.query(shapely_box(minx, miny, maxx, maxy), predicate="intersects"))
+        if date:
+            day = snap.by_date.get(normalize_date(date))
+            if day is None:
+                return []
+            idx = idx[np.isin(idx, day, assume_unique=True)]
+            return [snap.rows[i] for i in idx]
+        rows = [snap.rows[i] for i in idx]
+        rows.sort(key=lambda r: r.get("date") or "", reverse=True)
+        return rows
+
+    def dates(self) -> List[str]:
+        return sorted(d for d in self.snapshot().by_date if d)
+
+    def stats(self) -> dict:
+        snap = self.snapshot()
+        return {"tiles": len(snap.rows), "dates": len([d for d in snap.by_date if d]),
+                "reloads": self.reloads, "error": snap.error}
@@ -0,0 +1,203 @@
+"""Sized executor for the model endpoints, with admission control.
+
+Starlette runs sync handlers on a large shared threadpool, and every torch
+thread defaults to one intra-op thread per core. A few concurrent requests
+then oversubscribe the CPU and tail latency becomes unpredictable. Instead,
+the inference endpoints run on `workers` dedicated threads. Each thread that
+executes model code (these workers and the micro-batching threads) is pinned
+to `torch_threads` intra-op threads, so workers x torch_threads can be sized
+to the machine.
+
+At most `workers + max_queue` requests are admitted. Beyond that, run()
+raises Overloaded with a Retry-After estimate, which the app turns into 429.
+
+Endpoints whose model work goes through a MicroBatcher don't hold a worker
+while they wait for their batch: batched_endpoint() admits them against a
+separate `max_batched` budget and runs the async handler on the event loop,
+where it awaits the batcher future. Otherwise every batch would be capped at
+`workers` items.
+"""
+import asyncio
+import contextlib
+import functools
+import math
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+_local = threading.local()
+_interop_lock = threading.Lock()
+_interop_set = False
+
+
+class Overloaded(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__(f"inference queue full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+def apply_thread_limits(intra: int, interop: int = 0):
+    """Limit torch intra-op threads for the calling thread, and inter-op threads once per process.
+
+    Only acts once torch has been imported, so it is cheap to call per task and
+    does not import torch for the ONNX Runtime backend.
+    """
+    global _interop_set
+    if intra <= 0 or getattr(_local, "intra", None) == intra or "torch" not in sys.modules:
+        return
+    import torch
+    torch.set_num_threads(intra)  # OpenMP settings are per thread
+    _local.intra = intra
+    if interop > 0 and not _interop_set:
+        with _interop_lock:
+            if not _interop_set:
+                try:
+                    torch.set_num_interop_threads(interop)
+                except RuntimeError:
+                    pass  # inter-op pool already started; the setting only applies before first use
+                _interop_set = True
+
+
+def with_thread_limits(fn: Callable, intra: int, interop: int = 0) -> Callable:
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        apply_thread_limits(intra, interop)
+        return fn(*args, **kwargs)
+    return wrapper
+
+
+class InferenceExecutor:
+    def __init__(self, workers: int, max_queue: int, torch_threads: int, interop_threads: int = 0,
+                 name: str = "inference", max_batched: int = 256):
+        self.workers = max(1, int(workers))
+        self.max_queue = max(0, int(max_queue))
+        self.max_batched = max(1, int(max_batched))
+        self.torch_threads = torch_threads
+        self.interop_threads = interop_threads
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._running = 0
+        self._batched = 0
+        self.peak = self.completed = self.rejected = self.failed = 0
+        self.batched_peak = self.batched_rejected = 0
+        self._service_ms = None  # EWMA of per-call run time
+        self._wait_ms_total = 0.0
+
+    def _admit(self):
+        with self._lock:
+            if self._pending >= self.workers + self.max_queue:
+                self.rejected += 1
+                raise Overloaded(self.retry_after())
+            self._pending += 1
+            self.peak = max(self.peak, self._pending)
+
+    def _release(self):
+        with self._lock:
+            self._pending -= 1
+
+    def slot(self) -> Callable[[], None]:
+        """Admit one long-lived request (e.g. a streamed response) and return its idempotent release.
+
+        Work it then runs with run(..., admit=False) counts against this slot instead of
+        taking another one, so a stream costs one admission for its whole lifetime.
+        """
+        self._admit()
+        released = False
+
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                self._release()
+        return release
+
+    @contextlib.contextmanager
+    def admitted_batched(self):
+        with self._lock:
+            if self._batched >= self.max_batched:
+                self.batched_rejected += 1
+                raise Overloaded(1)
+            self._batched += 1
+            self.batched_peak = max(self.batched_peak, self._batched)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._batched -= 1
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely free: queued work spread over the workers."""
+        per_call = (self._service_ms or 1000.0) / 1000.0
+        return max(1, math.ceil(per_call * max(1, self._pending - self.workers + 1) / self.workers))
+
+    def _call(self, fn, args, kwargs, queued_at: float):
+        start = time.perf_counter()
+        with self._lock:
+            self._running += 1
+            self._wait_ms_total += (start - queued_at) * 1000.0
+        try:
+            apply_thread_limits(self.torch_threads, self.interop_threads)
+            return fn(*args, **kwargs)
+        finally:
+            ms = (time.perf_counter() - start) * 1000.0
+            with self._lock:
+                self._running -= 1
+                self._service_ms = ms if self._service_ms is None else 0.8 * self._service_ms + 0.2 * ms
+
+    async def run(self, fn: Callable, *args, admit: bool = True, **kwargs):
+        """Run fn on the pool. With admit=True, raise Overloaded instead of queueing past max_queue;
+        admit=False is for callers already holding a slot()."""
+        if admit:
+            self._admit()
+        try:
+            fut = self._pool.submit(self._call, fn, args, kwargs, time.perf_counter())
+            result = await asyncio.wrap_future(fut)
+            self.completed += 1
+            return result
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            if admit:
+                self._release()
+
+    def endpoint(self, fn: Callable) -> Callable:
+        """Turn a sync handler into an async one that runs on this executor (signature preserved for FastAPI)."""
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            return await self.run(fn, *args, **kwargs)
+        return wrapper
+
+    def batched_endpoint(self, fn: Callable) -> Callable:
+        """Admission control for an async handler that awaits a MicroBatcher (runs on the event loop)."""
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            with self.admitted_batched():
+                return await fn(*args, **kwargs)
+        return wrapper
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending, running, batched = self._pending, self._running, self._batched
+        done = self.completed + self.failed
+        return {
+            "workers": self.workers,
+            "torch_threads": self.torch_threads,
+            "interop_threads": self.interop_threads,
+            "max_queue": self.max_queue,
+            "running": running,
+            "queued": max(0, pending - running),
+            "peak": self.peak,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "max_batched": self.max_batched,
+            "batched_waiting": batched,
+            "batched_peak": self.batched_peak,
+            "batched_rejected": self.batched_rejected,
+            "avg_queue_wait_ms": round(self._wait_ms_total / done, 3) if done else 0.0,
+            "service_ms_ewma": round(self._service_ms, 3) if self._service_ms is not None else None,
+        }
@@ -0,0 +1,138 @@
+"""Pre-serialized field GeoJSON for /api/farms.
+
+Each feature is encoded to JSON bytes once per coordinate precision and kept,
+so a response just streams cached byte strings: there is no
+jsonable_encoder pass and no re-serialization per request.
+
+- precision=None keeps full double precision (GEOS writes the shortest repr
+  that round-trips). precision=N snaps coordinates to a 10^-N degree grid
+  (shapely.set_precision, pointwise), which is where most of the size goes.
+- A zoom level maps to the coarsest precision that is still finer than one
+  256 px tile pixel.
+- Filtering uses the FieldRegistry STRtree. Pages follow registry order, and
+  the cursor is the last registry index served, so it stays valid for as long
+  as the fields file does.
+- The ETag hashes the dataset version, the encoding and the selected indices,
+  so If-None-Match is answered before anything is serialized.
+"""
+import base64
+import hashlib
+import json
+import math
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+FARM_FORMATS = ("geojson", "ndjson")
+ACCEPT_FORMATS = {"application/x-ndjson": "ndjson", "application/ndjson": "ndjson",
+                  "application/geo+json": "geojson", "application/json": "geojson"}
+MAX_PRECISION = 7  # ~1 cm at the equator
+
+
+def negotiate(accept: Optional[str], override: Optional[str] = None) -> str:
+    """Pick a farms format from ?format= or the first Accept type we serve."""
+    if override:
+        if override not in FARM_FORMATS:
+            raise ValueError(f"format must be one of {', '.join(FARM_FORMATS)}")
+        return override
+    for part in (accept or "").split(","):
+        fmt = ACCEPT_FORMATS.get(part.split(";")[0].strip().lower())
+        if fmt:
+            return fmt
+    return "geojson"
+
+
+def precision_for_zoom(zoom: float) -> int:
+    """Decimal places whose grid is finer than one pixel of a 256 px web-mercator tile at `zoom`."""
+    deg_per_px = 360.0 / (256 * 2 ** max(0.0, float(zoom)))
+    return int(min(MAX_PRECISION, max(0, math.ceil(-math.log10(deg_per_px)))))
+
+
+def encode_cursor(index: int) -> str:
+    return base64.urlsafe_b64encode(f"f{index}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> int:
+    """Inverse of encode_cursor; raises ValueError on anything malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        if not raw.startswith("f"):
+            raise ValueError
+        return int(raw[1:])
+    except Exception:
+        raise ValueError("invalid cursor")
+
+
+class FarmIndex:
+    def __init__(self, registry, version: str):
+        self.registry = registry
+        self.version = version
+        self._bytes: Dict[Optional[int], np.ndarray] = {}
+        self._lock = threading.Lock()
+
+    def _cache(self, precision: Optional[int]) -> np.ndarray:
+        cache = self._bytes.get(precision)
+        if cache is None:
+            with self._lock:
+                cache = self._bytes.setdefault(precision, np.full(len(self.registry), None, dtype=object))
+        return cache
+
+    def _serialize(self, idx: np.ndarray, precision: Optional[int]) -> List[bytes]:
+        import shapely
+        feats = self.registry.features
+        dumps = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False).encode
+        geoms = self.registry.geoms[idx]
+        if precision is not None:
+            geoms = shapely.set_precision(geoms, 10.0 ** -precision, mode="pointwise")
+        out = []
+        for i, g in zip(idx.tolist(), shapely.to_geojson(geoms).tolist()):
+            f = feats[i]
+            head = {"type": "Feature", **({"id": f["id"]} if "id" in f else {}),
+                    "properties": f.get("properties") or {}}
+            geom = g if f.get("geometry") is not None else "null"
+            out.append(f'{dumps(head)[:-1]},"geometry":{geom}}}'.encode())
+        return out
+
+    def features(self, idx: np.ndarray, precision: Optional[int] = None) -> List[bytes]:
+        """Encoded features for registry indices `idx`, serializing (once) any not yet cached."""
+        cache = self._cache(precision)
+        missing = idx[np.equal(cache[idx], None)]
+        if missing.size:
+            cache[missing] = self._serialize(missing, precision)
+        return cache[idx].tolist()
+
+    def select(self, bbox: Optional[Tuple[float, float, float, float]] = None, after: Optional[int] = None,
+               limit: Optional[int] = None) -> Tuple[np.ndarray, Optional[int]]:
+        """Registry indices intersecting bbox (west, south, east, north), paged; returns (idx, next_after)."""
+        idx = self.registry.query_bbox(*bbox) if bbox is not None else np.arange(len(self.registry))
+        if after is not None:
+            idx = idx[np.searchsorted(idx, after, side="right"):]
+        if limit is not None and idx.size > limit:
+            idx = idx[:limit]
+            return idx, int(idx[-1])
+        return idx, None
+
+    def etag(self, idx: np.ndarray, precision: Optional[int], fmt: str, next_after: Optional[int]) -> str:
+        h = hashlib.sha256(f"{self.version}|{precision}|{fmt}|{next_after}|".encode())
+        h.update(np.ascontiguousarray(idx, dtype=np.int64).tobytes())
+        return f'"{h.hexdigest()[:32]}"'
+
+    @staticmethod
+    def feature_collection(features: List[bytes], extra: Optional[Dict] = None, chunk: int = 1024) -> Iterator[bytes]:
+        """Stream a FeatureCollection around already-encoded features (extra keys go after the array)."""
+        yield b'{"type":"FeatureCollection","features":['
+        for i in range(0, len(features), chunk):
+            yield (b"," if i else b"") + b",".join(features[i:i + chunk])
+        yield b"]" + "".join(f',"{k}":{json.dumps(v)}' for k, v in (extra or {}).items()).encode() + b"}"
+
+    @staticmethod
+    def ndjson(features: List[bytes], chunk: int = 1024) -> Iterator[bytes]:
+        for i in range(0, len(features), chunk):
+            yield b"\n".join(features[i:i + chunk]) + b"\n"
+
+    def stats(self) -> Dict:
+        cached = {str(p): (int(np.count_nonzero(~np.equal(c, None))),
+                           sum(len(b) for b in c if b is not None)) for p, c in list(self._bytes.items())}
+        return {"fields": len(self.registry), "version": self.version,
+                "cached": {p: {"features": n, "bytes": size} for p, (n, size) in cached.items()}}
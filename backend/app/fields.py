@@ -0,0 +1,62 @@
+"""In-memory field registry with a spatial index.
+
+Built once from the fields GeoJSON at startup. It gives O(1) lookup by
+field_id, geometries that are parsed and prepared once, and an STRtree for
+bbox and intersection queries. Per-request scans of GEOJSON["features"] are
+no longer needed.
+"""
+from typing import Dict, List, Optional
+
+import numpy as np
+import shapely
+from shapely.geometry import GeometryCollection, box
+from shapely.geometry import shape as shapely_shape
+from shapely.strtree import STRtree
+
+
+class FieldRegistry:
+    def __init__(self, geojson: dict):
+        self.geojson = geojson
+        self.features: List[dict] = list(geojson.get("features", []))
+        self.ids: List[str] = [str(f.get("properties", {}).get("field_id")) for f in self.features]
+        self._index: Dict[str, int] = {fid: i for i, fid in enumerate(self.ids)}
+        geoms = []
+        for feat in self.features:
+            g = feat.get("geometry")
+            geoms.append(shapely_shape(g) if g else GeometryCollection())
+        self.geoms = np.array(geoms, dtype=object)
+        # Prepared geometries make repeated intersects/contains tests cheap
+        shapely.prepare(self.geoms)
+        self.tree = STRtree(self.geoms)
+
+    def __len__(self) -> int:
+        return len(self.features)
+
+    def __contains__(self, field_id) -> bool:
+        return str(field_id) in self._index
+
+    def index_of(self, field_id) -> Optional[int]:
+        return self._index.get(str(field_id))
+
+    def get(self, field_id) -> Optional[dict]:
+        """GeoJSON feature for a field_id, or None."""
+        i = self.index_of(field_id)
+        return self.features[i] if i is not None else None
+
+    def geometry(self, field_id):
+        """Prepared shapely geometry for a field_id, or None."""
+        i = self.index_of(field_id)
+        return self.geoms[i] if i is not None else None
+
+    def query_bbox(self, minx: float, miny: float, maxx: float, maxy: float) -> np.ndarray:
+        """Indices of fields whose polygon intersects the lon/lat box, in registry order."""
+        idx = self.tree.query(box(minx, miny, maxx, maxy), predicate="intersects")
+        return np.sort(idx)
+
+    def query_geometry(self, geom) -> np.ndarray:
+        """Indices of fields whose polygon intersects `geom`, in registry order."""
+        return np.sort(self.tree.query(geom, predicate="intersects"))
+
+    def fields_in_tile(self, south: float, west: float, north: float, east: float) -> List[str]:
+        """field_ids intersecting a tile given in the API's [south, west, north, east] order."""
+        return [self.ids[i] for i in self.query_bbox(west, south, east, north)]
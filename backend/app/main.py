@@ -1,57 +1,69 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Depends
+import time
+_IMPORT_STARTED = time.perf_counter()  # cold-start timing, reported by /api/health
+
+from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-import json, hashlib, random, time, os, io, base64
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
+import asyncio, csv, json, hashlib, os, io, base64, math
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from types import SimpleNamespace
 from pydantic import BaseModel
 from typing import List, Optional
 from datetime import datetime, timedelta
 import numpy as np
-from shapely.geometry import shape as shapely_shape
-from rasterio.features import rasterize
-from rasterio.transform import from_bounds
 from dotenv import load_dotenv
 from pathlib import Path
 
+from .backends import ORT_AVAILABLE, load_runner
+from .batching import MicroBatcher
+from .bulk import detect_format, prepare_features, read_table
+from .catalog import TileCatalog
+from .executor import InferenceExecutor, Overloaded, with_thread_limits
+from .farms import (MAX_PRECISION, FarmIndex, decode_cursor as decode_farm_cursor,
+                    encode_cursor as encode_farm_cursor, negotiate as negotiate_farms, precision_for_zoom)
+from .maskcache import MaskCache, geometry_key
+from .quant import QUANT_MODES, quantize_ft_dynamic, quantize_unet_static, sample_tiles
+from .ndvi import NdviEngine, rank_hotspots
+from .maskcodec import BINARY_FORMATS, binary_response, json_mask_fields, negotiate
+from .pyramid import KINDS as FLOOD_KINDS, FloodPyramid, empty_png
+from .registry import LazyRegistry
+from .reports import PdfCache, ReportRenderer, claim_key, iter_pdf, pdf_bytes, zip_reports
+from .serve import proc_memory
+from . import audit
+from .store import Store, new_id
+from .tilestore import TileStore
+from .weather import HTTPX_AVAILABLE, WeatherClient
+from .weather_mock import mock_onecall
+from .zonal import bounds_transform, label_counts, rasterize_labels
+from .tiling import sigmoid, tiled_mask_and_prob, tiled_predict
+
 # Load environment variables
 load_dotenv()
 
+# Optional dependencies are only located here; each is imported on first use so that
+# cold starts (Netlify/Mangum) don't pay for torch, sklearn, reportlab, rasterio, ...
+def _has_module(name: str) -> bool:
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
+
 # JWT and password hashing
-try:
-    from jose import JWTError, jwt
-    from passlib.context import CryptContext
-    JWT_AVAILABLE = True
-except:
-    JWT_AVAILABLE = False
+JWT_AVAILABLE = _has_module("jose") and _has_module("passlib")
 
 # PDF generation
-try:
-    from reportlab.lib.pagesizes import A4
-    from reportlab.lib import colors
-    from reportlab.lib.units import inch
-    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image as RLImage
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    PDF_AVAILABLE = True
-except:
-    PDF_AVAILABLE = False
+PDF_AVAILABLE = _has_module("reportlab")
 
 # Weather API
-try:
-    import requests
-    REQUESTS_AVAILABLE = True
-except:
-    REQUESTS_AVAILABLE = False
+REQUESTS_AVAILABLE = _has_module("requests")
 
-# Optional torch import for DL endpoint
-try:
-    import torch
-    import torch.nn as nn
-    TORCH_AVAILABLE = True
-except Exception:
-    TORCH_AVAILABLE = False
-try:
-    import joblib
-except Exception:
-    joblib = None
+# Optional torch for the DL endpoints
+TORCH_AVAILABLE = _has_module("torch")
 
 app = FastAPI(title="Vani - Flood Insurance API")
 
@@ -64,7 +76,13 @@ app.add_middleware(
 
 # Security setup - Clerk will handle authentication
 # Keep minimal JWT support for legacy endpoints
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto") if JWT_AVAILABLE else None
+@lru_cache(maxsize=1)
+def pwd_context():
+    if not JWT_AVAILABLE:
+        return None
+    from passlib.context import CryptContext
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
+
 security = HTTPBearer(auto_error=False)
 SECRET_KEY = os.getenv("JWT_SECRET_KEY", "dev-secret-key")
 ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
@@ -86,12 +104,38 @@ try:
     geojson_path = next((p for p in candidate_paths if p.exists()), None)
     if not geojson_path:
         raise FileNotFoundError("sample_fields.geojson not found in expected locations")
-    with open(geojson_path, "r", encoding="utf-8") as f:
-        GEOJSON = json.load(f)
+    with open(geojson_path, "rb") as f:
+        _geojson_raw = f.read()
+    GEOJSON = json.loads(_geojson_raw)
+    GEOJSON_VERSION = hashlib.sha256(_geojson_raw).hexdigest()[:16]
+    del _geojson_raw
 except Exception as e:
     # Fail fast with a clear message (helps when uvicorn started from a different CWD)
     raise RuntimeError(f"Failed to load sample fields GeoJSON: {e}")
 
+# Models and heavy indexes, each built on first use or by the warmup thread (see /api/health)
+RESOURCES = LazyRegistry()
+
+
+def _load_fields():
+    from .fields import FieldRegistry
+    return FieldRegistry(GEOJSON)
+
+RESOURCES.register("fields", _load_fields)
+
+
+def field_registry():
+    """Field registry: field_id lookups, prepared geometries and an STRtree for spatial queries."""
+    return RESOURCES.get("fields")
+
+
+def _load_farm_index():
+    index = FarmIndex(field_registry(), GEOJSON_VERSION)
+    index.features(np.arange(len(index.registry)))  # encode before workers fork so they share the bytes
+    return index
+
+RESOURCES.register("farms", _load_farm_index)
+
 # ============= AUTH ENDPOINTS - DEPRECATED =============
 # Note: Authentication is now handled by Clerk on the frontend.
 # These endpoints are kept for backward compatibility but will be removed.
@@ -116,6 +160,7 @@ def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(securit
     if not JWT_AVAILABLE:
         return {"username": "demo@vani.in", "role": "user"}
     
+    from jose import JWTError, jwt
     try:
         token = credentials.credentials
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
@@ -149,91 +194,58 @@ def get_me(current_user: dict = Depends(get_current_user)):
 
 # ============= WEATHER ENDPOINTS (One Call API 3.0) =============
 
+# Pooled async client with a per-grid-cell TTL cache, single-flight misses and stale fallback
+WEATHER = WeatherClient(
+    base_url=os.getenv("WEATHER_API_URL", "https://api.openweathermap.org/data/3.0"),
+    api_key=os.getenv("WEATHER_API_KEY", "demo_key"),
+    ttl=float(os.getenv("WEATHER_CACHE_TTL_S", "600")),
+    stale_ttl=float(os.getenv("WEATHER_STALE_TTL_S", "21600")),
+    grid=float(os.getenv("WEATHER_GRID_DEG", "0.05")),
+    timeout=float(os.getenv("WEATHER_TIMEOUT_S", "10")),
+)
+
+
+@app.on_event("shutdown")
+async def _close_weather_client():
+    await WEATHER.aclose()
+
+
+async def _onecall(lat: float, lon: float, exclude: str = "minutely", response: Optional[Response] = None) -> dict:
+    """Cached One Call document with the `exclude`d sections removed ({"error": ...} if unavailable)."""
+    parts = {p.strip() for p in exclude.split(",") if p.strip()}
+    if WEATHER.api_key == "demo_key" or not (HTTPX_AVAILABLE or REQUESTS_AVAILABLE):
+        # Return comprehensive mock data
+        data, source = mock_onecall(lat, lon), "mock"
+    else:
+        try:
+            data, source = await WEATHER.onecall(lat, lon, with_minutely="minutely" not in parts)
+        except Exception as e:
+            # Caller falls back to mock data
+            print(f"Weather API error: {e}")
+            return {"error": f"Weather API unavailable: {str(e)}"}
+    if response is not None:
+        response.headers["X-Weather-Cache"] = source
+    return {k: v for k, v in data.items() if k not in parts}
+
+
 @app.get("/api/weather/onecall")
-def get_weather_onecall(lat: float = 20.2961, lon: float = 85.8245, exclude: str = "minutely"):
+async def get_weather_onecall(response: Response, lat: float = 20.2961, lon: float = 85.8245, exclude: str = "minutely"):
     """
     One Call API 3.0 - Get current weather, hourly, daily forecast, and alerts
     https://api.openweathermap.org/data/3.0/onecall
+    Served from a shared cache keyed by a WEATHER_GRID_DEG lat/lon cell (X-Weather-Cache reports hit/miss/coalesced/stale).
     """
-    api_key = os.getenv("WEATHER_API_KEY", "demo_key")
-    
-    if api_key == "demo_key" or not REQUESTS_AVAILABLE:
-        # Return comprehensive mock data
-        return {
-            "lat": lat,
-            "lon": lon,
-            "timezone": "Asia/Kolkata",
-            "timezone_offset": 19800,
-            "current": {
-                "dt": int(time.time()),
-                "temp": 28.5,
-                "feels_like": 30.2,
-                "pressure": 1008,
-                "humidity": 78,
-                "dew_point": 24.1,
-                "uvi": 0.5,
-                "clouds": 85,
-                "visibility": 8000,
-                "wind_speed": 4.5,
-                "wind_deg": 240,
-                "weather": [{"id": 501, "main": "Rain", "description": "heavy rain", "icon": "10d"}],
-                "rain": {"1h": 12.5}
-            },
-            "hourly": [
-                {
-                    "dt": int(time.time()) + i*3600,
-                    "temp": 28 - i*0.5,
-                    "feels_like": 29 - i*0.5,
-                    "pressure": 1008,
-                    "humidity": 75 + i,
-                    "wind_speed": 4 + i*0.3,
-                    "weather": [{"id": 501, "main": "Rain", "description": "moderate rain", "icon": "10d"}],
-                    "pop": 0.8 - i*0.05
-                } for i in range(8)
-            ],
-            "daily": [
-                {"dt": int(time.time()) + i*86400, "temp": {"day": 30-i, "min": 24, "max": 32-i, "night": 26, "eve": 28, "morn": 25},
-                 "feels_like": {"day": 32, "night": 27, "eve": 29, "morn": 26},
-                 "pressure": 1008, "humidity": 78, "wind_speed": 4.5, "wind_deg": 240, "clouds": 85,
-                 "pop": 0.9 - i*0.1, "rain": 95 - i*10, "uvi": 5.2,
-                 "weather": [{"id": 501, "main": "Rain", "description": "heavy rain", "icon": "10d"}],
-                 "summary": "Heavy rain expected with flood risk"
-                } for i in range(7)
-            ],
-            "alerts": [
-                {
-                    "sender_name": "India Meteorological Department (IMD)",
-                    "event": "Heavy Rainfall Warning",
-                    "start": int(time.time()),
-                    "end": int(time.time()) + 172800,
-                    "description": "Heavy to very heavy rainfall expected in coastal Odisha. Flood risk HIGH. Farmers advised to harvest ready crops immediately and prepare drainage systems.",
-                    "tags": ["Flood", "Rain"]
-                }
-            ]
-        }
-    
-    try:
-        # Use One Call API 3.0 endpoint
-        url = "https://api.openweathermap.org/data/3.0/onecall"
-        params = {
-            "lat": lat,
-            "lon": lon,
-            "appid": api_key,
-            "units": "metric",
-            "exclude": exclude
-        }
-        res = requests.get(url, params=params, timeout=10)
-        res.raise_for_status()
-        return res.json()
-    except Exception as e:
-        # Fallback to mock data if API fails
-        print(f"Weather API error: {e}")
-        return {"error": f"Weather API unavailable: {str(e)}"}
+    return await _onecall(lat, lon, exclude, response)
+
+
+@app.get("/api/weather/stats")
+def weather_stats():
+    return WEATHER.stats()
 
 @app.get("/api/weather/current")
-def get_current_weather(lat: float = 20.2961, lon: float = 85.8245):
+async def get_current_weather(response: Response, lat: float = 20.2961, lon: float = 85.8245):
     """Get current weather - simplified endpoint"""
-    onecall = get_weather_onecall(lat, lon, exclude="minutely,hourly,daily,alerts")
+    onecall = await _onecall(lat, lon, "minutely,hourly,daily,alerts", response)
     
     if "error" in onecall or "current" not in onecall:
         # Return mock data
@@ -263,9 +275,9 @@ def get_current_weather(lat: float = 20.2961, lon: float = 85.8245):
     }
 
 @app.get("/api/weather/forecast")
-def get_weather_forecast(lat: float = 20.2961, lon: float = 85.8245):
+async def get_weather_forecast(response: Response, lat: float = 20.2961, lon: float = 85.8245):
     """Get 7-day forecast"""
-    onecall = get_weather_onecall(lat, lon, exclude="minutely,current,hourly,alerts")
+    onecall = await _onecall(lat, lon, "minutely,current,hourly,alerts", response)
     
     if "error" in onecall or "daily" not in onecall:
         # Return mock 7-day forecast
@@ -299,9 +311,9 @@ def get_weather_forecast(lat: float = 20.2961, lon: float = 85.8245):
     return {"daily": daily_data}
 
 @app.get("/api/weather/alerts")
-def get_weather_alerts(lat: float = 20.2961, lon: float = 85.8245):
+async def get_weather_alerts(response: Response, lat: float = 20.2961, lon: float = 85.8245):
     """Get weather alerts for location"""
-    onecall = get_weather_onecall(lat, lon, exclude="minutely,current,hourly,daily")
+    onecall = await _onecall(lat, lon, "minutely,current,hourly,daily", response)
     
     if "error" in onecall or "alerts" not in onecall:
         # Return mock alert
@@ -323,25 +335,95 @@ def get_weather_alerts(lat: float = 20.2961, lon: float = 85.8245):
 # ============= EXISTING ENDPOINTS =============
 
 @app.get("/api/farms")
-def farms():
-    return GEOJSON
+def farms(request: Request, south: Optional[float] = None, west: Optional[float] = None,
+          north: Optional[float] = None, east: Optional[float] = None,
+          zoom: Optional[float] = Query(None, ge=0, le=30),
+          precision: Optional[int] = Query(None, ge=0, le=MAX_PRECISION),
+          limit: Optional[int] = Query(None, ge=1, le=int(os.getenv("FARMS_PAGE_MAX", "50000"))),
+          cursor: Optional[str] = None, format: Optional[str] = None):
+    """Field polygons, optionally limited to a [south, west, north, east] box and paged.
+
+    Served from pre-serialized bytes (see farms.py). `zoom` picks a coordinate
+    precision for that map zoom, `precision` sets it directly. format=ndjson (or
+    Accept: application/x-ndjson) streams one feature per line. The next page's
+    cursor is in the body (geojson) and in X-Next-Cursor.
+    """
+    box = (south, west, north, east)
+    if any(v is None for v in box) and any(v is not None for v in box):
+        raise HTTPException(status_code=400, detail="Pass all of south, west, north, east or none of them")
+    if south is not None and (south > north or west > east):
+        raise HTTPException(status_code=400, detail="Expected south <= north and west <= east")
+    try:
+        fmt = negotiate_farms(request.headers.get("accept"), format)
+        after = decode_farm_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if precision is None and zoom is not None:
+        precision = precision_for_zoom(zoom)
+    index = RESOURCES.get("farms")
+    headers = {"Cache-Control": "public, no-cache", "Vary": "Accept"}
+    idx, next_after = index.select((west, south, east, north) if south is not None else None, after, limit)
+    headers["ETag"] = etag = index.etag(idx, precision, fmt, next_after)
+    next_cursor = encode_farm_cursor(next_after) if next_after is not None else None
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+    if etag in (request.headers.get("if-none-match") or ""):
+        return Response(status_code=304, headers=headers)
+    features = index.features(idx, precision)
+    if fmt == "ndjson":
+        return StreamingResponse(FarmIndex.ndjson(features), media_type="application/x-ndjson", headers=headers)
+    body = FarmIndex.feature_collection(features, {"count": len(features), "next_cursor": next_cursor})
+    return StreamingResponse(body, media_type="application/geo+json", headers=headers)
+
+@app.get("/api/farms/stats")
+def farms_stats():
+    return RESOURCES.get("farms").stats()
+
+@app.get("/api/farms/intersecting")
+def farms_intersecting(south: float, west: float, north: float, east: float):
+    """Fields whose polygon intersects a tile/box given as [south, west, north, east]."""
+    if south > north or west > east:
+        raise HTTPException(status_code=400, detail="Expected south <= north and west <= east")
+    field_ids = field_registry().fields_in_tile(south, west, north, east)
+    return {"bounds": [south, west, north, east], "count": len(field_ids), "field_ids": field_ids}
+
+# NDVI scenes for triage (see ndvi.py for the layout under NDVI_DIR)
+NDVI_ENGINE = NdviEngine(
+    os.getenv("NDVI_DIR") or os.path.join(PROJECT_ROOT, "data", "ndvi"),
+    block=int(os.getenv("NDVI_BLOCK", "1024")),
+    bins=int(os.getenv("NDVI_HIST_BINS", "100")),
+    label_cache_dir=os.getenv("NDVI_LABEL_CACHE_DIR") or None,
+)
 
 class TriageInput(BaseModel):
     sat_source: str
     date: str
     ndvi_threshold: float
+    min_pixels: int = 1
+    limit: Optional[int] = None
 
 @app.post("/api/triage/run")
 def run_triage(inp: TriageInput):
-    hotspots = []
-    for feat in GEOJSON["features"]:
-        ndvi = round(random.uniform(0.1, 0.8), 2)
-        if ndvi < inp.ndvi_threshold:
-            hotspots.append({
-                "field_id": feat["properties"]["field_id"],
-                "ndvi": ndvi
-            })
-    return {"hotspots": hotspots}
+    """Rank fields whose mean NDVI on `date` is below `ndvi_threshold` (zonal stats over the scene)."""
+    scene = NDVI_ENGINE.scene(inp.sat_source, inp.date)
+    if scene is None:
+        raise HTTPException(status_code=404, detail=f"No NDVI scene for {inp.sat_source} on {inp.date}")
+    reg = field_registry()
+    try:
+        stats = NDVI_ENGINE.stats(reg, scene)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    hotspots, total = rank_hotspots(reg.ids, stats, inp.ndvi_threshold, inp.min_pixels, inp.limit)
+    return {
+        "sat_source": inp.sat_source,
+        "date": inp.date,
+        "bands": sorted(scene),
+        "fields_scored": int((stats["count"] >= max(1, inp.min_pixels)).sum()),
+        "fields_total": len(reg),
+        "hotspot_count": total,
+        "hotspots": hotspots,
+        "elapsed_s": stats["meta"].get("elapsed_s"),
+    }
 
 class ModelInput(BaseModel):
     field_id: str
@@ -349,134 +431,414 @@ class ModelInput(BaseModel):
     avg_temp_c: float
     rainfall_mm: float
 
+# Model runs, claims and audit hashes persist in SQLite (WAL, group-committed writes; see store.py)
+STORE = Store(
+    os.getenv("STORE_PATH") or os.path.join(PROJECT_ROOT, "data", "vani.db"),
+    batch_max=int(os.getenv("STORE_BATCH_MAX", "512")),
+    batch_wait_ms=float(os.getenv("STORE_BATCH_WAIT_MS", "0")),
+    checkpoint_every=int(os.getenv("AUDIT_CHECKPOINT_EVERY", "1024")),
+)
+
+
+def _record_hash(record: dict, exclude=("audit_hash",)) -> str:
+    """SHA-256 of a record's canonical JSON; this is what its audit entry commits to."""
+    body = {k: v for k, v in record.items() if k not in exclude}
+    return hashlib.sha256(json.dumps(body, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+
 @app.post("/api/model/run")
 def run_model(inp: ModelInput):
     # ORYZA-stub math
     yield_est = inp.ndvi_mean * 60  
     ci = yield_est * 0.12
-    return {
+    run = {
+        "model_run_id": new_id("MR"),
         "field_id": inp.field_id,
+        "created_at": time.time(),
+        "ndvi_mean": inp.ndvi_mean,
+        "avg_temp_c": inp.avg_temp_c,
+        "rainfall_mm": inp.rainfall_mm,
         "yield_est_q_ha": round(yield_est, 2),
         "ci_low": round(yield_est - ci, 2),
         "ci_high": round(yield_est + ci, 2),
-        "model_run_id": f"MR{int(time.time())}"
+    }
+    STORE.write([("model_runs", run),
+                 ("audit", {"created_at": run["created_at"], "entity": "model_run",
+                            "entity_id": run["model_run_id"], "hash": _record_hash(run)})])
+    return {
+        "field_id": inp.field_id,
+        "yield_est_q_ha": run["yield_est_q_ha"],
+        "ci_low": run["ci_low"],
+        "ci_high": run["ci_high"],
+        "model_run_id": run["model_run_id"]
     }
 
 @app.post("/api/claim/create")
-def create_claim(model_run_id: str, field_id: str):
-    claim_id = f"C{int(time.time())}"
-    data = f"{model_run_id}-{field_id}"
-    audit_hash = hashlib.sha256(data.encode()).hexdigest()
-    return {"claim_id": claim_id, "audit_hash": audit_hash}
+def create_claim(model_run_id: str, field_id: str, flooded_pct: Optional[float] = None,
+                 confidence: Optional[float] = None, payout_amount: Optional[float] = None):
+    run = STORE.get("model_runs", model_run_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail=f"Model run {model_run_id} not found")
+    if run["field_id"] != field_id:
+        raise HTTPException(status_code=400, detail=f"Model run {model_run_id} is for field {run['field_id']}")
+    claim = {"claim_id": new_id("C"), "model_run_id": model_run_id, "field_id": field_id,
+             "created_at": time.time(), "status": "Submitted", "flooded_pct": flooded_pct,
+             "confidence": confidence, "payout_amount": payout_amount}
+    # The claim's hash covers the whole record; its audit entry chains it into the log
+    claim["audit_hash"] = _record_hash(claim)
+    [(seq, entry)] = STORE.write([("claims", claim),
+                                  ("audit", {"created_at": claim["created_at"], "entity": "claim",
+                                             "entity_id": claim["claim_id"], "hash": claim["audit_hash"]})])
+    return {"claim_id": claim["claim_id"], "audit_hash": claim["audit_hash"], "audit_seq": seq, "entry_hash": entry}
 
-@app.get("/api/claim/{claim_id}/pdf")
-def generate_claim_pdf(claim_id: str):
-    """Generate PDF claim report"""
-    if not PDF_AVAILABLE:
-        raise HTTPException(status_code=500, detail="PDF generation unavailable (install reportlab)")
-    
-    # Mock claim data (in production, fetch from database)
-    claim_data = {
+
+def _epoch(value: Optional[str], end: bool = False) -> Optional[float]:
+    """YYYY-MM-DD or ISO datetime to epoch seconds; a bare date as `end` means the end of that day."""
+    if not value:
+        return None
+    try:
+        dt = datetime.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid date {value!r}, expected YYYY-MM-DD or ISO 8601")
+    if end and len(value) == 10:
+        dt += timedelta(days=1)
+    return dt.timestamp()
+
+
+def _page(table: str, where: dict, date_from: Optional[str], date_to: Optional[str], limit: int,
+          cursor: Optional[str]) -> dict:
+    try:
+        return STORE.page(table, where, since=_epoch(date_from), until=_epoch(date_to, end=True),
+                          limit=limit, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/api/claims")
+def list_claims(field_id: Optional[str] = None, status: Optional[str] = None, model_run_id: Optional[str] = None,
+                date_from: Optional[str] = None, date_to: Optional[str] = None,
+                limit: int = Query(50, ge=1, le=500), cursor: Optional[str] = None):
+    """Claims newest first; pass `next_cursor` back as `cursor` for the next page."""
+    return _page("claims", {"field_id": field_id, "status": status, "model_run_id": model_run_id},
+                 date_from, date_to, limit, cursor)
+
+
+@app.get("/api/claims/{claim_id}")
+def get_claim(claim_id: str):
+    claim = STORE.get("claims", claim_id)
+    if claim is None:
+        raise HTTPException(status_code=404, detail=f"Claim {claim_id} not found")
+    return claim
+
+
+@app.get("/api/model/runs")
+def list_model_runs(field_id: Optional[str] = None, date_from: Optional[str] = None, date_to: Optional[str] = None,
+                    limit: int = Query(50, ge=1, le=500), cursor: Optional[str] = None):
+    return _page("model_runs", {"field_id": field_id}, date_from, date_to, limit, cursor)
+
+
+@app.get("/api/model/runs/{model_run_id}")
+def get_model_run(model_run_id: str):
+    run = STORE.get("model_runs", model_run_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail=f"Model run {model_run_id} not found")
+    return run
+
+
+@app.get("/api/audit")
+def list_audit(entity: Optional[str] = None, entity_id: Optional[str] = None, date_from: Optional[str] = None,
+               date_to: Optional[str] = None, limit: int = Query(50, ge=1, le=500), cursor: Optional[str] = None):
+    return _page("audit", {"entity": entity, "entity_id": entity_id}, date_from, date_to, limit, cursor)
+
+
+def _verify_record(entity: str, record: dict, tree_size: Optional[int]) -> dict:
+    entity_id = record["claim_id" if entity == "claim" else "model_run_id"]
+
+    def run(conn):
+        row = conn.execute("SELECT seq FROM audit WHERE entity = ? AND entity_id = ? ORDER BY seq LIMIT 1",
+                           (entity, entity_id)).fetchone()
+        if row is None:
+            raise HTTPException(status_code=404, detail=f"No audit entry for {entity} {entity_id}")
+        return audit.verify_entry(conn, row[0], _record_hash(record), tree_size)
+    try:
+        return STORE.read(run)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/api/claims/{claim_id}/verify")
+def verify_claim(claim_id: str, tree_size: Optional[int] = None):
+    """O(log N) tamper check: record hash, chain link, and inclusion proof against a checkpoint root.
+
+    Without tree_size the proof targets the first checkpoint covering the claim (or the current head).
+    """
+    return _verify_record("claim", get_claim(claim_id), tree_size)
+
+
+@app.get("/api/model/runs/{model_run_id}/verify")
+def verify_model_run(model_run_id: str, tree_size: Optional[int] = None):
+    return _verify_record("model_run", get_model_run(model_run_id), tree_size)
+
+
+@app.get("/api/audit/proof/{seq}")
+def audit_proof(seq: int, tree_size: Optional[int] = None):
+    """Inclusion proof for one entry, checkable offline with RFC 9162 against a trusted root."""
+    try:
+        return STORE.read(audit.prove, seq, tree_size)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/api/audit/checkpoints")
+def audit_checkpoints(limit: int = Query(50, ge=1, le=500)):
+    def run(conn):
+        rows = conn.execute("SELECT tree_size, root, chain_head, created_at FROM audit_checkpoints "
+                            "ORDER BY tree_size DESC LIMIT ?", (limit,)).fetchall()
+        return {"tree_size": audit.tree_size(conn), "checkpoint_every": STORE.checkpoint_every,
+                "checkpoints": [dict(r) for r in rows]}
+    return STORE.read(run)
+
+
+@app.post("/api/audit/checkpoint")
+def audit_checkpoint():
+    """Record the current tree head now (e.g. before handing a batch to an insurer)."""
+    cp = STORE.transact(audit.checkpoint)
+    if cp is None:
+        raise HTTPException(status_code=409, detail="Audit log is empty")
+    return cp
+
+
+@app.get("/api/audit/verify-chain")
+def audit_verify_chain(full: bool = False):
+    """Re-verify the chain from the latest checkpoint (or from genesis with full=1)."""
+    def run(conn):
+        start = 1
+        if not full:
+            row = conn.execute("SELECT MAX(tree_size) FROM audit_checkpoints").fetchone()
+            start = row[0] or 1
+        return {"from_seq": start, **audit.verify_chain(conn, start)}
+    return STORE.read(run)
+
+
+@app.get("/api/store/stats")
+def store_stats():
+    return STORE.stats()
+
+
+# Flood results per field: every segmentation that scores a field appends a row; the newest one per
+# field is what the vector tiles show
+def _record_floods(results, source: str, date: Optional[str] = None):
+    """Persist [(field_id, flooded_pct), ...] from one model run."""
+    now = time.time()
+    rows = [{"created_at": now, "field_id": str(f), "flooded_pct": p, "source": source, "date": date or None}
+            for f, p in results if p is not None]
+    STORE.insert_many("flood_results", rows)
+
+
+@app.get("/api/floods")
+def list_floods(field_id: Optional[str] = None, source: Optional[str] = None, date_from: Optional[str] = None,
+                date_to: Optional[str] = None, limit: int = Query(50, ge=1, le=500), cursor: Optional[str] = None):
+    return _page("flood_results", {"field_id": field_id, "source": source}, date_from, date_to, limit, cursor)
+
+
+def _load_field_tiles():
+    from .mvt import FieldTiles
+    return FieldTiles(field_registry(), GEOJSON_VERSION,
+                      max_bytes=int(os.getenv("MVT_CACHE_BYTES", str(64 * 1024 * 1024))),
+                      min_area=float(os.getenv("MVT_MIN_AREA", "64")))
+
+RESOURCES.register("field_tiles", _load_field_tiles)
+
+
+@app.get("/api/tiles/{z}/{x}/{y}.mvt")
+def field_vector_tile(z: int, x: int, y: int, request: Request):
+    """Mapbox Vector Tile (layer "fields": field_id, latest flooded_pct) built from the field registry."""
+    if not (0 <= z <= 22 and 0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise HTTPException(status_code=404, detail="Tile out of range")
+    tiles = RESOURCES.get("field_tiles")
+    tiles.sync(STORE.read)  # picks up flood results written by any worker and drops stale tiles
+    data, etag = tiles.tile(z, x, y)
+    headers = {"ETag": etag, "Cache-Control": "public, no-cache"}
+    if etag in (request.headers.get("if-none-match") or ""):
+        return Response(status_code=304, headers=headers)
+    return Response(data, media_type="application/vnd.mapbox-vector-tile", headers=headers)
+
+
+@app.get("/api/tiles/stats")
+def field_tile_stats():
+    return RESOURCES.get("field_tiles").stats()
+
+
+@app.delete("/api/tiles/cache")
+def invalidate_field_tiles():
+    return {"removed": RESOURCES.get("field_tiles").invalidate()}
+
+
+# U-Net outputs with known bounds are also written to an XYZ PNG pyramid (see pyramid.py)
+FLOOD_TILES_ENABLED = os.getenv("FLOOD_TILES_ENABLED", "1") == "1"
+FLOOD_TILES_MAX_AGE = int(os.getenv("FLOOD_TILES_MAX_AGE", "60"))
+FLOOD_PYRAMID = FloodPyramid(
+    os.getenv("FLOOD_TILES_DIR") or os.path.join(PROJECT_ROOT, "data", "flood_tiles"),
+    min_zoom=int(os.getenv("FLOOD_TILES_MIN_ZOOM", "6")),
+    max_zoom=int(os.getenv("FLOOD_TILES_MAX_ZOOM", "18")),
+    max_pending=int(os.getenv("FLOOD_TILES_QUEUE", "4")),
+)
+FLOOD_TILES_URL = "/api/tiles/flood/{kind}/{z}/{x}/{y}.png"
+
+
+@app.on_event("shutdown")
+def _flush_flood_tiles():
+    FLOOD_PYRAMID.close()
+
+
+@app.get("/api/tiles/flood/{kind}/{z}/{x}/{y}.png")
+def flood_tile(kind: str, z: int, x: int, y: int, request: Request):
+    """Flood probability (kind=prob) or mask (kind=mask) tile; fully transparent where nothing was segmented."""
+    if kind not in FLOOD_KINDS or not (0 <= z <= 22 and 0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise HTTPException(status_code=404, detail="Tile out of range")
+    data, etag = FLOOD_PYRAMID.tile(kind, z, x, y) or (empty_png(), '"empty"')
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={FLOOD_TILES_MAX_AGE}, stale-while-revalidate=600"}
+    if etag in (request.headers.get("if-none-match") or ""):
+        return Response(status_code=304, headers=headers)
+    return Response(data, media_type="image/png", headers=headers)
+
+
+@app.get("/api/tiles/flood/stats")
+def flood_tile_stats():
+    return {**FLOOD_PYRAMID.stats(), "enabled": FLOOD_TILES_ENABLED, "levels": FLOOD_PYRAMID.levels()}
+
+
+# Claim PDFs render in the background (see reports.py); finished PDFs are cached by claim-data hash
+REPORT_RENDERER = ReportRenderer(
+    PdfCache(max_bytes=int(os.getenv("REPORT_CACHE_BYTES", str(32 * 1024 * 1024))),
+             disk_dir=os.getenv("REPORT_CACHE_DIR") or None),
+    workers=int(os.getenv("REPORT_WORKERS") or min(4, os.cpu_count() or 1)),
+)
+REPORT_BULK_MAX = int(os.getenv("REPORT_BULK_MAX", "1000"))
+
+
+def _field_summary(field_id: str) -> dict:
+    """Owner, centroid and approximate area (ha) of a field from the registry."""
+    reg = field_registry()
+    feat, geom = reg.get(field_id), reg.geometry(field_id)
+    if feat is None or geom is None or geom.is_empty:
+        return {}
+    props = feat.get("properties", {})
+    c = geom.centroid
+    # Degrees to metres around the centroid, good enough for field-sized polygons
+    area_ha = geom.area * 111320.0 ** 2 * math.cos(math.radians(c.y)) / 10000.0
+    return {"farmer_name": props.get("owner"), "farmer_phone": props.get("phone"),
+            "location": f"{c.y:.4f}, {c.x:.4f}", "area_ha": round(area_ha, 2), "crop_type": props.get("crop")}
+
+
+def claim_data(claim_id: str) -> dict:
+    """Claim record shown in the PDF report, from the store plus the field registry."""
+    claim = STORE.get("claims", claim_id)
+    if claim is None:
+        raise HTTPException(status_code=404, detail=f"Claim {claim_id} not found")
+    field = _field_summary(claim["field_id"])
+    return {
         "claim_id": claim_id,
-        "field_id": "F-2301",
-        "farmer_name": "Ramesh Kumar",
-        "farmer_phone": "+91 98765 43210",
-        "location": "20.2961, 85.8245",
-        "area_ha": 3.2,
-        "crop_type": "Rice (Paddy)",
-        "flooded_pct": 42.5,
-        "confidence": 93.8,
-        "evidence_hash": hashlib.sha256(claim_id.encode()).hexdigest(),
-        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        "status": "Verified",
-        "payout_amount": 85000
+        "field_id": claim["field_id"],
+        "model_run_id": claim["model_run_id"],
+        "farmer_name": field.get("farmer_name"),
+        "farmer_phone": field.get("farmer_phone"),
+        "location": field.get("location"),
+        "area_ha": field.get("area_ha"),
+        "crop_type": field.get("crop_type") or "Rice (Paddy)",
+        "flooded_pct": claim["flooded_pct"],
+        "confidence": claim["confidence"],
+        "evidence_hash": claim["audit_hash"],
+        "timestamp": datetime.fromtimestamp(claim["created_at"]).strftime("%Y-%m-%d %H:%M:%S"),
+        "status": claim["status"],
+        "payout_amount": claim["payout_amount"]
     }
-    
-    # Create PDF in memory
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4)
-    story = []
-    styles = getSampleStyleSheet()
-    
-    # Title
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=24,
-        textColor=colors.HexColor('#10b981'),
-        spaceAfter=30,
-        alignment=1
-    )
-    story.append(Paragraph("YES-Scan Apex", title_style))
-    story.append(Paragraph("Flood Insurance Claim Report", styles['Heading2']))
-    story.append(Spacer(1, 0.5*inch))
-    
-    # Claim details table
-    data = [
-        ['Claim Information', ''],
-        ['Claim ID:', claim_data['claim_id']],
-        ['Field ID:', claim_data['field_id']],
-        ['Status:', claim_data['status']],
-        ['Timestamp:', claim_data['timestamp']],
-        ['', ''],
-        ['Farmer Information', ''],
-        ['Name:', claim_data['farmer_name']],
-        ['Phone:', claim_data['farmer_phone']],
-        ['Location:', claim_data['location']],
-        ['Farm Area:', f"{claim_data['area_ha']} hectares"],
-        ['Crop Type:', claim_data['crop_type']],
-        ['', ''],
-        ['Assessment Results', ''],
-        ['Flood Affected Area:', f"{claim_data['flooded_pct']}%"],
-        ['Model Confidence:', f"{claim_data['confidence']}%"],
-        ['Evidence Hash (SHA-256):', claim_data['evidence_hash'][:32] + '...'],
-        ['', ''],
-        ['Claim Settlement', ''],
-        ['Approved Payout:', f"₹{claim_data['payout_amount']:,}"],
-    ]
-    
-    table = Table(data, colWidths=[2.5*inch, 4*inch])
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#10b981')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 12),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 6), (-1, 6), colors.HexColor('#10b981')),
-        ('TEXTCOLOR', (0, 6), (-1, 6), colors.whitesmoke),
-        ('BACKGROUND', (0, 13), (-1, 13), colors.HexColor('#10b981')),
-        ('TEXTCOLOR', (0, 13), (-1, 13), colors.whitesmoke),
-        ('BACKGROUND', (0, 18), (-1, 18), colors.HexColor('#10b981')),
-        ('TEXTCOLOR', (0, 18), (-1, 18), colors.whitesmoke),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-        ('FONTNAME', (0, 1), (0, -1), 'Helvetica-Bold'),
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-    ]))
-    
-    story.append(table)
-    story.append(Spacer(1, 0.5*inch))
-    
-    # Footer
-    footer = Paragraph(
-        "<i>This report is generated by YES-Scan Apex AI system and verified by field officers. "
-        "For queries, contact support@yesscan.in</i>",
-        styles['Normal']
-    )
-    story.append(footer)
-    
-    doc.build(story)
-    buffer.seek(0)
-    
+
+
+def _require_pdf():
+    if not PDF_AVAILABLE:
+        raise HTTPException(status_code=500, detail="PDF generation unavailable (install reportlab)")
+
+
+@app.on_event("shutdown")
+def _close_report_pool():
+    REPORT_RENDERER.close()
+
+
+@app.get("/api/claim/{claim_id}/pdf")
+async def generate_claim_pdf(claim_id: str):
+    """Generate PDF claim report (base64 in JSON; see /pdf/download for the raw file)"""
+    _require_pdf()
+    key, pdf = await REPORT_RENDERER.render(claim_data(claim_id))
     # Return as base64 for frontend download
-    pdf_b64 = base64.b64encode(buffer.read()).decode()
+    pdf_b64 = base64.b64encode(pdf_bytes(pdf)).decode()
     return {
         "claim_id": claim_id,
         "pdf_base64": pdf_b64,
-        "filename": f"claim_{claim_id}.pdf"
+        "filename": f"claim_{claim_id}.pdf",
+        "report_key": key
     }
 
 
+@app.post("/api/claim/{claim_id}/pdf/render", status_code=202)
+def queue_claim_pdf(claim_id: str):
+    """Start rendering in the background; poll or download from `download_url`."""
+    _require_pdf()
+    key, _ = REPORT_RENDERER.submit(claim_data(claim_id))
+    return {"claim_id": claim_id, "report_key": key, "status": REPORT_RENDERER.status(key),
+            "download_url": f"/api/claim/{claim_id}/pdf/download"}
+
+
+@app.get("/api/claim/{claim_id}/pdf/status")
+def claim_pdf_status(claim_id: str):
+    key = claim_key(claim_data(claim_id))
+    return {"claim_id": claim_id, "report_key": key, "status": REPORT_RENDERER.status(key)}
+
+
+@app.get("/api/claim/{claim_id}/pdf/download")
+async def download_claim_pdf(claim_id: str, request: Request):
+    """The claim PDF as a streamed application/pdf body (rendered now if not cached).
+
+    The ETag is the claim-data hash, so If-None-Match answers 304 without rendering.
+    """
+    _require_pdf()
+    claim = claim_data(claim_id)
+    etag = f'"{claim_key(claim)}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache",
+               "Content-Disposition": f'attachment; filename="claim_{claim_id}.pdf"'}
+    if etag in (request.headers.get("if-none-match") or ""):
+        return Response(status_code=304, headers=headers)
+    _, pdf = await REPORT_RENDERER.render(claim)
+    size = os.path.getsize(pdf) if isinstance(pdf, str) else len(pdf)
+    return StreamingResponse(iter_pdf(pdf), media_type="application/pdf",
+                             headers={**headers, "Content-Length": str(size)})
+
+
+class BulkPdfInput(BaseModel):
+    claim_ids: List[str]
+
+
+@app.post("/api/claims/pdf/bulk")
+def bulk_claim_pdfs(inp: BulkPdfInput):
+    """Render many claims in parallel and stream them back as one zip (plus manifest.json)."""
+    _require_pdf()
+    claim_ids = list(dict.fromkeys(inp.claim_ids))
+    if not claim_ids:
+        raise HTTPException(status_code=400, detail="claim_ids is empty")
+    if len(claim_ids) > REPORT_BULK_MAX:
+        raise HTTPException(status_code=413, detail=f"At most {REPORT_BULK_MAX} claims per bulk request")
+    name = f"claims_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
+    return StreamingResponse(zip_reports(REPORT_RENDERER, [claim_data(c) for c in claim_ids]),
+                             media_type="application/zip",
+                             headers={"Content-Disposition": f'attachment; filename="{name}"'})
+
+
+@app.get("/api/claims/pdf/stats")
+def claim_pdf_stats():
+    return REPORT_RENDERER.stats()
+
 
 # ----------------------
 # DL: FT-Transformer serving
@@ -487,62 +849,100 @@ MODELS_DIR = os.path.join(PROJECT_ROOT, "models")
 FT_MODEL_PATH = os.path.join(MODELS_DIR, "best_tabtransformer.pt")
 FT_SCALER_PATH = os.path.join(MODELS_DIR, "tab_scaler.joblib")
 FT_META_PATH = os.path.join(MODELS_DIR, "tab_meta.json")
+# auto | onnx | torchscript | eager (artifacts from export_models.py; see backends.py)
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "auto").strip().lower()
+# Post-training int8 (see quant.py): none | dynamic (FT-Transformer) | static (+ U-Net, calibrated on processed tiles)
+INFERENCE_QUANT = os.getenv("INFERENCE_QUANT", "none").strip().lower()
+QUANT_CALIB_TILES = int(os.getenv("QUANT_CALIB_TILES", "32"))
+if INFERENCE_QUANT not in QUANT_MODES:
+    raise RuntimeError(f"INFERENCE_QUANT must be one of {', '.join(QUANT_MODES)}")
 
-ft_loaded = False
-soil_vocab: List[str] = []
-cont_cols: List[str] = []
-cat_col: str = "soil_type"
-ft_model = None
-ft_scaler = None
-
-if TORCH_AVAILABLE and os.path.exists(FT_MODEL_PATH) and os.path.exists(FT_SCALER_PATH) and os.path.exists(FT_META_PATH) and joblib is not None:
-    # Define minimal model to load weights (must match training definition)
-    class FeatureTokenizer(nn.Module):
-        def __init__(self, n_cont, d_model):
-            super().__init__()
-            self.linears = nn.ModuleList([nn.Linear(1, d_model) for _ in range(n_cont)])
-        def forward(self, x):
-            tokens = []
-            for j, lin in enumerate(self.linears):
-                tok = lin(x[:, j:j+1])
-                tokens.append(tok)
-            return torch.stack(tokens, dim=1)
-
-    class FTTransformer(nn.Module):
-        def __init__(self, n_cont, n_cat, d_model=64, nhead=4, nlayers=2, dropout=0.1):
-            super().__init__()
-            self.cls = nn.Parameter(torch.randn(1,1,d_model))
-            self.cont_tok = FeatureTokenizer(n_cont, d_model)
-            self.cat_emb = nn.Embedding(n_cat, d_model)
-            enc_layer = nn.TransformerEncoderLayer(d_model=d_model, nhead=nhead, dim_feedforward=256, dropout=dropout, batch_first=True)
-            self.encoder = nn.TransformerEncoder(enc_layer, num_layers=nlayers)
-            self.head = nn.Sequential(nn.LayerNorm(d_model), nn.Linear(d_model, 1))
-        def forward(self, x_cont, x_cat):
-            B = x_cont.size(0)
-            cont_tokens = self.cont_tok(x_cont)
-            cat_token = self.cat_emb(x_cat).unsqueeze(1)
-            tokens = torch.cat([cont_tokens, cat_token], dim=1)
-            cls = self.cls.expand(B, -1, -1)
-            seq = torch.cat([cls, tokens], dim=1)
-            enc = self.encoder(seq)
-            cls_out = enc[:,0,:]
-            return self.head(cls_out)
 
-    try:
-        with open(FT_META_PATH, "r") as f:
-            meta = json.load(f)
-        cont_cols = meta.get("cont_cols") or meta.get("features") or []
-        cat_col = meta.get("cat_col", "soil_type")
-        soil_vocab = meta.get("soil_vocab", ["loam","clay","sandy"])
-        n_cont = len(cont_cols)
-        n_cat = len(soil_vocab)
-        ft_model = FTTransformer(n_cont, n_cat)
-        ft_model.load_state_dict(torch.load(FT_MODEL_PATH, map_location="cpu"))
-        ft_model.eval()
-        ft_scaler = joblib.load(FT_SCALER_PATH)
-        ft_loaded = True
-    except Exception as e:
-        ft_loaded = False
+
+def _load_ft():
+    """FT-Transformer runner with its scaler and feature metadata, or None if artifacts/runtime are missing."""
+    if not (_has_module("joblib") and os.path.exists(FT_MODEL_PATH)
+            and os.path.exists(FT_SCALER_PATH) and os.path.exists(FT_META_PATH)):
+        return None
+    import joblib
+    with open(FT_META_PATH, "r") as f:
+        meta = json.load(f)
+    cont_cols = meta.get("cont_cols") or meta.get("features") or []
+    soil_vocab = meta.get("soil_vocab", ["loam","clay","sandy"])
+
+    def build():
+        import torch
+        from .nets import FTTransformer
+        model = FTTransformer(len(cont_cols), len(soil_vocab))
+        model.load_state_dict(torch.load(FT_MODEL_PATH, map_location="cpu"))
+        return model.eval()
+
+    quantize = quantize_ft_dynamic if INFERENCE_QUANT != "none" else None
+    runner = load_runner(FT_MODEL_PATH, build, INFERENCE_BACKEND, quantize=quantize, threads=INFERENCE_TORCH_THREADS)
+    if runner is None:
+        return None
+    backend, forward = runner
+    return SimpleNamespace(forward=forward, backend=backend, scaler=joblib.load(FT_SCALER_PATH),
+                           cont_cols=cont_cols, cat_col=meta.get("cat_col", "soil_type"), soil_vocab=soil_vocab)
+
+RESOURCES.register("ft_transformer", _load_ft)
+
+# Micro-batching: concurrent requests are queued for up to BATCH_MAX_WAIT_MS and
+# share one forward pass (up to *_BATCH_MAX items per pass)
+BATCHING_ENABLED = os.getenv("BATCHING_ENABLED", "1") != "0"
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "5"))
+FT_BATCH_MAX = int(os.getenv("FT_BATCH_MAX", "64"))
+UNET_BATCH_MAX = int(os.getenv("UNET_BATCH_MAX", "8"))
+
+# Model endpoints run on INFERENCE_WORKERS dedicated threads (not Starlette's shared pool); every
+# thread running model code uses INFERENCE_TORCH_THREADS intra-op threads. Size workers x threads
+# to the core count (default: 4 threads per worker). Requests beyond INFERENCE_QUEUE waiting get 429.
+_CPUS = os.cpu_count() or 1
+INFERENCE_TORCH_THREADS = int(os.getenv("INFERENCE_TORCH_THREADS", str(min(4, _CPUS))))
+INFERENCE_INTEROP_THREADS = int(os.getenv("INFERENCE_INTEROP_THREADS", "1"))
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS") or max(1, _CPUS // max(1, INFERENCE_TORCH_THREADS)))
+INFERENCE_QUEUE = int(os.getenv("INFERENCE_QUEUE") or 4 * INFERENCE_WORKERS)
+# Requests that only wait on a micro-batcher (dl-run, unet demo, by-field) hold no worker; they are capped separately
+INFERENCE_BATCH_QUEUE = int(os.getenv("INFERENCE_BATCH_QUEUE") or 4 * max(FT_BATCH_MAX, UNET_BATCH_MAX))
+INFERENCE_POOL = InferenceExecutor(INFERENCE_WORKERS, INFERENCE_QUEUE, INFERENCE_TORCH_THREADS, INFERENCE_INTEROP_THREADS,
+                                   max_batched=INFERENCE_BATCH_QUEUE)
+
+
+@app.exception_handler(Overloaded)
+async def _overloaded(request: Request, exc: Overloaded):
+    return JSONResponse(status_code=429, headers={"Retry-After": str(exc.retry_after)},
+                        content={"status": "error", "message": "Inference queue is full, retry later."})
+
+
+async def _resource(name: str):
+    """RESOURCES.get for async handlers: a first-use load runs off the event loop."""
+    if RESOURCES.loaded(name):
+        return RESOURCES.get(name)
+    return await run_in_threadpool(RESOURCES.get, name)
+
+
+async def _batched(batcher: MicroBatcher, item):
+    """Await one micro-batched forward pass. With batching off the forward runs (admitted) on the inference pool."""
+    if batcher.enabled:
+        return await asyncio.wrap_future(batcher.submit(item))
+    return await INFERENCE_POOL.run(lambda: batcher.submit(item).result())
+
+
+def ft_predict(x_cont_s: np.ndarray, soil_idx: np.ndarray) -> np.ndarray:
+    """One FT-Transformer forward pass over already-scaled rows."""
+    forward = RESOURCES.get("ft_transformer").forward
+    return forward(np.asarray(x_cont_s, dtype=np.float32), np.asarray(soil_idx, dtype=np.int64))[:, 0]
+
+
+def _ft_batch(items):
+    """items: [(scaled continuous row, soil index)] -> [yield]"""
+    x_cont = np.stack([xc for xc, _ in items])
+    x_cat = np.array([si for _, si in items], dtype=np.int64)
+    return [float(p) for p in ft_predict(x_cont, x_cat)]
+
+FT_BATCHER = MicroBatcher("ft_transformer", with_thread_limits(_ft_batch, INFERENCE_TORCH_THREADS, INFERENCE_INTEROP_THREADS),
+                          max_batch=FT_BATCH_MAX,
+                          max_wait_ms=BATCH_MAX_WAIT_MS, enabled=BATCHING_ENABLED)
 
 
 class DLInput(BaseModel):
@@ -563,10 +963,12 @@ class DLInput(BaseModel):
 
 
 @app.post("/api/model/dl-run")
-def dl_run(inp: DLInput):
-    if not TORCH_AVAILABLE:
+@INFERENCE_POOL.batched_endpoint
+async def dl_run(inp: DLInput):
+    if not (TORCH_AVAILABLE or ORT_AVAILABLE):
         return {"status":"error","message":"PyTorch not available in backend environment."}
-    if not ft_loaded:
+    ft = await _resource("ft_transformer")
+    if ft is None:
         return {"status":"error","message":"DL model artifacts not found or failed to load. Train notebook to generate models."}
     # Build input vector in cont_cols order
     sample = {
@@ -583,80 +985,274 @@ def dl_run(inp: DLInput):
         "prior_yield_qha": inp.prior_yield_qha,
         "sowing_doy": inp.sowing_doy,
     }
-    x_cont = np.array([[sample.get(k, 0.0) for k in cont_cols]], dtype=np.float32)
-    x_cont_s = ft_scaler.transform(x_cont)
-    soil_idx = soil_vocab.index(inp.soil_type) if inp.soil_type in soil_vocab else 0
-    with torch.no_grad():
-        xc = torch.tensor(x_cont_s, dtype=torch.float32)
-        xcat = torch.tensor([soil_idx], dtype=torch.int64)
-        pred = ft_model(xc, xcat).squeeze(1).cpu().numpy()[0].item()
-    return {"yield_est_q_ha": round(float(pred), 2), "model": "FT-Transformer", "soil_vocab": soil_vocab}
+    x_cont = np.array([[sample.get(k, 0.0) for k in ft.cont_cols]], dtype=np.float32)
+    x_cont_s = ft.scaler.transform(x_cont)
+    soil_idx = ft.soil_vocab.index(inp.soil_type) if inp.soil_type in ft.soil_vocab else 0
+    pred = await _batched(FT_BATCHER, (x_cont_s[0], soil_idx))
+    return {"yield_est_q_ha": round(float(pred), 2), "model": "FT-Transformer", "soil_vocab": ft.soil_vocab}
+
+
+FT_BULK_CHUNK = int(os.getenv("FT_BULK_CHUNK", "4096"))
+
+
+@app.post("/api/model/dl-run/batch")
+async def dl_run_batch(
+    request: Request,
+    input_format: Optional[str] = None,  # overrides Content-Type: csv, parquet, arrow, ndjson
+    output_format: str = "ndjson",  # ndjson | csv
+    chunk_size: int = FT_BULK_CHUNK,
+):
+    """Score many fields in one call.
+    Body is a table with the `cont_cols` columns plus `soil_type` (and optionally `field_id`).
+    Missing values fall back to the DLInput defaults. Results stream back in input order.
+    """
+    if not (TORCH_AVAILABLE or ORT_AVAILABLE):
+        return {"status":"error","message":"PyTorch not available in backend environment."}
+    ft = RESOURCES.get("ft_transformer")
+    if ft is None:
+        return {"status":"error","message":"DL model artifacts not found or failed to load. Train notebook to generate models."}
+    fmt = detect_format(request.headers.get("content-type"), input_format)
+    if fmt is None:
+        raise HTTPException(status_code=415, detail="Send text/csv, application/vnd.apache.parquet, application/vnd.apache.arrow.stream or application/x-ndjson")
+    if output_format not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="output_format must be 'ndjson' or 'csv'")
+    body = await request.body()
+    # One admission for the whole request: parsing and every streamed chunk run under this slot,
+    # so concurrent bulk streams are back-pressured like any other inference request
+    release = INFERENCE_POOL.slot()
+
+    def parse():
+        df = read_table(body, fmt)
+        defaults = {k: f.default for k, f in DLInput.model_fields.items()}
+        x_cont, soil_idx = prepare_features(df, ft.cont_cols, defaults, ft.soil_vocab, ft.cat_col)
+        id_col = next((c for c in ("field_id", "id") if c in df.columns), None)
+        ids = df[id_col].astype(str).tolist() if id_col else None
+        return x_cont, soil_idx, ids
+
+    try:
+        x_cont, soil_idx, ids = await INFERENCE_POOL.run(parse, admit=False)
+    except ImportError as e:
+        release()
+        raise HTTPException(status_code=415, detail=f"{fmt} input requires pyarrow: {e}")
+    except Exception as e:
+        release()
+        raise HTTPException(status_code=400, detail=f"Could not parse {fmt} body: {e}")
+    n = len(x_cont)
+    chunk = max(1, int(chunk_size))
+
+    def score(start, stop):
+        return ft_predict(ft.scaler.transform(x_cont[start:stop]), soil_idx[start:stop])
+
+    async def stream():
+        try:
+            async for part in chunks():
+                yield part
+        finally:
+            release()
+
+    async def chunks():
+        if output_format == "csv":
+            yield b"row,field_id,yield_est_q_ha\n"
+        for start in range(0, n, chunk):
+            stop = min(start + chunk, n)
+            # Runs under the request's slot: queues on the pool instead of being rejected mid-stream
+            pred = await INFERENCE_POOL.run(score, start, stop, admit=False)
+            if output_format == "csv":
+                # csv.writer quotes field ids containing commas, quotes or newlines
+                buf = io.StringIO()
+                w = csv.writer(buf, lineterminator="\n")
+                w.writerows((i, (ids[i] if ids else None) or "", round(float(p), 2))
+                            for i, p in zip(range(start, stop), pred))
+                yield buf.getvalue().encode("utf-8")
+                continue
+            out = []
+            for i, p in zip(range(start, stop), pred):
+                fid = ids[i] if ids else None
+                out.append(json.dumps({"row": i, "field_id": fid, "yield_est_q_ha": round(float(p), 2)}) + "\n")
+            yield "".join(out).encode("utf-8")
+
+    media_type = "text/csv" if output_format == "csv" else "application/x-ndjson"
+    # The background task also releases the slot if the client goes away before the body starts
+    return StreamingResponse(stream(), media_type=media_type, headers={"X-Row-Count": str(n)},
+                             background=BackgroundTask(release))
 
 
 # ----------------------
 # U-Net demo segmentation (2-channel 256x256)
 # ----------------------
 UNET_PATH = os.path.join(MODELS_DIR, "best_unet.pt")
-UNET_READY = False
 UNET_DEVICE = "cpu"
-unet_model = None
+# Sliding-window inference for scenes larger than one training tile
+UNET_TILE_SIZE = int(os.getenv("UNET_TILE_SIZE", "256"))
+UNET_TILE_OVERLAP = int(os.getenv("UNET_TILE_OVERLAP", "32"))
+UNET_TILE_BATCH = int(os.getenv("UNET_TILE_BATCH", "8"))
+
+
+def _load_unet():
+    """SimpleNamespace(forward, backend): forward maps (B,2,H,W) float32 to (B,H,W) logits."""
+    if not os.path.exists(UNET_PATH):
+        return None
+
+    def build():
+        import torch
+        from .nets import UNetSmall, fold_batchnorm
+        model = UNetSmall(in_ch=2, out_ch=1)
+        model.load_state_dict(torch.load(UNET_PATH, map_location="cpu"))
+        # FX static quantization fuses Conv+BN+ReLU itself, so leave BatchNorm in place for it
+        return model.eval() if INFERENCE_QUANT == "static" else fold_batchnorm(model.eval())
+
+    quantize = None
+    if INFERENCE_QUANT == "static":
+        def quantize(model):
+            tiles = sample_tiles(TILE_CATALOG, TILE_STORE, PROJECT_ROOT, QUANT_CALIB_TILES)
+            return quantize_unet_static(model, (img for img, _ in tiles))
+    runner = load_runner(UNET_PATH, build, INFERENCE_BACKEND, quantize=quantize, threads=INFERENCE_TORCH_THREADS)
+    if runner is None:
+        return None
+    backend, forward = runner
+    return SimpleNamespace(forward=lambda batch: forward(batch)[:, 0], backend=backend)
+
+RESOURCES.register("unet", _load_unet)
+
+
+def _unet_batch(tiles):
+    """tiles: [(2,h,w) float32] -> [(h,w) logits]; tiles of different sizes run as separate stacks."""
+    out = [None] * len(tiles)
+    groups = {}
+    for i, t in enumerate(tiles):
+        groups.setdefault(t.shape, []).append(i)
+    forward = RESOURCES.get("unet").forward
+    for idx in groups.values():
+        logits = forward(np.stack([tiles[i] for i in idx]).astype(np.float32, copy=False))
+        for i, lg in zip(idx, logits):
+            out[i] = lg
+    return out
+
+UNET_BATCHER = MicroBatcher("unet", with_thread_limits(_unet_batch, INFERENCE_TORCH_THREADS, INFERENCE_INTEROP_THREADS),
+                            max_batch=UNET_BATCH_MAX,
+                            max_wait_ms=BATCH_MAX_WAIT_MS, enabled=BATCHING_ENABLED)
+
+
+# Tile manifests, loaded once and spatially indexed
+TILE_CATALOG = TileCatalog(os.path.join(PROJECT_ROOT, "processed", "manifests"))
+
+
+# Multi-tile mosaicking for fields spanning several tiles
+UNET_MOSAIC_CHUNK = int(os.getenv("UNET_MOSAIC_CHUNK", "8"))
+TILE_IO_POOL = ThreadPoolExecutor(max_workers=int(os.getenv("TILE_IO_WORKERS", "4")), thread_name_prefix="tile-io")
 
-try:
-    import torch
-    import torch.nn as nn
-    class DoubleConv(nn.Module):
-        def __init__(self, in_ch, out_ch):
-            super().__init__()
-            self.seq = nn.Sequential(
-                nn.Conv2d(in_ch, out_ch, 3, padding=1), nn.BatchNorm2d(out_ch), nn.ReLU(inplace=True),
-                nn.Conv2d(out_ch, out_ch, 3, padding=1), nn.BatchNorm2d(out_ch), nn.ReLU(inplace=True),
-            )
-        def forward(self, x):
-            return self.seq(x)
-
-    class UNetSmall(nn.Module):
-        def __init__(self, in_ch=2, out_ch=1):
-            super().__init__()
-            self.down1 = DoubleConv(in_ch, 32)
-            self.pool1 = nn.MaxPool2d(2)
-            self.down2 = DoubleConv(32, 64)
-            self.pool2 = nn.MaxPool2d(2)
-            self.down3 = DoubleConv(64, 128)
-            self.pool3 = nn.MaxPool2d(2)
-            self.bott = DoubleConv(128, 256)
-            self.up3 = nn.ConvTranspose2d(256, 128, 2, stride=2)
-            self.conv3 = DoubleConv(256, 128)
-            self.up2 = nn.ConvTranspose2d(128, 64, 2, stride=2)
-            self.conv2 = DoubleConv(128, 64)
-            self.up1 = nn.ConvTranspose2d(64, 32, 2, stride=2)
-            self.conv1 = DoubleConv(64, 32)
-            self.outc = nn.Conv2d(32, out_ch, 1)
-        def forward(self, x):
-            d1 = self.down1(x); p1 = self.pool1(d1)
-            d2 = self.down2(p1); p2 = self.pool2(d2)
-            d3 = self.down3(p2); p3 = self.pool3(d3)
-            b = self.bott(p3)
-            u3 = self.up3(b); c3 = self.conv3(torch.cat([u3, d3], dim=1))
-            u2 = self.up2(c3); c2 = self.conv2(torch.cat([u2, d2], dim=1))
-            u1 = self.up1(c2); c1 = self.conv1(torch.cat([u1, d1], dim=1))
-            return self.outc(c1)
-
-    if os.path.exists(UNET_PATH):
-        unet_model = UNetSmall(in_ch=2, out_ch=1)
-        state = torch.load(UNET_PATH, map_location="cpu")
-        unet_model.load_state_dict(state)
-        unet_model.eval()
-        UNET_READY = True
-except Exception:
-    UNET_READY = False
+
+def _resolve_tile_path(img_path) -> Optional[str]:
+    """Manifest image_path as given, else relative to the project root; None if missing."""
+    if not img_path:
+        return None
+    if os.path.exists(str(img_path)):
+        return str(img_path)
+    rel = os.path.join(PROJECT_ROOT, str(img_path))
+    return rel if os.path.exists(rel) else None
+
+
+# Packed, memory-mapped tiles (python -m backend.app.tilestore pack); per-tile .npy files are the fallback
+TILE_STORE = TileStore(os.getenv("TILE_STORE_DIR", os.path.join(PROJECT_ROOT, "processed", "tilestore")))
+
+
+def _tile_source(row) -> Optional[str]:
+    """'store:<id>' when the tile is packed in TILE_STORE, else its .npy path (None if missing)."""
+    tid = row.get("id")
+    if tid is not None and str(tid) in TILE_STORE:
+        return f"store:{tid}"
+    return _resolve_tile_path(row.get("image_path"))
+
+
+def _load_tile(source: str) -> np.ndarray:
+    """Zero-copy tile read: a view into a mapped shard or a memory-mapped .npy (copied once, into the batch)."""
+    if source.startswith("store:"):
+        return TILE_STORE.image(source[len("store:"):])
+    return np.load(source, mmap_mode="r")
+
+
+# Rasterized field masks, bit-packed in a byte-bounded LRU (optionally backed by MASK_CACHE_DIR)
+MASK_CACHE = MaskCache(
+    max_bytes=int(os.getenv("MASK_CACHE_BYTES", str(64 * 1024 * 1024))),
+    disk_dir=os.getenv("MASK_CACHE_DIR") or None,
+    disk_max_bytes=int(os.getenv("MASK_CACHE_DISK_BYTES", str(1024 * 1024 * 1024))),
+)
+
+
+def _rasterize_mask(geom, bounds, shape) -> np.ndarray:
+    from rasterio.features import rasterize
+    from rasterio.transform import from_bounds
+    south, west, north, east = bounds
+    H, W = shape
+    transform = from_bounds(west, south, east, north, width=W, height=H)
+    return rasterize([(geom, 1)], out_shape=(H, W), transform=transform, fill=0, dtype=np.uint8).astype(bool)
+
+
+def field_mask(geom, bounds, shape, field_id=None) -> np.ndarray:
+    """Boolean (H,W) mask of `geom` rasterized on a grid spanning bounds=[south, west, north, east].
+    With a field_id the result is cached, keyed by field, geometry hash, bounds and shape."""
+    if field_id is None:
+        return _rasterize_mask(geom, bounds, shape)
+    return MASK_CACHE.get_or_build(field_id, geometry_key(geom), bounds, shape,
+                                   lambda: _rasterize_mask(geom, bounds, shape))
+
+
+def field_flood_table(pred_bin: np.ndarray, bounds) -> list:
+    """Flood stats for every registered field intersecting the raster: one label raster, two bincounts."""
+    south, west, north, east = bounds
+    idx = field_registry().query_bbox(west, south, east, north)
+    labels = rasterize_labels(field_registry().geoms[idx], pred_bin.shape, bounds_transform(bounds, pred_bin.shape))
+    total = label_counts(labels, len(idx))
+    flooded = label_counts(labels, len(idx), where=pred_bin)
+    return [
+        {
+            "field_id": field_registry().ids[i],
+            "field_pixels": int(t),
+            "flooded_pixels": int(f),
+            "flooded_pct_in_field": round(float(f)/float(t)*100.0, 2) if t else None,
+        }
+        for i, t, f in zip(idx, total, flooded)
+    ]
+
+
+@app.delete("/api/cache/masks")
+def invalidate_mask_cache(field_id: Optional[str] = None):
+    """Drop cached field masks for one field (e.g. after its boundary was edited) or all fields."""
+    return {"field_id": field_id, "removed": MASK_CACHE.invalidate(field_id)}
+
+
+def unet_forward(batch: np.ndarray) -> np.ndarray:
+    """Batched U-Net forward routed through the shared micro-batcher."""
+    return np.stack(UNET_BATCHER.map(list(batch)))
+
+
+@app.get("/api/inference/stats")
+def inference_stats():
+    """Micro-batching knobs, queue metrics and runtime backend (once loaded) for each served model."""
+    def model_stats(name, batcher):
+        backend = RESOURCES.get(name).backend if RESOURCES.loaded(name) else None
+        return {**batcher.stats(), "backend": backend}
+    return {"unet": model_stats("unet", UNET_BATCHER), "ft_transformer": model_stats("ft_transformer", FT_BATCHER),
+            "executor": INFERENCE_POOL.stats(), "mask_cache": MASK_CACHE.stats()}
+
+
+def _render_mask(fmt: str, meta: dict, pred_bin: np.ndarray, extra=(), bounds=None, **vector):
+    """Attach the mask to a segmentation response in the negotiated format (see maskcodec)."""
+    if fmt in BINARY_FORMATS:
+        return binary_response(fmt, meta, pred_bin, extra)
+    return {**meta, **json_mask_fields(pred_bin, fmt, bounds, **vector)}
 
 
 @app.get("/api/segment/unet/demo")
-def unet_demo(threshold: float = 0.5):
-    if not UNET_READY:
+@INFERENCE_POOL.batched_endpoint
+async def unet_demo(request: Request, threshold: float = 0.5, mask_format: Optional[str] = None,
+              simplify_m: float = 0.0, min_area_m2: float = 0.0):
+    if await _resource("unet") is None:
         return {"status":"error","message":"U-Net model not available. Train with train_unet.ipynb first."}
-    import torch
-    from PIL import Image
+    try:
+        fmt = negotiate(request.headers.get("accept"), mask_format)
+    except ValueError as e:
+        return {"status":"error","message":str(e)}
     # Synthetic demo tile: circle region brighter in both channels
     size = 256
     img = np.random.rand(2, size, size).astype("float32")*0.1
@@ -667,38 +1263,56 @@ def unet_demo(threshold: float = 0.5):
     circle = (rr-cy)**2 + (cc-cx)**2 <= rad*rad
     msk[circle] = 1.0
     img[0][circle] += 0.8; img[1][circle] += 0.6
-    with torch.no_grad():
-        x = torch.from_numpy(img)[None, ...]
-        pred = unet_model(x).squeeze(0)
-        prob = torch.sigmoid(pred).numpy()[0]
+    logits = await _batched(UNET_BATCHER, img)
+    prob = sigmoid(logits)
     pred_bin = (prob > float(threshold)).astype(np.uint8)
     flooded_pct = float(pred_bin.sum()/(size*size)*100.0)
-    # Encode PNG (single-channel mask 0/255)
-    pil = Image.fromarray((pred_bin*255).astype(np.uint8), mode="L")
-    buf = io.BytesIO()
-    pil.save(buf, format="PNG")
-    mask_b64 = base64.b64encode(buf.getvalue()).decode("utf-8")
-    return {"flooded_pct": round(flooded_pct,2), "size": size, "mask_png_base64": mask_b64}
+    # No georeference for the synthetic tile: geojson comes back in pixel units
+    return await run_in_threadpool(_render_mask, fmt, {"flooded_pct": round(flooded_pct,2), "size": size}, pred_bin,
+                                   simplify_m=simplify_m, min_area_m2=min_area_m2)
 
 
 @app.post("/api/segment/unet")
+@INFERENCE_POOL.endpoint
 def unet_predict(
+    request: Request,
     tile_npy: Optional[UploadFile] = File(None),
     vv_png: Optional[UploadFile] = File(None),
     vh_png: Optional[UploadFile] = File(None),
     bounds: Optional[str] = None,  # JSON stringified [south, west, north, east]
     field_id: Optional[str] = None,  # for polygon clipping
+    all_fields: bool = False,  # per-field stats for every field inside bounds, from this one model run
     threshold: float = 0.5,
+    tile_size: int = UNET_TILE_SIZE,
+    overlap: int = UNET_TILE_OVERLAP,
+    batch_size: int = UNET_TILE_BATCH,
+    mask_format: Optional[str] = None,  # png_base64 (default) | rle | geojson | png | packbits | multipart, or via Accept
+    simplify_m: float = 0.0,  # geojson: simplification tolerance in metres
+    min_area_m2: float = 0.0,  # geojson: drop flooded regions smaller than this
 ):
-    if not UNET_READY:
+    if RESOURCES.get("unet") is None:
         return {"status":"error","message":"U-Net model not available. Train with train_unet.ipynb first."}
-    import torch
+    try:
+        fmt = negotiate(request.headers.get("accept"), mask_format)
+    except ValueError as e:
+        return {"status":"error","message":str(e)}
+    img_bounds = None
+    if bounds:
+        try:
+            img_bounds = json.loads(bounds) if isinstance(bounds, str) else bounds
+        except Exception:
+            img_bounds = None
+    geo_bounds = img_bounds if isinstance(img_bounds, (list, tuple)) and len(img_bounds)==4 else None
+    # Reject requests that need bounds before spending a model pass on them
+    if all_fields and geo_bounds is None:
+        return {"status":"error","message":"all_fields requires bounds [south, west, north, east]."}
+    if fmt == "geojson" and geo_bounds is None:
+        return {"status":"error","message":"mask_format=geojson requires bounds [south, west, north, east]."}
     from PIL import Image
 
     arr = None
     if tile_npy is not None:
-        raw = tile_npy.file.read()
-        arr = np.load(io.BytesIO(raw))  # expects (2,H,W)
+        arr = np.load(tile_npy.file)  # expects (2,H,W); cast to float32 per tile below
     elif vv_png is not None and vh_png is not None:
         vv = Image.open(io.BytesIO(vv_png.file.read())).convert("L")
         vh = Image.open(io.BytesIO(vh_png.file.read())).convert("L")
@@ -707,7 +1321,8 @@ def unet_predict(
         if vv_np.shape != vh_np.shape:
             return {"status":"error","message":"vv_png and vh_png must have same dimensions."}
         arr = np.stack([vv_np, vh_np], axis=0)
-    else:
+    synthetic = arr is None
+    if synthetic:
         # Fallback: generate a synthetic demo tile (same as /demo) for quick UI wiring
         size = 256
         img = np.random.rand(2, size, size).astype("float32")*0.1
@@ -722,43 +1337,41 @@ def unet_predict(
 
     if arr.ndim != 3 or arr.shape[0] != 2:
         return {"status":"error","message":"Expected image array with shape (2, H, W)."}
-    with torch.no_grad():
-        x = torch.from_numpy(arr.astype("float32"))[None, ...]
-        pred = unet_model(x).squeeze(0)
-        prob = torch.sigmoid(pred).numpy()[0]
-    pred_bin = (prob > float(threshold)).astype(np.uint8)
+    # Tiled inference: any H/W (not only multiples of 8), bounded memory for full scenes.
+    # Probabilities are kept (as uint8, strip by strip) only when they go to the flood tile pyramid
+    # and its queue has room
+    keep_prob = FLOOD_TILES_ENABLED and not synthetic and geo_bounds is not None and not FLOOD_PYRAMID.full()
+    prob8 = None
+    try:
+        if keep_prob:
+            pred_bin, prob8 = tiled_mask_and_prob(arr, unet_forward, threshold, tile=tile_size, overlap=overlap,
+                                                  batch_size=batch_size)
+        else:
+            pred_bin = tiled_predict(arr, unet_forward, tile=tile_size, overlap=overlap,
+                                     batch_size=batch_size, threshold=threshold)
+    except ValueError as e:
+        return {"status":"error","message":str(e)}
     flooded_pct = float(pred_bin.sum()/(pred_bin.size)*100.0)
 
     # Polygon-aware per-field flooded percent if field_id + bounds provided
     flooded_pct_in_field = None
-    img_bounds = None
-    if bounds:
-        try:
-            img_bounds = json.loads(bounds) if isinstance(bounds, str) else bounds
-        except Exception:
-            img_bounds = None
-    if field_id and img_bounds and isinstance(img_bounds, (list, tuple)) and len(img_bounds)==4:
-        south, west, north, east = img_bounds
-        # Find field polygon from loaded GEOJSON
-        field_geom = None
-        for feat in GEOJSON.get("features", []):
-            if str(feat.get("properties", {}).get("field_id")) == str(field_id):
-                field_geom = shapely_shape(feat.get("geometry"))
-                break
+    if field_id and geo_bounds is not None:
+        south, west, north, east = geo_bounds
+        field_geom = field_registry().geometry(field_id)
         if field_geom is not None and not field_geom.is_empty:
-            H, W = pred_bin.shape
-            transform = from_bounds(west, south, east, north, width=W, height=H)
-            poly_mask = rasterize(
-                [(field_geom, 1)], out_shape=(H, W), transform=transform, fill=0, dtype=np.uint8
-            )
-            inside = poly_mask.astype(bool)
+            inside = field_mask(field_geom, (south, west, north, east), pred_bin.shape, field_id=field_id)
             denom = float(inside.sum())
             if denom > 0:
                 flooded_pct_in_field = float((pred_bin.astype(bool) & inside).sum())/denom*100.0
-    pil = Image.fromarray((pred_bin*255).astype(np.uint8), mode="L")
-    buf = io.BytesIO(); pil.save(buf, format="PNG")
-    mask_b64 = base64.b64encode(buf.getvalue()).decode("utf-8")
-    resp = {"flooded_pct": round(flooded_pct,2), "mask_png_base64": mask_b64}
+    field_table = None
+    if all_fields:
+        field_table = field_flood_table(pred_bin, geo_bounds)
+    if not synthetic:
+        if field_table is not None:
+            _record_floods([(r["field_id"], r["flooded_pct_in_field"]) for r in field_table], "unet")
+        elif flooded_pct_in_field is not None:
+            _record_floods([(field_id, round(flooded_pct_in_field, 2))], "unet")
+    resp = {"flooded_pct": round(flooded_pct,2)}
     # Echo bounds back if provided (client can overlay with these Leaflet bounds)
     if bounds:
         try:
@@ -767,84 +1380,178 @@ def unet_predict(
             resp["bounds"] = bounds
     if flooded_pct_in_field is not None:
         resp["flooded_pct_in_field"] = round(flooded_pct_in_field, 2)
-    return resp
+    if field_table is not None:
+        resp["fields"] = field_table
+    if prob8 is not None and FLOOD_PYRAMID.submit(geo_bounds, mask=pred_bin, prob=prob8) is not None:
+        resp["flood_tiles"] = FLOOD_TILES_URL
+    return _render_mask(fmt, resp, pred_bin, bounds=geo_bounds, simplify_m=simplify_m, min_area_m2=min_area_m2)
 
 
-@app.post("/api/segment/unet/by-field")
-def unet_by_field(field_id: str, date: str = "", threshold: float = 0.5):
-    """Attempt to locate a tile from manifests that overlaps the field bbox and run segmentation.
-    Requires manifests with columns: image_path (npy), and optionally south,west,north,east.
-    """
-    if not UNET_READY:
-        return {"status":"error","message":"U-Net model not available. Train with train_unet.ipynb first."}
+def _by_field_plan(request: Request, field_id: str, date: str, mask_format: Optional[str]):
+    """Validate a by-field request and pick its tiles: (error response, None) or (None, (fmt, sel, parts, sources))."""
+    try:
+        fmt = negotiate(request.headers.get("accept"), mask_format)
+    except ValueError as e:
+        return {"status":"error","message":str(e)}, None
     # Find field geometry and bbox
-    fld = None
-    for feat in GEOJSON.get("features", []):
-        if str(feat.get("properties", {}).get("field_id")) == str(field_id):
-            fld = feat; break
-    if not fld:
-        return {"status":"error","message":f"field_id {field_id} not found"}
-    geom = shapely_shape(fld.get("geometry"))
+    geom = field_registry().geometry(field_id)
+    if geom is None:
+        return {"status":"error","message":f"field_id {field_id} not found"}, None
+    from shapely.geometry import box as shapely_box
     minx, miny, maxx, maxy = geom.bounds
-    # Read manifests
-    man_dir = os.path.join(PROJECT_ROOT, "processed", "manifests")
-    cand_paths = []
-    for name in ["tiles.csv", "train.csv", "val.csv"]:
-        p = os.path.join(man_dir, name)
-        if os.path.exists(p):
-            cand_paths.append(p)
-    if not cand_paths:
-        return {"status":"error","message":"No manifests found; run preprocessing.ipynb first."}
-    import pandas as pd
-    df_list = [pd.read_csv(p) for p in cand_paths]
-    df = pd.concat(df_list, ignore_index=True)
-    # Prefer rows with bounds present
-    has_bounds = all(col in df.columns for col in ["south","west","north","east"])
-    if not has_bounds:
-        return {"status":"error","message":"Manifests missing bounds columns (south,west,north,east). Re-run preprocessing to include tile bounds."}
-    # Simple overlap test
-    sel = df[((df["west"] <= maxx) & (df["east"] >= minx) & (df["south"] <= maxy) & (df["north"] >= miny))]
+    # Indexed manifest lookup (reloaded automatically when the CSVs change)
+    if TILE_CATALOG.error:
+        return {"status":"error","message":TILE_CATALOG.error}, None
+    if date and not TILE_CATALOG.snapshot().has_dates:
+        return {"status":"error","message":"Manifests have no date column; re-run preprocessing to filter tiles by date."}, None
+    sel = TILE_CATALOG.query(minx, miny, maxx, maxy, date=date or None)
     if len(sel)==0:
-        return {"status":"error","message":"No tiles overlap field bbox. Check manifests or date selection."}
-    row = sel.iloc[0]
-    img_path = row.get("image_path")
-    if not img_path or not os.path.exists(img_path):
-        # Try path relative to project root
-        rel = os.path.join(PROJECT_ROOT, str(img_path)) if img_path else None
-        if rel and os.path.exists(rel):
-            img_path = rel
-        else:
-            return {"status":"error","message":f"Tile not found on disk: {img_path}"}
-    arr = np.load(img_path).astype("float32")
-    if arr.ndim!=3 or arr.shape[0]!=2:
-        return {"status":"error","message":"Tile array must be (2,H,W)."}
-    # Run model
-    import torch
-    with torch.no_grad():
-        x = torch.from_numpy(arr)[None, ...]
-        pred = unet_model(x).squeeze(0)
-        prob = torch.sigmoid(pred).numpy()[0]
-    pred_bin = (prob > float(threshold)).astype(np.uint8)
-    flooded_pct = float(pred_bin.sum()/pred_bin.size*100.0)
-    # Polygon clip using manifest bounds
-    south, west, north, east = float(row["south"]), float(row["west"]), float(row["north"]), float(row["east"])
-    H, W = pred_bin.shape
-    transform = from_bounds(west, south, east, north, width=W, height=H)
-    poly_mask = rasterize([(geom,1)], out_shape=(H,W), transform=transform, fill=0, dtype=np.uint8)
-    inside = poly_mask.astype(bool)
-    denom = float(inside.sum())
-    flooded_pct_in_field = None
-    if denom>0:
-        flooded_pct_in_field = float((pred_bin.astype(bool) & inside).sum())/denom*100.0
-    # Encode PNG
-    from PIL import Image
-    pil = Image.fromarray((pred_bin*255).astype(np.uint8), mode="L")
-    buf = io.BytesIO(); pil.save(buf, format="PNG")
-    mask_b64 = base64.b64encode(buf.getvalue()).decode("utf-8")
-    return {
-        "flooded_pct": round(flooded_pct,2),
+        return {"status":"error","message":"No tiles overlap field bbox. Check manifests or date selection."}, None
+    if not date:
+        # Never mix acquisitions: mosaic only the newest date covering the field
+        sel = [r for r in sel if r.get("date") == sel[0].get("date")]
+    # Split the polygon between tiles: each tile only counts the part of the field not already
+    # covered by an earlier tile, so overlapping footprints never double count a pixel
+    parts = []
+    covered = None
+    for r in sel:
+        footprint = shapely_box(float(r["west"]), float(r["south"]), float(r["east"]), float(r["north"]))
+        part = geom.intersection(footprint)
+        if covered is not None:
+            part = part.difference(covered)
+        covered = footprint if covered is None else covered.union(footprint)
+        if part.area > 0:
+            parts.append((r, part))
+    if len(parts)==0:
+        return {"status":"error","message":"No tiles overlap field polygon. Check manifests or date selection."}, None
+    sel = [r for r, _ in parts]
+    sources = [_tile_source(r) for r in sel]
+    missing = [r.get("image_path") for r, src in zip(sel, sources) if src is None]
+    if missing:
+        return {"status":"error","message":f"Tile not found on disk: {missing[0]}"}, None
+    return None, (fmt, sel, parts, sources)
+
+
+def _by_field_tiles(chunk, chunk_sources, logits, field_id: str, threshold: float, fmt: str,
+                    simplify_m: float, min_area_m2: float):
+    """Per-tile flood stats (and masks) for one chunk of a by-field mosaic."""
+    out = []
+    for (row, part), src, lg in zip(chunk, chunk_sources, logits):
+        prob = sigmoid(lg)
+        pred_bin = (prob > float(threshold)).astype(np.uint8)
+        south, west, north, east = float(row["south"]), float(row["west"]), float(row["north"]), float(row["east"])
+        if FLOOD_TILES_ENABLED:
+            FLOOD_PYRAMID.submit((south, west, north, east), mask=pred_bin,
+                                 prob=np.rint(prob * 255).astype(np.uint8))
+        inside = field_mask(part, (south, west, north, east), pred_bin.shape, field_id=field_id)
+        inside_n = int(inside.sum())
+        flooded_n = int(np.count_nonzero(pred_bin.astype(bool) & inside))
+        tile = {
+            "tile_path": row.get("image_path") if src.startswith("store:") else src,
+            "bounds": [south, west, north, east],
+            "field_pixels": inside_n,
+            "flooded_pixels_in_field": flooded_n,
+            "flooded_pct_in_field": round(flooded_n/inside_n*100.0, 2) if inside_n else None,
+        }
+        if fmt not in BINARY_FORMATS:
+            tile.update(json_mask_fields(pred_bin, fmt, (south, west, north, east),
+                                         simplify_m=simplify_m, min_area_m2=min_area_m2))
+        out.append((tile, pred_bin, int(pred_bin.sum())))
+    return out
+
+
+@app.post("/api/segment/unet/by-field")
+@INFERENCE_POOL.batched_endpoint
+async def unet_by_field(request: Request, field_id: str, date: str = "", threshold: float = 0.5,
+                        mask_format: Optional[str] = None, simplify_m: float = 0.0, min_area_m2: float = 0.0):
+    """Segment every manifest tile overlapping the field and combine them into one per-field flood fraction.
+    Requires manifests with columns: image_path (npy), south,west,north,east, and date to filter by `date`.
+    Without `date` the most recent acquisition covering the field is used.
+    With a binary mask_format the primary tile's mask is the body; multipart adds every tile as a part.
+    Model work goes through the U-Net micro-batcher; the rest runs on the threadpool, never on a model worker.
+    """
+    if await _resource("unet") is None:
+        return {"status":"error","message":"U-Net model not available. Train with train_unet.ipynb first."}
+    error, plan = await run_in_threadpool(_by_field_plan, request, field_id, date, mask_format)
+    if error is not None:
+        return error
+    fmt, sel, parts, sources = plan
+
+    tiles, masks = [], []
+    field_px = flooded_field_px = tile_px = flooded_tile_px = 0
+    # Process UNET_MOSAIC_CHUNK tiles at a time: reads in parallel, one batched forward per chunk
+    for c0 in range(0, len(parts), UNET_MOSAIC_CHUNK):
+        chunk, chunk_sources = parts[c0:c0 + UNET_MOSAIC_CHUNK], sources[c0:c0 + UNET_MOSAIC_CHUNK]
+        arrs = await asyncio.gather(*(asyncio.wrap_future(TILE_IO_POOL.submit(_load_tile, src)) for src in chunk_sources))
+        if any(a.ndim!=3 or a.shape[0]!=2 for a in arrs):
+            return {"status":"error","message":"Tile array must be (2,H,W)."}
+        logits = await asyncio.gather(*(_batched(UNET_BATCHER, a) for a in arrs))
+        del arrs
+        done = await run_in_threadpool(_by_field_tiles, chunk, chunk_sources, logits, field_id, threshold, fmt,
+                                       simplify_m, min_area_m2)
+        for tile, pred_bin, flooded_px in done:
+            field_px += tile["field_pixels"]; flooded_field_px += tile["flooded_pixels_in_field"]
+            tile_px += pred_bin.size; flooded_tile_px += flooded_px
+            tiles.append(tile)
+            if fmt in BINARY_FORMATS:
+                masks.append(pred_bin)
+    flooded_pct_in_field = flooded_field_px/field_px*100.0 if field_px else None
+    if flooded_pct_in_field is not None:
+        await run_in_threadpool(_record_floods, [(field_id, round(flooded_pct_in_field, 2))], "unet_by_field",
+                                sel[0].get("date"))
+    # Top-level mask/bounds/tile_path come from the tile holding most of the field (backward compatible)
+    p = max(range(len(tiles)), key=lambda i: tiles[i]["field_pixels"])
+    primary = tiles[p]
+    resp = {
+        "flooded_pct": round(flooded_tile_px/tile_px*100.0, 2),
         "flooded_pct_in_field": round(flooded_pct_in_field,2) if flooded_pct_in_field is not None else None,
-        "bounds": [south, west, north, east],
-        "mask_png_base64": mask_b64,
-        "tile_path": img_path,
+        "bounds": primary["bounds"],
+        "tile_path": primary["tile_path"],
+        "date": sel[0].get("date"),
+        "field_pixels": field_px,
+        "tiles_used": len(tiles),
+        "tiles": tiles,
     }
+    if FLOOD_TILES_ENABLED:
+        resp["flood_tiles"] = FLOOD_TILES_URL
+    if fmt in BINARY_FORMATS:
+        extra = [(f"tile-{i}", m) for i, m in enumerate(masks) if i != p]
+        return await run_in_threadpool(binary_response, fmt, resp, masks[p], extra)
+    resp.update({k: v for k, v in primary.items() if k.startswith("mask_") or k == "flood_polygons"})
+    return resp
+
+
+# ----------------------
+# Health / readiness
+# ----------------------
+# MODEL_WARMUP: 1 = load every model in a background thread at import, 0 = load on first use,
+# or a comma list of resource names (fields, ft_transformer, unet)
+MODEL_WARMUP = os.getenv("MODEL_WARMUP", "1").strip()
+BOOT_MS = round((time.perf_counter() - _IMPORT_STARTED) * 1000.0, 1)
+_BOOTED_AT = time.time()
+if MODEL_WARMUP not in ("", "0"):
+    RESOURCES.warmup(None if MODEL_WARMUP == "1" else [n.strip() for n in MODEL_WARMUP.split(",") if n.strip()])
+
+
+@app.get("/api/health")
+def health():
+    """Liveness plus per-model load state; `ready` is false while the warmup thread is still loading."""
+    return {
+        "status": "ok",
+        "ready": not RESOURCES.warming(),
+        "import_ms": BOOT_MS,
+        "uptime_s": round(time.time() - _BOOTED_AT, 1),
+        "pid": os.getpid(),
+        "memory": proc_memory(),
+        "torch_available": TORCH_AVAILABLE,
+        "inference_backend": INFERENCE_BACKEND,
+        "resources": RESOURCES.status(),
+    }
+
+
+@app.get("/api/health/ready")
+def health_ready():
+    """Readiness probe: 503 until warmup has finished."""
+    if RESOURCES.warming():
+        raise HTTPException(status_code=503, detail="Models are still loading")
+    return {"ready": True, "resources": RESOURCES.status()}
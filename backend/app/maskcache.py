@@ -0,0 +1,153 @@
+"""Cache of rasterized field masks.
+
+Clipping a segmentation to a field means rasterizing the polygon against the
+tile's transform. The same (field, tile grid) pair comes back for every date
+and threshold, so the rasterized mask is kept bit-packed (np.packbits, 1 bit
+per pixel) in a byte-bounded LRU, with an optional on-disk second tier.
+
+Keys include a hash of the geometry's WKB: if a field's geometry changes, its
+old masks simply stop matching. invalidate(field_id) drops them eagerly.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple
+
+import numpy as np
+
+
+def geometry_key(geom) -> str:
+    return hashlib.sha1(geom.wkb).hexdigest()[:16]
+
+
+def _field_tag(field_id) -> str:
+    return hashlib.sha1(str(field_id).encode()).hexdigest()[:12]
+
+
+class MaskCache:
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, disk_dir: Optional[str] = None,
+                 disk_max_bytes: int = 1024 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._lru: "OrderedDict[Tuple, np.ndarray]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.disk_hits = self.misses = self.evictions = self.invalidations = 0
+        self._disk_bytes = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._disk_bytes = sum(e.stat().st_size for e in os.scandir(disk_dir) if e.is_file())
+
+    @staticmethod
+    def make_key(field_id, geom_key: str, bounds, shape) -> Tuple:
+        # Bounds are rounded so float noise in manifests/requests doesn't defeat the cache
+        return (str(field_id), geom_key, tuple(round(float(b), 9) for b in bounds), tuple(int(s) for s in shape))
+
+    def _disk_path(self, key: Tuple) -> str:
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()[:24]
+        return os.path.join(self.disk_dir, f"{_field_tag(key[0])}_{digest}.npy")
+
+    def _put_memory(self, key: Tuple, packed: np.ndarray):
+        with self._lock:
+            old = self._lru.pop(key, None)
+            if old is not None:
+                self._bytes -= old.nbytes
+            if packed.nbytes > self.max_bytes:
+                return
+            self._lru[key] = packed
+            self._bytes += packed.nbytes
+            while self._bytes > self.max_bytes and self._lru:
+                _, ev = self._lru.popitem(last=False)
+                self._bytes -= ev.nbytes
+                self.evictions += 1
+
+    def _put_disk(self, key: Tuple, packed: np.ndarray):
+        path = self._disk_path(key)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            np.save(f, packed)
+        os.replace(tmp, path)
+        with self._lock:
+            self._disk_bytes += os.path.getsize(path)
+            if self._disk_bytes <= self.disk_max_bytes:
+                return
+            # Over budget: drop the oldest files down to 90% of the budget
+            entries = sorted((e for e in os.scandir(self.disk_dir) if e.is_file()), key=lambda e: e.stat().st_mtime)
+            for e in entries:
+                if self._disk_bytes <= 0.9 * self.disk_max_bytes:
+                    break
+                try:
+                    size = e.stat().st_size
+                    os.remove(e.path)
+                    self._disk_bytes -= size
+                except OSError:
+                    pass
+
+    def get_or_build(self, field_id, geom_key: str, bounds, shape, build: Callable[[], np.ndarray]) -> np.ndarray:
+        """Boolean (H,W) mask for the key, calling build() only on a miss."""
+        key = self.make_key(field_id, geom_key, bounds, shape)
+        n = key[3][0] * key[3][1]
+        with self._lock:
+            packed = self._lru.get(key)
+            if packed is not None:
+                self._lru.move_to_end(key)
+                self.hits += 1
+        if packed is None and self.disk_dir:
+            try:
+                packed = np.load(self._disk_path(key))
+                self.disk_hits += 1
+                self._put_memory(key, packed)
+            except (OSError, ValueError):
+                packed = None
+        if packed is not None:
+            return np.unpackbits(packed, count=n).reshape(key[3]).view(bool)
+        self.misses += 1
+        mask = np.asarray(build(), dtype=bool)
+        packed = np.packbits(mask.ravel())
+        self._put_memory(key, packed)
+        if self.disk_dir:
+            try:
+                self._put_disk(key, packed)
+            except OSError:
+                pass
+        return mask
+
+    def invalidate(self, field_id=None) -> int:
+        """Drop cached masks for one field (or everything). Returns entries removed from memory."""
+        with self._lock:
+            if field_id is None:
+                keys = list(self._lru)
+            else:
+                keys = [k for k in self._lru if k[0] == str(field_id)]
+            for k in keys:
+                self._bytes -= self._lru.pop(k).nbytes
+            self.invalidations += len(keys)
+        if self.disk_dir:
+            prefix = "" if field_id is None else _field_tag(field_id) + "_"
+            for e in os.scandir(self.disk_dir):
+                if e.is_file() and e.name.startswith(prefix):
+                    try:
+                        size = e.stat().st_size
+                        os.remove(e.path)
+                        self._disk_bytes -= size
+                    except OSError:
+                        pass
+        return len(keys)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "entries": len(self._lru),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "disk_dir": self.disk_dir,
+            "disk_bytes": self._disk_bytes if self.disk_dir else 0,
+        }
@@ -0,0 +1,185 @@
+"""Mask encodings and content negotiation for segmentation responses.
+
+JSON with a base64 PNG stays the default. Callers can pick another encoding
+with ?mask_format= or an Accept header:
+
+    png_base64  application/json (default)   {"mask_png_base64": ...} as before
+    rle         application/vnd.vani.mask-rle+json
+                                             {"mask_rle": {"size": [H, W], "counts": [...]}}
+                                             (COCO uncompressed RLE, column-major, starts with a 0-run)
+    geojson     application/geo+json         {"flood_polygons": FeatureCollection} of flooded areas
+    png         image/png                    raw 1-bit PNG body, no base64
+    packbits    application/octet-stream     np.packbits of the row-major mask, 1 bit per pixel
+    multipart   multipart/mixed              JSON metadata part + one PNG part per mask, streamed
+
+geojson polygonizes the mask in the tile's lon/lat frame (the same
+from_bounds transform used for rasterization). Simplification tolerance and
+the minimum area are in metres / m² (pixels when no bounds are known).
+
+For png and packbits, the scalar response fields (flooded_pct, bounds, ...)
+and the mask shape are sent as JSON in the X-Mask-Meta header.
+"""
+import base64
+import io
+import json
+import math
+import uuid
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+JSON_FORMATS = ("png_base64", "rle", "geojson")
+BINARY_FORMATS = ("png", "packbits", "multipart")
+MASK_FORMATS = JSON_FORMATS + BINARY_FORMATS
+ACCEPT_FORMATS = {
+    "image/png": "png",
+    "application/octet-stream": "packbits",
+    "application/vnd.vani.mask-rle+json": "rle",
+    "application/geo+json": "geojson",
+    "multipart/mixed": "multipart",
+    "application/json": "png_base64",
+    "*/*": "png_base64",
+}
+
+
+def _accept_q(params: Sequence[str]) -> float:
+    for p in params:
+        k, _, v = p.partition("=")
+        if k.strip().lower() == "q":
+            try:
+                return float(v)
+            except ValueError:
+                return 1.0
+    return 1.0
+
+
+def negotiate(accept: Optional[str], override: Optional[str] = None) -> str:
+    """Pick a mask format from ?mask_format= or the highest-q Accept type we serve (ties: first listed)."""
+    if override:
+        if override not in MASK_FORMATS:
+            raise ValueError(f"mask_format must be one of {', '.join(MASK_FORMATS)}")
+        return override
+    best, best_q = "png_base64", 0.0
+    for part in (accept or "").split(","):
+        media, *params = part.split(";")
+        fmt = ACCEPT_FORMATS.get(media.strip().lower())
+        q = _accept_q(params)
+        if fmt and q > best_q:
+            best, best_q = fmt, q
+    return best
+
+
+def png_bytes(mask: np.ndarray, one_bit: bool = False) -> bytes:
+    """PNG of a 0/1 mask: 8-bit 0/255 (what the dashboard overlays) or 1-bit."""
+    from PIL import Image
+    if one_bit:
+        pil = Image.fromarray(mask.astype(bool, copy=False))
+    else:
+        pil = Image.fromarray((mask*255).astype(np.uint8), mode="L")
+    buf = io.BytesIO()
+    pil.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def rle_encode(mask: np.ndarray) -> Dict:
+    """COCO-style uncompressed RLE: run lengths over the column-major mask, first run is zeros."""
+    flat = np.asarray(mask, dtype=bool).ravel(order="F")
+    if flat.size == 0:
+        return {"size": list(mask.shape), "counts": []}
+    edges = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+    counts = np.diff(np.concatenate(([0], edges, [flat.size])))
+    if flat[0]:
+        counts = np.concatenate(([0], counts))
+    return {"size": [int(mask.shape[0]), int(mask.shape[1])], "counts": counts.tolist()}
+
+
+def rle_decode(rle: Dict) -> np.ndarray:
+    H, W = rle["size"]
+    counts = np.asarray(rle["counts"], dtype=np.int64)
+    values = np.arange(len(counts)) % 2 == 1
+    return np.repeat(values, counts).reshape((W, H)).T.astype(np.uint8)
+
+
+def flood_polygons(mask: np.ndarray, bounds=None, simplify_m: float = 0.0, min_area_m2: float = 0.0) -> Dict:
+    """GeoJSON FeatureCollection of the mask's flooded regions.
+
+    Shapes are traced in pixel space, scaled to local metres for the area filter
+    and simplification, then mapped to lon/lat with from_bounds(bounds).
+    """
+    from rasterio.features import shapes
+    from shapely import set_precision
+    from shapely.affinity import affine_transform
+    from shapely.geometry import mapping, shape
+    from .zonal import bounds_transform
+
+    mask = np.ascontiguousarray(mask, dtype=np.uint8)
+    H, W = mask.shape
+    if bounds is not None:
+        south, west, north, east = (float(b) for b in bounds)
+        mx = (east - west) / W * 111320.0 * math.cos(math.radians((south + north) / 2))  # metres per pixel
+        my = (north - south) / H * 111320.0
+        T = bounds_transform((south, west, north, east), (H, W))
+        to_geo = [T.a / mx, T.b / my, T.d / mx, T.e / my, T.c, T.f]
+    else:
+        mx = my = 1.0
+        to_geo = None
+    features = []
+    for geom, _ in shapes(mask, mask=mask.astype(bool), connectivity=4):
+        local = affine_transform(shape(geom), [mx, 0, 0, my, 0, 0])
+        area = local.area
+        if area < min_area_m2:
+            continue
+        if simplify_m > 0:
+            local = local.simplify(simplify_m, preserve_topology=True)
+        if to_geo is not None:
+            out = set_precision(affine_transform(local, to_geo), 1e-7)  # ~1 cm
+        else:
+            out = local
+        if out.is_empty:
+            continue
+        features.append({"type": "Feature", "geometry": mapping(out),
+                         "properties": {"area_m2" if to_geo else "area_px": round(area, 1)}})
+    return {"type": "FeatureCollection", "features": features}
+
+
+def json_mask_fields(mask: np.ndarray, fmt: str, bounds=None, simplify_m: float = 0.0,
+                     min_area_m2: float = 0.0) -> Dict:
+    """The response field(s) carrying the mask for a JSON format."""
+    if fmt == "rle":
+        return {"mask_rle": rle_encode(mask)}
+    if fmt == "geojson":
+        return {"flood_polygons": flood_polygons(mask, bounds, simplify_m, min_area_m2)}
+    return {"mask_png_base64": base64.b64encode(png_bytes(mask)).decode("utf-8")}
+
+
+def _header_meta(meta: Dict, shape: Tuple[int, int]) -> str:
+    # Only scalars and bounds fit in a header; tables (fields/tiles) need multipart
+    small = {k: v for k, v in meta.items() if k == "bounds" or not isinstance(v, (list, dict))}
+    small["shape"] = [int(shape[0]), int(shape[1])]
+    return json.dumps(small, separators=(",", ":"))
+
+
+def binary_response(fmt: str, meta: Dict, mask: np.ndarray, extra: Sequence[Tuple[str, np.ndarray]] = ()):
+    """Response for a binary mask format. `extra` adds named masks as further multipart parts."""
+    from fastapi.responses import Response, StreamingResponse
+    if fmt == "png":
+        return Response(png_bytes(mask, one_bit=True), media_type="image/png",
+                        headers={"X-Mask-Meta": _header_meta(meta, mask.shape)})
+    if fmt == "packbits":
+        return Response(np.packbits(mask.astype(bool, copy=False).ravel()).tobytes(),
+                        media_type="application/octet-stream",
+                        headers={"X-Mask-Meta": _header_meta(meta, mask.shape), "X-Mask-Encoding": "packbits"})
+    boundary = uuid.uuid4().hex
+    parts: List[Tuple[str, np.ndarray]] = [("mask", mask)] + list(extra)
+
+    def stream():
+        head = f"--{boundary}\r\nContent-Type: application/json\r\nContent-Disposition: inline; name=\"meta\"\r\n\r\n"
+        yield head.encode() + json.dumps(meta).encode() + b"\r\n"
+        for name, m in parts:
+            head = (f"--{boundary}\r\nContent-Type: image/png\r\n"
+                    f"Content-Disposition: inline; name=\"{name}\"\r\n"
+                    f"X-Mask-Shape: {m.shape[0]},{m.shape[1]}\r\n\r\n")
+            yield head.encode() + png_bytes(m, one_bit=True) + b"\r\n"
+        yield f"--{boundary}--\r\n".encode()
+
+    return StreamingResponse(stream(), media_type=f"multipart/mixed; boundary={boundary}")
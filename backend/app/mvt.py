@@ -0,0 +1,368 @@
+"""Mapbox Vector Tiles of the field registry, with each field's latest flood result.
+
+Tiles are built on demand and kept in a byte-bounded LRU:
+
+- Fields come from the FieldRegistry STRtree (tile bbox plus a 64-unit
+  buffer). They are projected straight into tile coordinates (web mercator,
+  extent 4096, y down) and clipped to the buffered tile. Fields smaller than
+  `min_area` tile units² (default 64, a quarter of a 256 px tile pixel) are
+  left out, so low zooms carry only the fields that are actually visible.
+- Coordinates are snapped to the integer grid. Rings that collapse are dropped,
+  and rings are re-wound as the spec requires (exteriors have positive area in
+  tile coordinates).
+- Geometry command streams (MoveTo/LineTo/ClosePath, zigzag deltas) and their
+  varints are built for the whole tile at once with numpy. Only the per-feature
+  framing is a Python loop. The protobuf is written by hand: the format is five
+  message types, so mapbox-vector-tile is not required.
+- Layer "fields" has properties field_id and, once a segmentation has scored
+  the field, flooded_pct. Feature ids are registry index + 1.
+- Flood results come from the store's flood_results table. sync() pulls rows
+  newer than the last one seen (every worker does this, so they all converge)
+  and drops the cached tiles covering the fields that changed.
+"""
+import hashlib
+import math
+import struct
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+EXTENT = 4096
+BUFFER = 64
+LAYER = "fields"
+MAX_ZOOM = 22
+
+
+def tile_lonlat_bounds(z: int, x: int, y: int, buffer: float = 0.0) -> Tuple[float, float, float, float]:
+    """(west, south, east, north) of an XYZ tile, grown by `buffer` tile units on each side."""
+    n = 2 ** z
+    pad = buffer / EXTENT
+
+    def lon(tx):
+        return tx / n * 360.0 - 180.0
+
+    def lat(ty):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * ty / n))))
+    return lon(x - pad), max(-85.0511287798, lat(y + 1 + pad)), lon(x + 1 + pad), min(85.0511287798, lat(y - pad))
+
+
+def lonlat_range(z: int, west: float, south: float, east: float, north: float,
+                 buffer: float = 0.0) -> Tuple[int, int, int, int]:
+    """Inclusive x0, y0, x1, y1 of the tiles at zoom z that touch a lon/lat box, counting
+    each tile as grown by `buffer` tile units on each side (see tile_lonlat_bounds)."""
+    n = 2 ** z
+    pad = buffer / EXTENT
+
+    def tx(lon, d):
+        return min(n - 1, max(0, math.floor((lon + 180.0) / 360.0 * n + d)))
+
+    def ty(lat, d):
+        lat = max(-85.0511287798, min(85.0511287798, lat))
+        r = math.radians(lat)
+        return min(n - 1, max(0, math.floor((1 - math.log(math.tan(r) + 1 / math.cos(r)) / math.pi) / 2 * n + d)))
+    return tx(west, -pad), ty(north, -pad), tx(east, pad), ty(south, pad)
+
+
+def _to_tile(coords: np.ndarray, z: int, x: int, y: int) -> np.ndarray:
+    scale = 2 ** z * EXTENT
+    lat = np.radians(np.clip(coords[:, 1], -85.0511287798, 85.0511287798))
+    px = (coords[:, 0] + 180.0) / 360.0 * scale - x * EXTENT
+    py = (1 - np.log(np.tan(lat) + 1 / np.cos(lat)) / np.pi) / 2 * scale - y * EXTENT
+    return np.column_stack([px, py])
+
+
+def _varints(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Protobuf varints of non-negative ints: (bytes as uint8, byte offset of each value + total at the end)."""
+    v = values.astype(np.uint64)
+    lengths = np.ones(v.size, dtype=np.int64)
+    for k in range(1, 10):
+        lengths += v >= np.uint64(1 << (7 * k))
+    offsets = np.zeros(v.size + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    out = np.zeros(int(offsets[-1]), dtype=np.uint8)
+    for k in range(int(lengths.max()) if v.size else 0):
+        sel = np.flatnonzero(lengths > k)
+        byte = (v[sel] >> np.uint64(7 * k)) & np.uint64(0x7F)
+        more = (lengths[sel] > k + 1).astype(np.uint64) << np.uint64(7)
+        out[offsets[sel] + k] = (byte | more).astype(np.uint8)
+    return out, offsets
+
+
+_SMALL = [bytes([i]) for i in range(128)]
+
+
+def _varint(n: int) -> bytes:
+    if n < 128:
+        return _SMALL[n]
+    out = bytearray()
+    while n > 0x7F:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+    return bytes(out)
+
+
+def _field(tag: int, payload: bytes) -> bytes:
+    """Length-delimited protobuf field."""
+    return _varint(tag) + _varint(len(payload)) + payload
+
+
+def _segment_sum(values: np.ndarray, starts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    out = np.zeros(len(lengths), dtype=values.dtype)
+    nz = lengths > 0
+    out[nz] = np.add.reduceat(values, starts[nz]) if values.size else 0
+    return out
+
+
+def encode_polygons(geoms: np.ndarray) -> Tuple[np.ndarray, List[bytes]]:
+    """MVT geometry streams for polygonal geometries in tile coords: (mask of geometries kept, streams).
+
+    Coordinates are rounded to the integer grid here, so repeated points are
+    dropped, as are rings that collapse (fewer than 3 points or zero area) and
+    polygons whose exterior collapsed. Rings are reversed where needed so that
+    exteriors have positive area and holes negative.
+    """
+    import shapely
+    if len(geoms) == 0:
+        return np.zeros(0, dtype=bool), []
+    _, coords, offsets = shapely.to_ragged_array(shapely.force_2d(geoms))
+    ring_off, poly_off = offsets[0], offsets[1]
+    geom_off = offsets[2] if len(offsets) > 2 else np.arange(len(geoms) + 1)  # all single Polygons
+    coords = np.rint(coords).astype(np.int64)
+    n_rings = len(ring_off) - 1
+    ring_poly = np.repeat(np.arange(len(poly_off) - 1), np.diff(poly_off))
+    poly_geom = np.repeat(np.arange(len(geoms)), np.diff(geom_off))
+    # Drop each ring's closing point (ClosePath implies it), then points equal to their cyclic predecessor
+    keep = np.ones(len(coords), dtype=bool)
+    keep[ring_off[1:] - 1] = False
+    pts = coords[keep]
+    pt_ring = np.repeat(np.arange(n_rings), np.diff(ring_off) - 1)
+    starts = ring_off[:-1] - np.arange(n_rings)
+    lengths = np.diff(ring_off) - 1
+    prev = np.arange(len(pts)) - 1
+    firsts = starts[lengths > 0]
+    prev[firsts] = (firsts + lengths[lengths > 0] - 1)
+    dup = (pts == pts[prev]).all(axis=1) if len(pts) else np.zeros(0, dtype=bool)
+    pts, pt_ring = pts[~dup], pt_ring[~dup]
+    lengths = np.bincount(pt_ring, minlength=n_rings)
+    starts = np.zeros(n_rings + 1, dtype=np.int64)
+    np.cumsum(lengths, out=starts[1:])
+    # Signed area per ring (shoelace with the cyclic successor)
+    nxt = np.arange(len(pts)) + 1
+    lasts = starts[1:][lengths > 0] - 1
+    nxt[lasts] = starts[:-1][lengths > 0]
+    cross = pts[:, 0] * pts[nxt, 1] - pts[nxt, 0] * pts[:, 1] if len(pts) else np.zeros(0, dtype=np.int64)
+    area2 = _segment_sum(cross, starts[:-1], lengths)
+    exterior = np.zeros(n_rings, dtype=bool)
+    exterior[poly_off[:-1][np.diff(poly_off) > 0]] = True
+    ring_ok = (lengths >= 3) & (area2 != 0)
+    poly_ok = np.zeros(len(poly_off) - 1, dtype=bool)
+    poly_ok[ring_poly[exterior & ring_ok]] = True
+    ring_ok &= poly_ok[ring_poly]
+    geom_ok = np.bincount(poly_geom[poly_ok], minlength=len(geoms)) > 0
+    # Reverse rings with the wrong winding, then keep only surviving rings
+    flip = np.repeat((exterior & (area2 < 0)) | (~exterior & (area2 > 0)), lengths)
+    local = np.arange(len(pts)) - starts[:-1][pt_ring]
+    src = np.where(flip, starts[:-1][pt_ring] + lengths[pt_ring] - 1 - local, np.arange(len(pts)))
+    pts = pts[src]
+    pt_keep = ring_ok[pt_ring]
+    pts, pt_ring = pts[pt_keep], pt_ring[pt_keep]
+    rings = np.flatnonzero(ring_ok)
+    ring_len = lengths[rings]
+    ring_geom = poly_geom[ring_poly[rings]]
+    if rings.size == 0:
+        return geom_ok, []
+    pt_ring = np.repeat(np.arange(len(rings)), ring_len)
+    pt_geom = ring_geom[pt_ring]
+    # Deltas run on across rings of a feature and restart from (0, 0) for each feature
+    d = pts.copy()
+    d[1:] -= pts[:-1]
+    first = np.ones(len(pts), dtype=bool)
+    first[1:] = pt_geom[1:] != pt_geom[:-1]
+    d[first] = pts[first]
+    zz = (d << 1) ^ (d >> 63)
+    # Per ring: MoveTo(1) x y LineTo(k-1) x y ... ClosePath(1) -> 2k + 3 integers
+    ring_start = np.zeros(len(rings) + 1, dtype=np.int64)
+    np.cumsum(2 * ring_len + 3, out=ring_start[1:])
+    ints = np.zeros(int(ring_start[-1]), dtype=np.int64)
+    rs = ring_start[:-1]
+    ints[rs] = 1 | (1 << 3)
+    ints[rs + 3] = 2 | ((ring_len - 1) << 3)
+    ints[rs + 2 * ring_len + 2] = 7 | (1 << 3)
+    pt_start = np.zeros(len(rings) + 1, dtype=np.int64)
+    np.cumsum(ring_len, out=pt_start[1:])
+    i = np.arange(len(pts)) - pt_start[pt_ring]
+    pos = rs[pt_ring] + 1 + 2 * i + (i > 0)
+    ints[pos] = zz[:, 0]
+    ints[pos + 1] = zz[:, 1]
+    raw, offsets = _varints(ints)
+    # Each kept geometry's rings are contiguous: split the byte stream at its first ring
+    geom_first = np.searchsorted(ring_geom, np.flatnonzero(geom_ok))
+    bounds = offsets[np.append(ring_start[geom_first], ring_start[-1])]
+    data = raw.tobytes()
+    return geom_ok, [data[a:b] for a, b in zip(bounds[:-1].tolist(), bounds[1:].tolist())]
+
+
+def _value(v) -> bytes:
+    if isinstance(v, str):
+        return _field(0x0A, v.encode())
+    return b"\x19" + struct.pack("<d", float(v))  # double_value
+
+
+def encode_layer(name: str, ids: Iterable[int], props: List[Dict], geometries: List[bytes]) -> bytes:
+    keys: Dict[str, int] = {}
+    values: Dict[object, int] = {}
+    feats = []
+    for fid, p, geom in zip(ids, props, geometries):
+        tags = bytearray()
+        for k, v in p.items():
+            if v is not None:
+                tags += _varint(keys.setdefault(k, len(keys)))
+                tags += _varint(values.setdefault((type(v) is str, v), len(values)))
+        body = b"".join((b"\x08", _varint(fid), b"\x12", _varint(len(tags)), tags,
+                         b"\x18\x03\x22", _varint(len(geom)), geom))
+        feats.append(b"\x12" + _varint(len(body)) + body)
+    layer = (b"\x78\x02" + _field(0x0A, name.encode()) + b"".join(feats)
+             + b"".join(_field(0x1A, k.encode()) for k in keys)
+             + b"".join(_field(0x22, _value(v)) for _, v in values)
+             + b"\x28" + _varint(EXTENT))
+    return _field(0x1A, layer)
+
+
+def latest_floods(conn, after_seq: int = 0) -> List[Tuple[int, str, Optional[float]]]:
+    """(seq, field_id, flooded_pct) of each field's newest flood result with seq > after_seq, in seq order."""
+    return [tuple(r) for r in conn.execute(
+        "SELECT seq, field_id, flooded_pct FROM flood_results WHERE seq IN "
+        "(SELECT MAX(seq) FROM flood_results WHERE seq > ? GROUP BY field_id) ORDER BY seq", (after_seq,))]
+
+
+class FieldTiles:
+    def __init__(self, registry, version: str, max_bytes: int = 64 * 1024 * 1024, min_area: float = 64.0):
+        self.registry = registry
+        self.min_area = min_area
+        self._bounds: Optional[np.ndarray] = None
+        self.version = version
+        self.max_bytes = max_bytes
+        self.flood: Dict[str, float] = {}
+        self.flood_seq = 0
+        self._lru: "OrderedDict[Tuple[int, int, int], Tuple[bytes, str]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.invalidated = self.builds = 0
+        self.build_ms = 0.0
+
+    def build(self, z: int, x: int, y: int) -> bytes:
+        import shapely
+        west, south, east, north = tile_lonlat_bounds(z, x, y, BUFFER)
+        idx = self.registry.query_bbox(west, south, east, north)
+        if idx.size == 0:
+            return b""
+        # Cheap pre-filter on bbox area (an upper bound on polygon area) before projecting anything
+        if self._bounds is None:
+            self._bounds = shapely.bounds(self.registry.geoms)
+        b = self._bounds[idx]
+        corners = _to_tile(np.concatenate([b[:, :2], b[:, 2:]]), z, x, y)
+        lo, hi = corners[:len(idx)], corners[len(idx):]
+        idx = idx[(hi[:, 0] - lo[:, 0]) * (lo[:, 1] - hi[:, 1]) >= self.min_area]
+        if idx.size == 0:
+            return b""
+        geoms = shapely.transform(self.registry.geoms[idx], lambda c: _to_tile(c, z, x, y))
+        geoms = shapely.clip_by_rect(geoms, -BUFFER, -BUFFER, EXTENT + BUFFER, EXTENT + BUFFER)
+        # Polygonal (3 = Polygon, 6 = MultiPolygon) and not sub-pixel dust at this zoom
+        ok = np.isin(shapely.get_type_id(geoms), (3, 6)) & (shapely.area(geoms) >= self.min_area)
+        kept, streams = encode_polygons(geoms[ok])
+        idx = idx[ok][kept]
+        if idx.size == 0:
+            return b""
+        ids = self.registry.ids
+        props = [{"field_id": ids[i], "flooded_pct": self.flood.get(ids[i])} for i in idx.tolist()]
+        return encode_layer(LAYER, (idx + 1).tolist(), props, streams)
+
+    def tile(self, z: int, x: int, y: int) -> Tuple[bytes, str]:
+        """(MVT bytes, ETag) for a tile, from the LRU or freshly built."""
+        key = (z, x, y)
+        with self._lock:
+            hit = self._lru.get(key)
+            if hit is not None:
+                self._lru.move_to_end(key)
+                self.hits += 1
+                return hit
+            self.misses += 1
+            seq = self.flood_seq
+        t0 = time.perf_counter()
+        data = self.build(z, x, y)
+        etag = f'"{hashlib.blake2b(data, digest_size=12, key=self.version.encode()[:64]).hexdigest()}"'
+        with self._lock:
+            self.builds += 1
+            self.build_ms += (time.perf_counter() - t0) * 1000.0
+            # A flood update landed mid-build: serve this tile but don't cache it (it may be stale)
+            if seq == self.flood_seq and len(data) <= self.max_bytes:
+                old = self._lru.pop(key, None)
+                if old is not None:
+                    self._bytes -= len(old[0])
+                self._lru[key] = (data, etag)
+                self._bytes += len(data)
+                while self._bytes > self.max_bytes and self._lru:
+                    _, (ev, _) = self._lru.popitem(last=False)
+                    self._bytes -= len(ev)
+                    self.evictions += 1
+        return data, etag
+
+    def invalidate_bbox(self, west: float, south: float, east: float, north: float) -> int:
+        """Drop cached tiles whose buffered area (what build() clips to) touches a lon/lat box."""
+        ranges = {}
+        with self._lock:
+            drop = []
+            for key in self._lru:
+                z, x, y = key
+                r = ranges.get(z) or ranges.setdefault(z, lonlat_range(z, west, south, east, north, BUFFER))
+                if r[0] <= x <= r[2] and r[1] <= y <= r[3]:
+                    drop.append(key)
+            for key in drop:
+                self._bytes -= len(self._lru.pop(key)[0])
+            self.invalidated += len(drop)
+        return len(drop)
+
+    def invalidate(self) -> int:
+        with self._lock:
+            n = len(self._lru)
+            self._lru.clear()
+            self._bytes = 0
+            self.invalidated += n
+        return n
+
+    def apply_floods(self, rows: List[Tuple[int, str, Optional[float]]]) -> int:
+        """Record newer flood results and drop the cached tiles covering those fields."""
+        changed = []
+        with self._lock:
+            for seq, field_id, pct in rows:
+                if seq <= self.flood_seq:
+                    continue
+                self.flood_seq = seq
+                pct = round(float(pct), 2) if pct is not None else None
+                if self.flood.get(field_id) != pct:
+                    self.flood[field_id] = pct
+                    changed.append(field_id)
+        idx = [i for i in (self.registry.index_of(f) for f in changed) if i is not None]
+        if not idx:
+            return 0
+        import shapely
+        minx, miny, maxx, maxy = shapely.total_bounds(self.registry.geoms[idx])
+        return self.invalidate_bbox(minx, miny, maxx, maxy)
+
+    def sync(self, read) -> int:
+        """Pull flood results newer than flood_seq via read(fn) (Store.read) and apply them."""
+        with self._sync_lock:
+            return self.apply_floods(read(latest_floods, self.flood_seq))
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"tiles": len(self._lru), "bytes": self._bytes, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "invalidated": self.invalidated, "builds": self.builds,
+                    "avg_build_ms": round(self.build_ms / self.builds, 2) if self.builds else 0.0,
+                    "fields_with_flood": len(self.flood), "flood_seq": self.flood_seq}
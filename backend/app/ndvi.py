@@ -0,0 +1,296 @@
+"""Per-field NDVI statistics from raster scenes, for triage.
+
+Scenes live under NDVI_DIR/<sat_source>/ as GeoTIFFs named by date, either
+an NDVI band or red/NIR bands:
+
+    <date>_ndvi.tif  (or <date>.tif)        NDVI, any scale/offset/nodata
+    <date>_red.tif + <date>_nir.tif         NDVI = (nir - red) / (nir + red)
+
+One pass over the scene gives count, mean, std and percentiles for every
+field:
+
+- Work is restricted to the fields' extent and read in `block` x `block`
+  windows, so memory is bounded by the window size, not the scene size.
+- Per window, the fields are burned into an int32 label raster
+  (zonal.rasterize_labels). Pixel count, sum and sum of squares are then one
+  np.bincount each, and an NDVI histogram (`bins` over [-1, 1]) is one
+  bincount over label * bins + bin. Percentiles are interpolated from the
+  histogram, so they are exact to within one bin width (0.02 by default).
+- Field geometries are projected to the scene CRS with one vectorized
+  coordinate transform.
+- With `label_cache_dir`, the label raster for a (scene grid, field set) pair
+  is kept as an on-disk int32 .npy and memory-mapped next time. Later dates
+  on the same grid then skip rasterization entirely.
+
+Results (a few floats per field) are cached per scene file, so re-running
+triage with a different threshold only re-ranks.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import ExitStack
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .catalog import normalize_date
+from .zonal import rasterize_labels
+
+PERCENTILES = (10, 50, 90)
+
+
+def find_scene(root: str, sat_source: str, date: str) -> Optional[Dict[str, str]]:
+    """{"ndvi": path} or {"red": path, "nir": path} for a source/date, or None."""
+    day = normalize_date(date)
+    if not root or not day or os.sep in sat_source or sat_source.startswith("."):
+        return None
+    folder = os.path.join(root, sat_source)
+    for name in (f"{day}_ndvi.tif", f"{day}.tif"):
+        if os.path.isfile(os.path.join(folder, name)):
+            return {"ndvi": os.path.join(folder, name)}
+    red, nir = os.path.join(folder, f"{day}_red.tif"), os.path.join(folder, f"{day}_nir.tif")
+    if os.path.isfile(red) and os.path.isfile(nir):
+        return {"red": red, "nir": nir}
+    return None
+
+
+def _scene_signature(scene: Dict[str, str]) -> Tuple:
+    return tuple(sorted((k, p, os.stat(p).st_mtime_ns, os.stat(p).st_size) for k, p in scene.items()))
+
+
+def geometries_key(geoms: Sequence) -> str:
+    import shapely
+    h = hashlib.sha1()
+    for wkb in shapely.to_wkb(np.asarray(geoms, dtype=object)):
+        h.update(wkb)
+    return h.hexdigest()[:16]
+
+
+def _to_crs(geoms: np.ndarray, crs) -> np.ndarray:
+    """Project lon/lat geometries to `crs` (no-op for EPSG:4326)."""
+    if crs is None or crs.to_epsg() == 4326:
+        return geoms
+    import shapely
+    from rasterio.warp import transform
+
+    def project(xy):
+        xs, ys = transform("EPSG:4326", crs, xy[:, 0], xy[:, 1])
+        return np.column_stack([xs, ys])
+
+    return shapely.transform(geoms, project)
+
+
+def _read_band(src, window) -> np.ndarray:
+    """Window of band 1 as float32 with scale/offset applied and nodata as NaN."""
+    data = src.read(1, window=window, masked=True)
+    scale, offset = src.scales[0] or 1.0, src.offsets[0] or 0.0
+    out = data.astype(np.float32).filled(np.nan)
+    if scale != 1.0 or offset != 0.0:
+        out = out * np.float32(scale) + np.float32(offset)
+    return out
+
+
+def _read_ndvi(srcs: Dict, window) -> np.ndarray:
+    if "ndvi" in srcs:
+        ndvi = _read_band(srcs["ndvi"], window)
+    else:
+        red, nir = _read_band(srcs["red"], window), _read_band(srcs["nir"], window)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ndvi = (nir - red) / (nir + red)
+    ndvi[(ndvi < -1.0) | (ndvi > 1.0)] = np.nan
+    return ndvi
+
+
+def hist_percentiles(hist: np.ndarray, count: np.ndarray, qs: Sequence[float], lo: float = -1.0,
+                     hi: float = 1.0, chunk: int = 65536) -> np.ndarray:
+    """(len(qs), n) percentiles per row of an (n, bins) histogram, linear within the bin; NaN where empty."""
+    n, bins = hist.shape
+    width = (hi - lo) / bins
+    out = np.full((len(qs), n), np.nan)
+    for start in range(0, n, chunk):
+        h = hist[start:start + chunk].astype(np.int64)
+        c = count[start:start + chunk]
+        cum = h.cumsum(axis=1)
+        rows = np.arange(h.shape[0])
+        for qi, q in enumerate(qs):
+            target = q / 100.0 * c
+            k = np.minimum((cum < target[:, None]).sum(axis=1), bins - 1)
+            before = np.where(k > 0, cum[rows, np.maximum(k - 1, 0)], 0)
+            inbin = h[rows, k]
+            frac = np.where(inbin > 0, (target - before) / np.maximum(inbin, 1), 0.5)
+            out[qi, start:start + chunk] = np.where(c > 0, lo + (k + np.clip(frac, 0.0, 1.0)) * width, np.nan)
+    return out
+
+
+def zonal_ndvi(geoms: Sequence, scene: Dict[str, str], block: int = 1024, bins: int = 100,
+               percentiles: Sequence[float] = PERCENTILES, label_cache_dir: Optional[str] = None,
+               geoms_digest: Optional[str] = None) -> Dict:
+    """Per-field NDVI stats over a scene: {"count", "mean", "std", "p<q>"...} arrays aligned with geoms, plus "meta"."""
+    import rasterio
+    from rasterio.windows import Window, from_bounds, transform as window_transform
+    from shapely import box
+    from shapely.strtree import STRtree
+
+    t0 = time.perf_counter()
+    geoms = np.asarray(geoms, dtype=object)
+    n = len(geoms)
+    count = np.zeros(n, dtype=np.int64)
+    s1 = np.zeros(n, dtype=np.float64)
+    s2 = np.zeros(n, dtype=np.float64)
+    hist = np.zeros((n, bins), dtype=np.uint32)
+    meta = {"windows": 0, "pixels": 0, "label_cache": None}
+
+    with ExitStack() as stack:
+        srcs = {k: stack.enter_context(rasterio.open(p)) for k, p in scene.items()}
+        ref = next(iter(srcs.values()))
+        if any(s.shape != ref.shape or s.transform != ref.transform for s in srcs.values()):
+            raise ValueError("red and NIR rasters must share one grid")
+        import shapely
+        projected = _to_crs(geoms, ref.crs)
+        nonempty = np.flatnonzero(~shapely.is_empty(projected)) if n else np.zeros(0, dtype=np.int64)
+        if nonempty.size == 0:
+            return {"count": count, **_finish(count, s1, s2, hist, percentiles), "meta": meta}
+        minx, miny, maxx, maxy = shapely.total_bounds(projected[nonempty])
+        # Pixel extent of the fields, clipped to the scene
+        ext = from_bounds(minx, miny, maxx, maxy, ref.transform)
+        col0, row0 = max(0, int(np.floor(ext.col_off))), max(0, int(np.floor(ext.row_off)))
+        col1 = min(ref.width, int(np.ceil(ext.col_off + ext.width)))
+        row1 = min(ref.height, int(np.ceil(ext.row_off + ext.height)))
+        if col1 <= col0 or row1 <= row0:  # fields entirely outside the scene
+            meta["elapsed_s"] = round(time.perf_counter() - t0, 3)
+            return {"count": count, **_finish(count, s1, s2, hist, percentiles), "meta": meta}
+        H, W = row1 - row0, col1 - col0
+
+        labels_mm, cache_path, tmp_path = None, None, None
+        if label_cache_dir:
+            grid = f"{ref.crs}|{tuple(ref.transform)}|{ref.shape}|{row0},{col0},{H},{W}|{geoms_digest or geometries_key(geoms)}"
+            cache_path = os.path.join(label_cache_dir, f"labels_{hashlib.sha1(grid.encode()).hexdigest()[:20]}.npy")
+            if os.path.exists(cache_path):
+                labels_mm = np.load(cache_path, mmap_mode="r")
+                meta["label_cache"] = "hit"
+            else:
+                os.makedirs(label_cache_dir, exist_ok=True)
+                tmp_path = f"{cache_path}.{os.getpid()}.tmp.npy"
+                writer = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.int32, shape=(H, W))
+                meta["label_cache"] = "miss"
+        tree = STRtree(projected) if labels_mm is None else None
+        lut = np.zeros(n + 1, dtype=np.int64)
+
+        for r in range(0, H, block):
+            for c in range(0, W, block):
+                win = Window(col0 + c, row0 + r, min(block, W - c), min(block, H - r))
+                if labels_mm is not None:
+                    glabels = np.asarray(labels_mm[r:r + win.height, c:c + win.width])
+                    if not glabels.any():
+                        continue
+                else:
+                    wt = window_transform(win, ref.transform)
+                    x0, y1 = wt * (0, 0)
+                    x1, y0 = wt * (win.width, win.height)
+                    local = np.sort(tree.query(box(min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1)),
+                                               predicate="intersects"))
+                    if local.size == 0:
+                        continue
+                    labels = rasterize_labels(projected[local], (int(win.height), int(win.width)), wt)
+                    glabels = np.concatenate(([0], local + 1)).astype(np.int32)[labels]
+                    if tmp_path:
+                        writer[r:r + win.height, c:c + win.width] = glabels
+                meta["windows"] += 1
+                ndvi = _read_ndvi(srcs, win)
+                valid = (glabels > 0) & np.isfinite(ndvi)
+                lab = glabels[valid].astype(np.int64)
+                if lab.size == 0:
+                    continue
+                v = ndvi[valid].astype(np.float64)
+                meta["pixels"] += int(lab.size)
+                # Compact the global labels present here to 1..m so per-window arrays stay small
+                present = np.flatnonzero(np.bincount(lab, minlength=n + 1))
+                lut[present] = np.arange(present.size)
+                loc = lut[lab]
+                m = present.size
+                ids = present - 1
+                count[ids] += np.bincount(loc, minlength=m)
+                s1[ids] += np.bincount(loc, weights=v, minlength=m)
+                s2[ids] += np.bincount(loc, weights=v * v, minlength=m)
+                b = np.clip(((v + 1.0) * (bins / 2.0)).astype(np.int64), 0, bins - 1)
+                hist[ids] += np.bincount(loc * bins + b, minlength=m * bins).reshape(m, bins).astype(np.uint32)
+
+        if tmp_path:
+            writer.flush()
+            del writer
+            os.replace(tmp_path, cache_path)
+
+    meta["elapsed_s"] = round(time.perf_counter() - t0, 3)
+    return {"count": count, **_finish(count, s1, s2, hist, percentiles), "meta": meta}
+
+
+def _finish(count, s1, s2, hist, percentiles) -> Dict[str, np.ndarray]:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = np.where(count > 0, s1 / np.maximum(count, 1), np.nan)
+        var = np.where(count > 0, s2 / np.maximum(count, 1) - mean * mean, np.nan)
+    out = {"mean": mean, "std": np.sqrt(np.maximum(var, 0.0))}
+    for q, vals in zip(percentiles, hist_percentiles(hist, count, percentiles)):
+        out[f"p{int(q)}"] = vals
+    return out
+
+
+def rank_hotspots(ids: Sequence[str], stats: Dict, threshold: float, min_pixels: int = 1,
+                  limit: Optional[int] = None) -> Tuple[List[Dict], int]:
+    """Fields with mean NDVI below `threshold`, lowest first; returns (hotspots[:limit], total)."""
+    mean, count = stats["mean"], stats["count"]
+    hit = np.flatnonzero((count >= max(1, min_pixels)) & (mean < threshold))
+    order = hit[np.argsort(mean[hit], kind="stable")]
+    total = int(order.size)
+    if limit is not None:
+        order = order[:limit]
+    pcols = [k for k in stats if k.startswith("p") and k[1:].isdigit()]
+    out = []
+    for rank, i in enumerate(order, 1):
+        row = {"rank": rank, "field_id": ids[i], "ndvi": round(float(mean[i]), 4),
+               "ndvi_std": round(float(stats["std"][i]), 4), "pixels": int(count[i]),
+               "deficit": round(float(threshold - mean[i]), 4)}
+        for k in pcols:
+            row[f"ndvi_{k}"] = round(float(stats[k][i]), 4)
+        out.append(row)
+    return out, total
+
+
+class NdviEngine:
+    """Scene lookup plus a small LRU of per-field stats keyed by scene file and field set."""
+
+    def __init__(self, root: Optional[str], block: int = 1024, bins: int = 100,
+                 label_cache_dir: Optional[str] = None, max_results: int = 8):
+        self.root = root
+        self.block = block
+        self.bins = bins
+        self.label_cache_dir = label_cache_dir
+        self.max_results = max_results
+        self._results: "OrderedDict[Tuple, Dict]" = OrderedDict()
+        self._digests: Dict[int, str] = {}
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def scene(self, sat_source: str, date: str) -> Optional[Dict[str, str]]:
+        return find_scene(self.root, sat_source, date)
+
+    def stats(self, registry, scene: Dict[str, str]) -> Dict:
+        digest = self._digests.get(id(registry))
+        if digest is None:
+            digest = self._digests[id(registry)] = geometries_key(registry.geoms)
+        key = (_scene_signature(scene), digest)
+        with self._lock:
+            cached = self._results.get(key)
+            if cached is not None:
+                self._results.move_to_end(key)
+                self.hits += 1
+                return cached
+        self.misses += 1
+        result = zonal_ndvi(registry.geoms, scene, block=self.block, bins=self.bins,
+                            label_cache_dir=self.label_cache_dir, geoms_digest=digest)
+        with self._lock:
+            self._results[key] = result
+            while len(self._results) > self.max_results:
+                self._results.popitem(last=False)
+        return result
@@ -0,0 +1,171 @@
+"""Network definitions for the served models (must match the training code).
+
+Imported only when a model is actually loaded, so importing backend.app.main
+does not pull in torch.
+"""
+import torch
+import torch.nn as nn
+
+
+class FeatureTokenizer(nn.Module):
+    def __init__(self, n_cont, d_model):
+        super().__init__()
+        self.linears = nn.ModuleList([nn.Linear(1, d_model) for _ in range(n_cont)])
+    def forward(self, x):
+        tokens = []
+        for j, lin in enumerate(self.linears):
+            tok = lin(x[:, j:j+1])
+            tokens.append(tok)
+        return torch.stack(tokens, dim=1)
+
+
+class FTTransformer(nn.Module):
+    def __init__(self, n_cont, n_cat, d_model=64, nhead=4, nlayers=2, dropout=0.1):
+        super().__init__()
+        self.cls = nn.Parameter(torch.randn(1,1,d_model))
+        self.cont_tok = FeatureTokenizer(n_cont, d_model)
+        self.cat_emb = nn.Embedding(n_cat, d_model)
+        enc_layer = nn.TransformerEncoderLayer(d_model=d_model, nhead=nhead, dim_feedforward=256, dropout=dropout, batch_first=True)
+        self.encoder = nn.TransformerEncoder(enc_layer, num_layers=nlayers)
+        self.head = nn.Sequential(nn.LayerNorm(d_model), nn.Linear(d_model, 1))
+    def forward(self, x_cont, x_cat):
+        B = x_cont.size(0)
+        cont_tokens = self.cont_tok(x_cont)
+        cat_token = self.cat_emb(x_cat).unsqueeze(1)
+        tokens = torch.cat([cont_tokens, cat_token], dim=1)
+        cls = self.cls.expand(B, -1, -1)
+        seq = torch.cat([cls, tokens], dim=1)
+        enc = self.encoder(seq)
+        cls_out = enc[:,0,:]
+        return self.head(cls_out)
+
+
+class DoubleConv(nn.Module):
+    def __init__(self, in_ch, out_ch):
+        super().__init__()
+        self.seq = nn.Sequential(
+            nn.Conv2d(in_ch, out_ch, 3, padding=1), nn.BatchNorm2d(out_ch), nn.ReLU(inplace=True),
+            nn.Conv2d(out_ch, out_ch, 3, padding=1), nn.BatchNorm2d(out_ch), nn.ReLU(inplace=True),
+        )
+    def forward(self, x):
+        return self.seq(x)
+
+
+class UNetSmall(nn.Module):
+    def __init__(self, in_ch=2, out_ch=1):
+        super().__init__()
+        self.down1 = DoubleConv(in_ch, 32)
+        self.pool1 = nn.MaxPool2d(2)
+        self.down2 = DoubleConv(32, 64)
+        self.pool2 = nn.MaxPool2d(2)
+        self.down3 = DoubleConv(64, 128)
+        self.pool3 = nn.MaxPool2d(2)
+        self.bott = DoubleConv(128, 256)
+        self.up3 = nn.ConvTranspose2d(256, 128, 2, stride=2)
+        self.conv3 = DoubleConv(256, 128)
+        self.up2 = nn.ConvTranspose2d(128, 64, 2, stride=2)
+        self.conv2 = DoubleConv(128, 64)
+        self.up1 = nn.ConvTranspose2d(64, 32, 2, stride=2)
+        self.conv1 = DoubleConv(64, 32)
+        self.outc = nn.Conv2d(32, out_ch, 1)
+    def forward(self, x):
+        d1 = self.down1(x); p1 = self.pool1(d1)
+        d2 = self.down2(p1); p2 = self.pool2(d2)
+        d3 = self.down3(p2); p3 = self.pool3(d3)
+        b = self.bott(p3)
+        u3 = self.up3(b); c3 = self.conv3(torch.cat([u3, d3], dim=1))
+        u2 = self.up2(c3); c2 = self.conv2(torch.cat([u2, d2], dim=1))
+        u1 = self.up1(c2); c1 = self.conv1(torch.cat([u1, d1], dim=1))
+        return self.outc(c1)
+
+
+def iou_score(pred, target, thr=0.5, eps=1e-6):
+    """Mean IoU of thresholded logits `pred` against a 0/1 `target`, both (B,1,H,W)."""
+    pred_bin = (torch.sigmoid(pred) > thr).float()
+    inter = (pred_bin * target).sum(dim=(1,2,3))
+    union = pred_bin.sum(dim=(1,2,3)) + target.sum(dim=(1,2,3)) - inter
+    return ((inter + eps) / (union + eps)).mean().item()
+
+
+def fold_batchnorm(model: nn.Module) -> nn.Module:
+    """Fold each eval-mode Conv2d -> BatchNorm2d pair into a single Conv2d (in place).
+
+    The BatchNorm slot becomes an Identity, so the folded model exports and
+    runs as plain Conv+ReLU chains. Use on an eval() model only.
+    """
+    from torch.nn.utils.fusion import fuse_conv_bn_eval
+    for m in model.modules():
+        if isinstance(m, nn.Sequential):
+            for i in range(len(m) - 1):
+                if isinstance(m[i], nn.Conv2d) and isinstance(m[i + 1], nn.BatchNorm2d):
+                    m[i] = fuse_conv_bn_eval(m[i], m[i + 1])
+                    m[i + 1] = nn.Identity()
+    return model
+
+
+class LinearAttentionLayer(nn.Module):
+    """Inference copy of a batch_first nn.TransformerEncoderLayer with the attention
+    projections as separate nn.Linear modules (dropout dropped)."""
+
+    def __init__(self, layer: nn.TransformerEncoderLayer):
+        super().__init__()
+        attn = layer.self_attn
+        if not (attn.batch_first and attn._qkv_same_embed_dim):
+            raise ValueError("LinearAttentionLayer needs batch_first attention with packed q/k/v weights")
+        d = attn.embed_dim
+        self.nhead = attn.num_heads
+        self.norm_first = layer.norm_first
+        self.q, self.k, self.v = nn.Linear(d, d), nn.Linear(d, d), nn.Linear(d, d)
+        self.out = nn.Linear(d, d)
+        with torch.no_grad():
+            for i, lin in enumerate((self.q, self.k, self.v)):
+                lin.weight.copy_(attn.in_proj_weight[i * d:(i + 1) * d])
+                lin.bias.copy_(attn.in_proj_bias[i * d:(i + 1) * d])
+            self.out.weight.copy_(attn.out_proj.weight)
+            self.out.bias.copy_(attn.out_proj.bias)
+        self.linear1, self.linear2 = layer.linear1, layer.linear2
+        self.norm1, self.norm2 = layer.norm1, layer.norm2
+        self.activation = layer.activation
+
+    def _attn(self, x, bias):
+        B, T, D = x.shape
+        heads = lambda t: t.view(B, T, self.nhead, D // self.nhead).transpose(1, 2)
+        y = torch.nn.functional.scaled_dot_product_attention(heads(self.q(x)), heads(self.k(x)), heads(self.v(x)),
+                                                             attn_mask=bias)
+        return self.out(y.transpose(1, 2).reshape(B, T, D))
+
+    def _ff(self, x):
+        return self.linear2(self.activation(self.linear1(x)))
+
+    def forward(self, x, bias=None):
+        if self.norm_first:
+            x = x + self._attn(self.norm1(x), bias)
+            return x + self._ff(self.norm2(x))
+        x = self.norm1(x + self._attn(x, bias))
+        return self.norm2(x + self._ff(x))
+
+
+class LinearAttentionEncoder(nn.Module):
+    """Drop-in for an eval-mode nn.TransformerEncoder built from LinearAttentionLayer.
+
+    nn.MultiheadAttention keeps q/k/v as one raw parameter, so dynamic int8
+    quantization never touches it, and the fused encoder fast path needs fp32
+    weights. Here every projection is an nn.Linear that quantize_dynamic can
+    rewrite.
+    """
+
+    def __init__(self, encoder: nn.TransformerEncoder):
+        super().__init__()
+        self.layers = nn.ModuleList(LinearAttentionLayer(l) for l in encoder.layers)
+        self.norm = encoder.norm
+
+    def forward(self, src, mask=None, src_key_padding_mask=None, is_causal=None):
+        # As in nn.MultiheadAttention: bool masks are True where attention is blocked, float masks are added
+        bias = None
+        for m in (mask, None if src_key_padding_mask is None else src_key_padding_mask[:, None, None, :]):
+            if m is not None:
+                m = torch.zeros(m.shape, dtype=src.dtype).masked_fill(m, float("-inf")) if m.dtype == torch.bool else m
+                bias = m if bias is None else bias + m
+        for layer in self.layers:
+            src = layer(src, bias)
+        return src if self.norm is None else self.norm(src)
@@ -0,0 +1,308 @@
+"""XYZ PNG tile pyramid of U-Net flood outputs.
+
+Segmentations with known bounds are resampled into web-mercator 256 px tiles
+under <root>/<kind>/<z>/<x>/<y>.png, for two kinds:
+
+    prob   flood probability, alpha = p * 255
+    mask   thresholded mask, alpha = 160 where flooded
+
+Both are palette PNGs with one colour and 256 alpha levels, so a tile is 1
+byte per pixel before compression and draws as-is in Leaflet. The value can be
+recovered from the palette index.
+
+- The base level is the scene's native zoom: the first zoom whose pixels are
+  no larger than the scene's, capped at max_zoom. Pixels are sampled nearest
+  from the lon/lat grid of the segmentation (the same from_bounds frame as
+  everywhere else). Only pixels the new scene covers are replaced, so
+  overlapping scenes composite and the newest one wins.
+- Overviews down to min_zoom are 2x2 means of the children. Only the
+  overview pixels above changed pixels are recomputed, and unchanged children
+  count with the overview's previous value, so a finer scene composites over a
+  coarser scene's base level instead of erasing it. A zoomed-out mask tile
+  therefore shows flooded fraction as opacity rather than dropping small floods.
+- Fully transparent tiles are not stored; readers get None and serve an empty
+  tile. Files are replaced atomically. Writers hold a lock file, so several
+  worker processes can feed the same pyramid.
+- add() runs inline; submit() queues it on a per-process background thread
+  so segmentation responses don't wait for tile I/O. At most max_pending
+  scenes wait in that queue; beyond that submit() drops the scene (counted in
+  stats) instead of letting queued arrays pile up in memory.
+
+Run `python -m backend.app.pyramid add probs.npy --bounds S W N E` to load
+saved outputs, or `python -m backend.app.pyramid info` to see what is stored.
+"""
+import argparse
+import io
+import math
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .mvt import lonlat_range, tile_lonlat_bounds
+
+KINDS = ("prob", "mask")
+TILE = 256
+COLOR = (37, 99, 235)
+MASK_ALPHA = 160
+
+
+def native_zoom(bounds: Sequence[float], width: int, max_zoom: int = 18) -> int:
+    """First zoom whose 256 px tiles are at least as fine as `width` pixels across the bounds."""
+    south, west, north, east = bounds
+    deg_per_px = max(east - west, 1e-12) / max(int(width), 1)
+    return int(min(max_zoom, max(0, math.ceil(math.log2(360.0 / (TILE * deg_per_px))))))
+
+
+def encode_png(alpha: np.ndarray) -> bytes:
+    from PIL import Image
+    img = Image.fromarray(np.ascontiguousarray(alpha, dtype=np.uint8), mode="P")
+    img.putpalette(list(COLOR) * 256)
+    buf = io.BytesIO()
+    img.save(buf, format="PNG", transparency=bytes(range(256)), optimize=False, compress_level=6)
+    return buf.getvalue()
+
+
+def decode_png(data: bytes) -> np.ndarray:
+    from PIL import Image
+    return np.array(Image.open(io.BytesIO(data)), dtype=np.uint8)
+
+
+@lru_cache(maxsize=1)
+def empty_png() -> bytes:
+    return encode_png(np.zeros((TILE, TILE), dtype=np.uint8))
+
+
+def resample(values: np.ndarray, bounds: Sequence[float], z: int, x: int, y: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Nearest-neighbour sample of a lon/lat grid onto one tile: (values, covered mask)."""
+    south, west, north, east = bounds
+    H, W = values.shape
+    tw, _, te, _ = tile_lonlat_bounds(z, x, y)
+    lon = tw + (np.arange(TILE) + 0.5) / TILE * (te - tw)
+    ty = y + (np.arange(TILE) + 0.5) / TILE
+    lat = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * ty / 2 ** z))))
+    col = np.floor((lon - west) / (east - west) * W).astype(np.int64)
+    row = np.floor((north - lat) / (north - south) * H).astype(np.int64)
+    col_ok, row_ok = (col >= 0) & (col < W), (row >= 0) & (row < H)
+    out = values[np.clip(row, 0, H - 1)[:, None], np.clip(col, 0, W - 1)[None, :]]
+    return out, row_ok[:, None] & col_ok[None, :]
+
+
+class FloodPyramid:
+    def __init__(self, root: str, min_zoom: int = 6, max_zoom: int = 18, max_pending: int = 4):
+        self.root = root
+        self.min_zoom = min_zoom
+        self.max_zoom = max_zoom
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._pool_pid = None
+        self._pending = 0
+        self.scenes = self.tiles_written = self.tiles_removed = self.errors = self.dropped = 0
+        self.write_ms = 0.0
+        self.last_error: Optional[str] = None
+
+    def path(self, kind: str, z: int, x: int, y: int) -> str:
+        return os.path.join(self.root, kind, str(z), str(x), f"{y}.png")
+
+    def tile(self, kind: str, z: int, x: int, y: int) -> Optional[Tuple[bytes, str]]:
+        """(PNG bytes, ETag) of a stored tile, or None when it is empty or was never written."""
+        try:
+            with open(self.path(kind, z, x, y), "rb") as f:
+                st = os.fstat(f.fileno())
+                return f.read(), f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+        except FileNotFoundError:
+            return None
+
+    def _read(self, kind: str, z: int, x: int, y: int) -> Optional[np.ndarray]:
+        hit = self.tile(kind, z, x, y)
+        return decode_png(hit[0]) if hit is not None else None
+
+    def _write(self, kind: str, z: int, x: int, y: int, alpha: np.ndarray):
+        path = self.path(kind, z, x, y)
+        if not alpha.any():
+            try:
+                os.remove(path)
+                self.tiles_removed += 1
+            except FileNotFoundError:
+                pass
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(encode_png(alpha))
+        os.replace(tmp, path)
+        self.tiles_written += 1
+
+    def _overview(self, kind: str, z: int, x: int, y: int,
+                  children: Dict[Tuple[int, int], Optional[np.ndarray]]) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """Recomposite tile (z, x, y) over its stored self from the changed pixels of its children.
+
+        `children` maps (dx, dy) to the child's changed-pixel mask (None = all of it). A child
+        pixel that did not change is taken to still hold what the parent already summarizes,
+        so data that only exists at this zoom (a coarser scene's base level) is kept.
+        Returns the tile and its own changed-pixel mask.
+        """
+        old = self._read(kind, z, x, y)
+        old = np.zeros((TILE, TILE), dtype=np.uint8) if old is None else old
+        quad = np.repeat(np.repeat(old, 2, axis=0), 2, axis=1).astype(np.float32)
+        changed = np.zeros((2 * TILE, 2 * TILE), dtype=bool)
+        for (dx, dy), cov in children.items():
+            child = self._read(kind, z + 1, 2 * x + dx, 2 * y + dy)
+            if child is None:
+                child = np.zeros((TILE, TILE), dtype=np.uint8)
+            rows, cols = slice(dy * TILE, (dy + 1) * TILE), slice(dx * TILE, (dx + 1) * TILE)
+            if cov is None:
+                quad[rows, cols] = child
+                changed[rows, cols] = True
+            else:
+                quad[rows, cols][cov] = child[cov]
+                changed[rows, cols] = cov
+        mean = np.rint(quad.reshape(TILE, 2, TILE, 2).mean(axis=(1, 3))).astype(np.uint8)
+        cov = changed.reshape(TILE, 2, TILE, 2).any(axis=(1, 3))
+        if cov.all():
+            return mean, None
+        return np.where(cov, mean, old), cov
+
+    def _file_lock(self):
+        os.makedirs(self.root, exist_ok=True)
+        f = open(os.path.join(self.root, ".lock"), "a+")
+        try:
+            import fcntl
+            fcntl.flock(f, fcntl.LOCK_EX)
+        except ImportError:  # no cross-process lock on this platform; the thread lock still applies
+            pass
+        return f
+
+    def add(self, bounds: Sequence[float], mask: Optional[np.ndarray] = None,
+            prob: Optional[np.ndarray] = None) -> Dict:
+        """Write one scene's mask (0/1) and/or probabilities (float 0..1 or uint8 0..255) into the pyramid."""
+        layers = {}
+        if prob is not None:
+            layers["prob"] = prob if prob.dtype == np.uint8 else np.rint(np.clip(prob, 0, 1) * 255).astype(np.uint8)
+        if mask is not None:
+            layers["mask"] = np.where(np.asarray(mask).astype(bool), MASK_ALPHA, 0).astype(np.uint8)
+        if not layers:
+            return {"zoom": None, "tiles": 0}
+        south, west, north, east = (float(b) for b in bounds)
+        if not (south < north and west < east):
+            raise ValueError("Expected south < north and west < east")
+        width = next(iter(layers.values())).shape[1]
+        z = max(self.min_zoom, native_zoom((south, west, north, east), width, self.max_zoom))
+        x0, y0, x1, y1 = lonlat_range(z, west, south, east, north)
+        t0 = time.perf_counter()
+        written = 0
+        with self._lock, self._file_lock():
+            for kind, values in layers.items():
+                # (x, y) -> pixels of that tile this scene changed (None = the whole tile)
+                touched: Dict[Tuple[int, int], Optional[np.ndarray]] = {}
+                for x in range(x0, x1 + 1):
+                    for y in range(y0, y1 + 1):
+                        tile, covered = resample(values, (south, west, north, east), z, x, y)
+                        if not covered.any():
+                            continue
+                        base = self._read(kind, z, x, y)
+                        if base is None:
+                            base = np.zeros((TILE, TILE), dtype=np.uint8)
+                        base[covered] = tile[covered]
+                        self._write(kind, z, x, y, base)
+                        touched[(x, y)] = None if covered.all() else covered
+                written += len(touched)
+                for zz in range(z - 1, self.min_zoom - 1, -1):
+                    parents: Dict[Tuple[int, int], Dict[Tuple[int, int], Optional[np.ndarray]]] = {}
+                    for (x, y), cov in touched.items():
+                        parents.setdefault((x // 2, y // 2), {})[(x % 2, y % 2)] = cov
+                    touched = {}
+                    for (x, y), children in parents.items():
+                        tile, touched[(x, y)] = self._overview(kind, zz, x, y, children)
+                        self._write(kind, zz, x, y, tile)
+                    written += len(touched)
+        self.scenes += 1
+        self.write_ms += (time.perf_counter() - t0) * 1000.0
+        return {"zoom": z, "tiles": written}
+
+    def submit(self, bounds: Sequence[float], mask: Optional[np.ndarray] = None,
+               prob: Optional[np.ndarray] = None) -> Optional[Future]:
+        """add() on this process's background writer thread, or None (dropped) when the queue is full."""
+        with self._lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="flood-pyramid")
+                self._pool_pid = os.getpid()
+                self._pending = 0
+            if self._pending >= self.max_pending:
+                self.dropped += 1
+                return None
+            self._pending += 1
+        fut = self._pool.submit(self.add, bounds, mask, prob)
+        fut.add_done_callback(self._done)
+        return fut
+
+    def full(self) -> bool:
+        """True when submit() would drop the next scene (lets callers skip building its arrays)."""
+        return self._pending >= self.max_pending and self._pool_pid == os.getpid()
+
+    def _done(self, fut: Future):
+        with self._lock:
+            self._pending -= 1
+        if fut.exception() is not None:
+            self.errors += 1
+            self.last_error = f"{type(fut.exception()).__name__}: {fut.exception()}"
+
+    def close(self):
+        if self._pool is not None and self._pool_pid == os.getpid():
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+    def levels(self, kinds: Iterable[str] = KINDS) -> Dict[str, Dict[str, int]]:
+        """Stored tile count per kind and zoom (walks the directory tree)."""
+        out = {}
+        for kind in kinds:
+            base = os.path.join(self.root, kind)
+            zooms = {}
+            for z in sorted(os.listdir(base), key=int) if os.path.isdir(base) else ():
+                zooms[z] = sum(len([n for n in files if n.endswith(".png")])
+                               for _, _, files in os.walk(os.path.join(base, z)))
+            out[kind] = zooms
+        return out
+
+    def stats(self) -> Dict:
+        return {"root": self.root, "min_zoom": self.min_zoom, "max_zoom": self.max_zoom, "scenes": self.scenes,
+                "tiles_written": self.tiles_written, "tiles_removed": self.tiles_removed,
+                "avg_scene_ms": round(self.write_ms / self.scenes, 1) if self.scenes else 0.0,
+                "pending": self._pending, "max_pending": self.max_pending, "dropped": self.dropped,
+                "errors": self.errors, "last_error": self.last_error}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Flood tile pyramid (XYZ PNG) from segmentation outputs")
+    ap.add_argument("--root", default=os.getenv("FLOOD_TILES_DIR", os.path.join("data", "flood_tiles")))
+    ap.add_argument("--min-zoom", type=int, default=int(os.getenv("FLOOD_TILES_MIN_ZOOM", "6")))
+    ap.add_argument("--max-zoom", type=int, default=int(os.getenv("FLOOD_TILES_MAX_ZOOM", "18")))
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    add = sub.add_parser("add", help="add (H,W) probabilities or a 0/1 mask saved as .npy")
+    add.add_argument("npy")
+    add.add_argument("--bounds", type=float, nargs=4, required=True, metavar=("SOUTH", "WEST", "NORTH", "EAST"))
+    add.add_argument("--threshold", type=float, default=0.5, help="mask cut for probability inputs")
+    sub.add_parser("info", help="tile counts per zoom")
+    args = ap.parse_args(argv)
+    pyr = FloodPyramid(args.root, args.min_zoom, args.max_zoom)
+    if args.cmd == "info":
+        print(pyr.levels())
+        return
+    arr = np.load(args.npy)
+    if arr.ndim != 2:
+        raise SystemExit("expected a (H, W) array")
+    is_mask = arr.dtype == np.bool_ or (np.issubdtype(arr.dtype, np.integer) and arr.max(initial=0) <= 1)
+    if is_mask:
+        res = pyr.add(args.bounds, mask=arr)
+    else:
+        res = pyr.add(args.bounds, mask=arr > args.threshold, prob=arr)
+    print(f"[pyramid] base zoom {res['zoom']}, {res['tiles']} tiles written to {args.root}")
+
+
+if __name__ == "__main__":
+    main()
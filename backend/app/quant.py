@@ -0,0 +1,96 @@
+"""Post-training int8 quantization for CPU serving (INFERENCE_QUANT).
+
+    none     fp32 (default)
+    dynamic  FT-Transformer nn.Linear layers, attention projections included
+             -> dynamic int8 (int8 weights, activations quantized per batch).
+             Convolutions have no dynamic int8 kernels, so the U-Net stays fp32.
+    static   dynamic FT-Transformer + static int8 U-Net (FX graph mode, Conv+BN+ReLU
+             fused) calibrated on tiles sampled from processed/
+
+Quantized models run in eager PyTorch, so a quant mode takes precedence over
+INFERENCE_BACKEND. nn.MultiheadAttention packs q/k/v into one raw parameter
+that dynamic quantization does not rewrite, so the encoder is first rebuilt as
+nets.LinearAttentionEncoder, where every projection is an nn.Linear. Accuracy
+and latency against fp32 are measured by quant_report.py.
+"""
+import os
+import random
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+QUANT_MODES = ("none", "dynamic", "static")
+
+
+def select_engine(preferred: Optional[str] = None) -> str:
+    """Set and return the quantized kernel backend (x86 > fbgemm > qnnpack unless `preferred` is supported)."""
+    import torch
+    supported = torch.backends.quantized.supported_engines
+    for engine in ([preferred] if preferred else []) + ["x86", "fbgemm", "qnnpack"]:
+        if engine in supported:
+            torch.backends.quantized.engine = engine
+            return engine
+    raise RuntimeError(f"No int8 engine available (supported: {supported})")
+
+
+def quantize_ft_dynamic(model, engine: Optional[str] = None):
+    """Dynamic int8 FT-Transformer. Rebuilds `model`'s encoders in place before quantizing a copy."""
+    import torch
+    from torch.ao.quantization import quantize_dynamic
+    from .nets import LinearAttentionEncoder
+    select_engine(engine)
+    model.eval()
+    for parent in list(model.modules()):
+        for name, child in parent.named_children():
+            if isinstance(child, torch.nn.TransformerEncoder):
+                setattr(parent, name, LinearAttentionEncoder(child).eval())
+    return quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def quantize_unet_static(model, calibration: Iterable[np.ndarray], engine: Optional[str] = None):
+    """FX static int8 U-Net. `model` must be the eval-mode, un-folded fp32 net; calibration yields (2,H,W) tiles."""
+    import torch
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+    engine = select_engine(engine)
+    prepared = prepare_fx(model.eval(), get_default_qconfig_mapping(engine), (torch.zeros(1, 2, 256, 256),))
+    n = 0
+    with torch.no_grad():
+        for tile in calibration:
+            prepared(torch.from_numpy(np.ascontiguousarray(tile, dtype=np.float32))[None])
+            n += 1
+    if n == 0:
+        raise RuntimeError("Static quantization needs calibration tiles; none found under processed/")
+    return convert_fx(prepared)
+
+
+def sample_tiles(catalog, store, project_root: str, n: int, seed: int = 0) -> List[Tuple[np.ndarray, Optional[np.ndarray]]]:
+    """Up to n random (image, mask or None) tiles listed in the manifests, read from the tile store when packed."""
+    rows = list(catalog.snapshot().rows)
+    random.Random(seed).shuffle(rows)
+    out = []
+    for r in rows:
+        if len(out) >= n:
+            break
+        tid = str(r.get("id"))
+        if store is not None and tid in store:
+            img, msk = store.image(tid), store.mask(tid)
+        else:
+            path = _resolve(project_root, r.get("image_path"))
+            if path is None:
+                continue
+            img = np.load(path, mmap_mode="r")
+            mpath = _resolve(project_root, r.get("mask_path"))
+            msk = np.load(mpath) if mpath else None
+        if img.ndim == 3 and img.shape[0] == 2:
+            out.append((np.asarray(img, dtype=np.float32), msk))
+    return out
+
+
+def _resolve(root: str, path) -> Optional[str]:
+    if not path or (isinstance(path, float) and np.isnan(path)):
+        return None
+    for p in (str(path), os.path.join(root, str(path))):
+        if os.path.exists(p):
+            return p
+    return None
@@ -0,0 +1,67 @@
+"""Lazily loaded models and other heavy resources.
+
+Each entry is a loader run at most once: on the first get(), or ahead of time
+by the warmup thread. A loader returns the resource, or None when it is
+unavailable (missing artifacts or dependency). Exceptions are recorded and
+reported as state "error". Concurrent first callers wait for the single load.
+"""
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional
+
+
+class _Entry:
+    def __init__(self, loader: Callable[[], Any]):
+        self.loader = loader
+        self.lock = threading.Lock()
+        self.state = "cold"  # cold | loading | ready | unavailable | error
+        self.value = None
+        self.error: Optional[str] = None
+        self.load_ms: Optional[float] = None
+
+
+class LazyRegistry:
+    def __init__(self):
+        self._entries: Dict[str, _Entry] = {}
+        self._warmup: Optional[threading.Thread] = None
+
+    def register(self, name: str, loader: Callable[[], Any]):
+        self._entries[name] = _Entry(loader)
+
+    def get(self, name: str):
+        """The loaded resource (loading it now if needed), or None if unavailable."""
+        e = self._entries[name]
+        if e.state in ("cold", "loading"):
+            with e.lock:
+                if e.state in ("cold", "loading"):
+                    e.state = "loading"
+                    t0 = time.perf_counter()
+                    try:
+                        e.value = e.loader()
+                        e.state = "ready" if e.value is not None else "unavailable"
+                    except Exception as ex:
+                        e.value, e.state, e.error = None, "error", f"{type(ex).__name__}: {ex}"
+                    e.load_ms = round((time.perf_counter() - t0) * 1000.0, 1)
+        return e.value
+
+    def loaded(self, name: str) -> bool:
+        """True once the resource is ready; never triggers a load."""
+        return self._entries[name].state == "ready"
+
+    def warmup(self, names: Optional[Iterable[str]] = None) -> threading.Thread:
+        """Load `names` (default: everything) in a background daemon thread."""
+        names = list(names) if names is not None else list(self._entries)
+
+        def run():
+            for n in names:
+                self.get(n)
+
+        self._warmup = threading.Thread(target=run, name="model-warmup", daemon=True)
+        self._warmup.start()
+        return self._warmup
+
+    def warming(self) -> bool:
+        return self._warmup is not None and self._warmup.is_alive()
+
+    def status(self) -> Dict[str, dict]:
+        return {n: {"state": e.state, "load_ms": e.load_ms, "error": e.error} for n, e in self._entries.items()}
@@ -0,0 +1,324 @@
+"""Claim PDF reports: content-addressed cache and a background render pool.
+
+A report is keyed by claim_key(claim): SHA-256 of the canonical JSON of the
+claim record plus TEMPLATE_VERSION. Identical claim data therefore renders
+once, and any change (status, payout, evidence_hash, ...) produces a new key
+without explicit invalidation. Rendering uses ReportLab's invariant mode, so
+the same key always yields byte-identical PDFs and the key doubles as a strong
+ETag.
+
+ReportLab is pure Python and holds the GIL. Renders run on a process pool
+(`workers` processes, started lazily through forkserver so the server's
+threads and loaded models are never forked). With workers=0 they run on a
+single background thread instead, for hosts without multiprocessing
+(Lambda/Netlify). Concurrent requests for the same key share one render.
+
+Finished PDFs live in a byte-bounded in-memory LRU, optionally backed by
+`disk_dir` (written atomically, served straight from the file).
+"""
+import asyncio
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import threading
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import AsyncIterator, Dict, Iterable, Iterator, Optional, Tuple, Union
+
+TEMPLATE_VERSION = 2
+CHUNK = 64 * 1024
+
+
+def claim_key(claim: Dict) -> str:
+    payload = json.dumps({"template": TEMPLATE_VERSION, "claim": claim}, sort_keys=True,
+                         separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _show(value, fmt: str = "{}") -> str:
+    return "—" if value is None else fmt.format(value)
+
+
+def render_claim_pdf(claim_data: Dict) -> bytes:
+    """The claim report as PDF bytes (runs in the render pool)."""
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib import colors
+    from reportlab.lib.units import inch
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+
+    buffer = io.BytesIO()
+    # invariant: fixed creation date and document ID, so equal claims give equal bytes
+    doc = SimpleDocTemplate(buffer, pagesize=A4, invariant=1, title=f"Claim {claim_data['claim_id']}")
+    story = []
+    styles = getSampleStyleSheet()
+
+    # Title
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=24,
+        textColor=colors.HexColor('#10b981'),
+        spaceAfter=30,
+        alignment=1
+    )
+    story.append(Paragraph("YES-Scan Apex", title_style))
+    story.append(Paragraph("Flood Insurance Claim Report", styles['Heading2']))
+    story.append(Spacer(1, 0.5*inch))
+
+    # Claim details table
+    data = [
+        ['Claim Information', ''],
+        ['Claim ID:', claim_data['claim_id']],
+        ['Field ID:', claim_data['field_id']],
+        ['Model Run:', _show(claim_data.get('model_run_id'))],
+        ['Status:', claim_data['status']],
+        ['Timestamp:', claim_data['timestamp']],
+        ['', ''],
+        ['Farmer Information', ''],
+        ['Name:', _show(claim_data['farmer_name'])],
+        ['Phone:', _show(claim_data['farmer_phone'])],
+        ['Location:', _show(claim_data['location'])],
+        ['Farm Area:', _show(claim_data['area_ha'], '{} hectares')],
+        ['Crop Type:', claim_data['crop_type']],
+        ['', ''],
+        ['Assessment Results', ''],
+        ['Flood Affected Area:', _show(claim_data['flooded_pct'], '{}%')],
+        ['Model Confidence:', _show(claim_data['confidence'], '{}%')],
+        ['Evidence Hash (SHA-256):', claim_data['evidence_hash'][:32] + '...'],
+        ['', ''],
+        ['Claim Settlement', ''],
+        ['Approved Payout:', _show(claim_data['payout_amount'], '₹{:,.0f}')],
+    ]
+
+    table = Table(data, colWidths=[2.5*inch, 4*inch])
+    table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#10b981')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 12),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 7), (-1, 7), colors.HexColor('#10b981')),
+        ('TEXTCOLOR', (0, 7), (-1, 7), colors.whitesmoke),
+        ('BACKGROUND', (0, 14), (-1, 14), colors.HexColor('#10b981')),
+        ('TEXTCOLOR', (0, 14), (-1, 14), colors.whitesmoke),
+        ('BACKGROUND', (0, 19), (-1, 19), colors.HexColor('#10b981')),
+        ('TEXTCOLOR', (0, 19), (-1, 19), colors.whitesmoke),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+        ('FONTNAME', (0, 1), (0, -1), 'Helvetica-Bold'),
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+    ]))
+
+    story.append(table)
+    story.append(Spacer(1, 0.5*inch))
+
+    # Footer
+    footer = Paragraph(
+        "<i>This report is generated by YES-Scan Apex AI system and verified by field officers. "
+        "For queries, contact support@yesscan.in</i>",
+        styles['Normal']
+    )
+    story.append(footer)
+
+    doc.build(story)
+    return buffer.getvalue()
+
+
+class PdfCache:
+    """Byte-bounded LRU of rendered PDFs by key, with an optional on-disk tier."""
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024, disk_dir: Optional[str] = None):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self._lru: "OrderedDict[str, bytes]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.disk_hits = self.misses = self.evictions = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.pdf")
+
+    def get(self, key: str) -> Union[bytes, str, None]:
+        """PDF bytes, the path of the on-disk copy, or None."""
+        with self._lock:
+            pdf = self._lru.get(key)
+            if pdf is not None:
+                self._lru.move_to_end(key)
+                self.hits += 1
+                return pdf
+        if self.disk_dir and os.path.exists(self._path(key)):
+            self.disk_hits += 1
+            return self._path(key)
+        self.misses += 1
+        return None
+
+    def put(self, key: str, pdf: bytes):
+        with self._lock:
+            if key not in self._lru and len(pdf) <= self.max_bytes:
+                self._lru[key] = pdf
+                self._bytes += len(pdf)
+                while self._bytes > self.max_bytes:
+                    _, old = self._lru.popitem(last=False)
+                    self._bytes -= len(old)
+                    self.evictions += 1
+        if self.disk_dir and not os.path.exists(self._path(key)):
+            tmp = f"{self._path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(pdf)
+            os.replace(tmp, self._path(key))
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, used = len(self._lru), self._bytes
+        return {"entries": entries, "bytes": used, "max_bytes": self.max_bytes, "disk_dir": self.disk_dir,
+                "hits": self.hits, "disk_hits": self.disk_hits, "misses": self.misses, "evictions": self.evictions}
+
+
+class ReportRenderer:
+    def __init__(self, cache: PdfCache, workers: int = 2):
+        self.cache = cache
+        self.workers = max(0, int(workers))
+        self._pool = None
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, Future] = {}
+        self.rendered = self.coalesced = self.failed = 0
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                if self.workers > 0:
+                    methods = multiprocessing.get_all_start_methods()
+                    ctx = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+                    self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=ctx)
+                else:
+                    self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="report")
+            return self._pool
+
+    def submit(self, claim: Dict) -> Tuple[str, Future]:
+        """Queue a render unless cached or already in flight. The future yields bytes or a cache path."""
+        key = claim_key(claim)
+        cached = self.cache.get(key)
+        if cached is not None:
+            done: Future = Future()
+            done.set_result(cached)
+            return key, done
+        with self._lock:
+            fut = self._inflight.get(key)
+            if fut is not None:
+                self.coalesced += 1
+                return key, fut
+        pool = self._executor()
+        with self._lock:
+            fut = self._inflight.get(key)
+            if fut is not None:
+                self.coalesced += 1
+                return key, fut
+            fut = pool.submit(render_claim_pdf, claim)
+            self._inflight[key] = fut
+        fut.add_done_callback(lambda f, key=key: self._finish(key, f))
+        return key, fut
+
+    def _finish(self, key: str, fut: Future):
+        if fut.cancelled() or fut.exception() is not None:
+            self.failed += 1
+        else:
+            self.rendered += 1
+            self.cache.put(key, fut.result())
+        with self._lock:
+            self._inflight.pop(key, None)
+
+    def status(self, key: str) -> str:
+        with self._lock:
+            if key in self._inflight:
+                return "rendering"
+        return "ready" if self.cache.get(key) is not None else "missing"
+
+    async def render(self, claim: Dict) -> Tuple[str, Union[bytes, str]]:
+        key, fut = self.submit(claim)
+        return key, await asyncio.wrap_future(fut)
+
+    def close(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            inflight = len(self._inflight)
+        return {"workers": self.workers, "mode": "process" if self.workers else "thread", "inflight": inflight,
+                "rendered": self.rendered, "coalesced": self.coalesced, "failed": self.failed,
+                "cache": self.cache.stats()}
+
+
+def pdf_bytes(pdf: Union[bytes, str]) -> bytes:
+    if isinstance(pdf, str):
+        with open(pdf, "rb") as f:
+            return f.read()
+    return pdf
+
+
+def iter_pdf(pdf: Union[bytes, str]) -> Iterator[bytes]:
+    """Chunks of a rendered PDF, read incrementally when it is an on-disk cache file."""
+    if isinstance(pdf, str):
+        with open(pdf, "rb") as f:
+            while True:
+                chunk = f.read(CHUNK)
+                if not chunk:
+                    return
+                yield chunk
+    for i in range(0, len(pdf), CHUNK):
+        yield pdf[i:i + CHUNK]
+
+
+class _ZipSink:
+    """Write-only, unseekable target for zipfile; take() drains what has been written so far."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, b) -> int:
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def flush(self):
+        pass
+
+    def take(self) -> bytes:
+        out, self._chunks = b"".join(self._chunks), []
+        return out
+
+
+async def zip_reports(renderer: ReportRenderer, claims: Iterable[Dict]) -> AsyncIterator[bytes]:
+    """Stream a zip of claim_<id>.pdf files, each entry written as soon as its render completes.
+
+    A manifest.json listing claim_id, file name and cache key (plus any claims
+    that failed to render) closes the archive.
+    """
+    sink = _ZipSink()
+    manifest = {"reports": [], "failed": []}
+    jobs = {}
+    for claim in claims:
+        key, fut = renderer.submit(claim)
+        jobs[asyncio.wrap_future(fut)] = (claim["claim_id"], key)
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        pending = set(jobs)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                claim_id, key = jobs[task]
+                if task.exception() is not None:
+                    manifest["failed"].append({"claim_id": claim_id, "error": str(task.exception())})
+                    continue
+                name = f"claim_{claim_id}.pdf"
+                zf.writestr(name, pdf_bytes(task.result()))
+                manifest["reports"].append({"claim_id": claim_id, "file": name, "key": key})
+            yield sink.take()
+        zf.writestr("manifest.json", json.dumps(manifest, indent=2))
+    yield sink.take()
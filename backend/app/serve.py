@@ -0,0 +1,161 @@
+"""Pre-forking server: load models once and share them copy-on-write across worker processes.
+
+    python -m backend.app.serve --workers 8 --port 8000 [--memory-report 30]
+
+With `uvicorn --workers N`, every worker imports the app on its own and loads
+both models, the field registry and the GeoJSON again. Here the master imports
+backend.app.main, loads every RESOURCES entry, moves everything it allocated
+out of the garbage collector's reach (gc.freeze) and only then forks. Workers
+share the master's pages until they write to them. Tensor storages and the
+field geometries are only ever read, so an extra worker costs just its own
+working set. All workers accept() on one listening socket opened by the master,
+which restarts any worker that dies.
+
+Per-process RSS/PSS/USS comes from /proc/<pid>/smaps_rollup (Linux). It is
+printed by --memory-report and returned by each worker's /api/health.
+"""
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+from typing import Dict, Optional
+
+
+def proc_memory(pid="self") -> Optional[Dict[str, float]]:
+    """RSS, PSS (shared pages split between sharers) and USS (private pages) in MB, or None off Linux."""
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0].endswith(":") and parts[1].isdigit():
+                    fields[parts[0][:-1]] = int(parts[1])
+    except OSError:
+        return None
+    mb = lambda kb: round(kb / 1024.0, 1)
+    return {
+        "rss_mb": mb(fields.get("Rss", 0)),
+        "pss_mb": mb(fields.get("Pss", 0)),
+        "uss_mb": mb(fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)),
+    }
+
+
+def _listen(host: str, port: int, backlog: int) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def preload(app_module) -> float:
+    """Load every registered resource in this process; returns seconds taken."""
+    t0 = time.perf_counter()
+    if app_module.TORCH_AVAILABLE:
+        import torch
+        # Keep torch's intra-op pool from starting before fork; workers set their own limits
+        torch.set_num_threads(1)
+    for name in app_module.RESOURCES.status():
+        app_module.RESOURCES.get(name)
+    return time.perf_counter() - t0
+
+
+def _run_worker(app_module, sock: socket.socket, args) -> None:
+    import random
+    import numpy as np
+    import uvicorn
+    random.seed()
+    np.random.seed()
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    config = uvicorn.Config(app_module.app, log_level=args.log_level, access_log=args.access_log,
+                            timeout_keep_alive=args.keep_alive)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def _report(master: int, workers) -> None:
+    rows = [("master", master)] + [(f"worker {i}", pid) for i, pid in enumerate(workers)]
+    print(f"{'process':<10} {'pid':>7} {'rss_mb':>8} {'pss_mb':>8} {'uss_mb':>8}", flush=True)
+    total_pss = 0.0
+    for name, pid in rows:
+        m = proc_memory(pid) or {"rss_mb": 0.0, "pss_mb": 0.0, "uss_mb": 0.0}
+        total_pss += m["pss_mb"]
+        print(f"{name:<10} {pid:>7} {m['rss_mb']:>8} {m['pss_mb']:>8} {m['uss_mb']:>8}", flush=True)
+    print(f"total PSS {round(total_pss, 1)} MB across {len(rows)} processes", flush=True)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Pre-forking server for backend.app.main")
+    ap.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    ap.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    ap.add_argument("--workers", type=int, default=int(os.getenv("WEB_WORKERS") or (os.cpu_count() or 1)))
+    ap.add_argument("--backlog", type=int, default=2048)
+    ap.add_argument("--keep-alive", type=int, default=5)
+    ap.add_argument("--log-level", default="info")
+    ap.add_argument("--access-log", action="store_true")
+    ap.add_argument("--memory-report", type=float, default=0, metavar="SECONDS",
+                    help="print per-process RSS/PSS/USS this many seconds after the workers start")
+    args = ap.parse_args(argv)
+
+    # The master loads everything itself: no warmup thread may be running across fork()
+    os.environ["MODEL_WARMUP"] = "0"
+    sock = _listen(args.host, args.port, args.backlog)
+    from . import main as app_module
+    took = preload(app_module)
+    gc.collect()
+    gc.freeze()  # keep GC bookkeeping from dirtying the shared pages in every worker
+    print(f"[serve] loaded {app_module.RESOURCES.status()} in {took:.1f}s; forking {args.workers} workers "
+          f"on {args.host}:{args.port}", flush=True)
+
+    workers: Dict[int, int] = {}  # pid -> slot
+    stopping = False
+
+    def spawn(slot: int):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                _run_worker(app_module, sock, args)
+            finally:
+                os._exit(0)
+        workers[pid] = slot
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for slot in range(max(1, args.workers)):
+        spawn(slot)
+    report_at = time.monotonic() + args.memory_report if args.memory_report else None
+
+    while workers:
+        if report_at is not None and time.monotonic() >= report_at:
+            _report(os.getpid(), sorted(workers))
+            report_at = None
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid == 0:
+            time.sleep(0.2)
+            continue
+        slot = workers.pop(pid, None)
+        if slot is not None and not stopping:
+            print(f"[serve] worker {pid} exited ({status}); restarting", flush=True)
+            spawn(slot)
+    sock.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,304 @@
+"""Embedded SQLite store for model runs, claims, their audit hashes and per-field flood results.
+
+- WAL journal with synchronous=NORMAL. Readers never block the writer, and a
+  commit is an append to the WAL rather than an fsync of the database.
+- One connection per thread (and per process, so forked workers never share a
+  handle).
+- Writes are group-committed. Callers hand rows to a single writer thread,
+  which drains whatever has queued up while the previous commit ran (up to
+  `batch_max` items, optionally lingering `batch_wait_ms` for more) and commits
+  it in one transaction. Each caller then returns once its rows are committed. If
+  a batch fails, its items are retried one by one so that a single bad row
+  (e.g. a duplicate key) only fails its own request.
+- IDs are <prefix><13-digit epoch ms><10 hex random>. They sort by creation
+  time and do not collide across threads, worker processes or restarts.
+- Audit rows are not inserted directly: audit.append chains them (hash chain
+  + Merkle tree, see audit.py) inside the same transaction as the records
+  they describe. write() returns their (seq, entry_hash).
+- Listings are keyset-paginated on (created_at, id). The opaque cursor encodes
+  the last row seen, so deep pages cost the same as the first.
+"""
+import base64
+import os
+import queue
+import secrets
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from . import audit
+
+TABLES = {
+    "model_runs": ("model_run_id", "field_id", "created_at", "ndvi_mean", "avg_temp_c", "rainfall_mm",
+                   "yield_est_q_ha", "ci_low", "ci_high"),
+    "claims": ("claim_id", "model_run_id", "field_id", "created_at", "status", "flooded_pct", "confidence",
+               "payout_amount", "audit_hash"),
+    "audit": ("created_at", "entity", "entity_id", "hash"),  # seq/prev_hash/entry_hash are assigned by audit.append
+    "flood_results": ("created_at", "field_id", "flooded_pct", "source", "date"),
+}
+PRIMARY_KEYS = {"model_runs": "model_run_id", "claims": "claim_id", "audit": "seq", "flood_results": "seq"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS model_runs (
+    model_run_id TEXT PRIMARY KEY,
+    field_id TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    ndvi_mean REAL, avg_temp_c REAL, rainfall_mm REAL,
+    yield_est_q_ha REAL, ci_low REAL, ci_high REAL
+);
+CREATE INDEX IF NOT EXISTS model_runs_field ON model_runs (field_id, created_at, model_run_id);
+CREATE INDEX IF NOT EXISTS model_runs_created ON model_runs (created_at, model_run_id);
+
+CREATE TABLE IF NOT EXISTS claims (
+    claim_id TEXT PRIMARY KEY,
+    model_run_id TEXT NOT NULL,
+    field_id TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    status TEXT NOT NULL,
+    flooded_pct REAL, confidence REAL, payout_amount REAL,
+    audit_hash TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS claims_field ON claims (field_id, created_at, claim_id);
+CREATE INDEX IF NOT EXISTS claims_created ON claims (created_at, claim_id);
+CREATE INDEX IF NOT EXISTS claims_run ON claims (model_run_id);
+
+CREATE TABLE IF NOT EXISTS audit (
+    seq INTEGER PRIMARY KEY,
+    created_at REAL NOT NULL,
+    entity TEXT NOT NULL,
+    entity_id TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    prev_hash TEXT,
+    entry_hash TEXT
+);
+CREATE INDEX IF NOT EXISTS audit_entity ON audit (entity_id);
+CREATE INDEX IF NOT EXISTS audit_created ON audit (created_at, seq);
+
+CREATE TABLE IF NOT EXISTS flood_results (
+    seq INTEGER PRIMARY KEY,
+    created_at REAL NOT NULL,
+    field_id TEXT NOT NULL,
+    flooded_pct REAL,
+    source TEXT NOT NULL,
+    date TEXT
+);
+CREATE INDEX IF NOT EXISTS flood_results_field ON flood_results (field_id, seq);
+CREATE INDEX IF NOT EXISTS flood_results_created ON flood_results (created_at, seq);
+"""
+
+
+def new_id(prefix: str) -> str:
+    return f"{prefix}{int(time.time() * 1000):013d}{secrets.token_hex(5)}"
+
+
+def encode_cursor(created_at: float, key) -> str:
+    return base64.urlsafe_b64encode(f"{created_at!r}|{key}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[float, str]:
+    """Inverse of encode_cursor; raises ValueError on anything malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, key = raw.split("|", 1)
+        return float(created_at), key
+    except Exception:
+        raise ValueError("invalid cursor")
+
+
+class Store:
+    def __init__(self, path: str, batch_max: int = 512, batch_wait_ms: float = 0.0, busy_timeout_ms: int = 5000,
+                 checkpoint_every: int = 1024):
+        self.path = path
+        self.checkpoint_every = checkpoint_every
+        self.batch_max = max(1, batch_max)
+        self.batch_wait_ms = batch_wait_ms
+        self.busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+        self._queue: "queue.Queue" = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+        self._writer_pid = None
+        self._start_lock = threading.Lock()
+        self.commits = self.rows_written = self.retries = self.write_errors = 0
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn = sqlite3.connect(path, timeout=busy_timeout_ms / 1000.0)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")  # persistent: recorded in the database file
+            conn.executescript(SCHEMA)
+            with conn:
+                audit.migrate(conn)
+        finally:
+            conn.close()
+
+    def _conn(self) -> sqlite3.Connection:
+        pid = os.getpid()
+        cached = getattr(self._local, "conn", None)
+        if cached is None or cached[0] != pid:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout_ms / 1000.0, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = cached = (pid, conn)
+        return cached[1]
+
+    # ---- writes ----
+
+    def _ensure_writer(self):
+        if self._writer is not None and self._writer_pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._writer is None or self._writer_pid != os.getpid():
+                self._queue = queue.Queue()
+                self._writer = threading.Thread(target=self._write_loop, name="store-writer", daemon=True)
+                self._writer_pid = os.getpid()
+                self._writer.start()
+
+    def write(self, ops: Sequence[Tuple[str, Dict]], wait: bool = True):
+        """Insert rows [(table, row), ...] atomically with the current batch; blocks until committed.
+
+        Returns the (seq, entry_hash) of each audit row, or the Future when wait=False.
+        """
+        for table, row in ops:
+            unknown = set(row) - set(TABLES[table])
+            if unknown:
+                raise ValueError(f"unknown {table} columns: {sorted(unknown)}")
+        self._ensure_writer()
+        fut: Future = Future()
+        self._queue.put((list(ops), fut))
+        return fut.result() if wait else fut
+
+    def insert(self, table: str, row: Dict):
+        self.write([(table, row)])
+
+    def insert_many(self, table: str, rows: Sequence[Dict]):
+        """Bulk insert in a single transaction (one queue item, so it is never split)."""
+        if rows:
+            self.write([(table, r) for r in rows])
+
+    def _apply(self, conn: sqlite3.Connection, items) -> List[List[Tuple[int, str]]]:
+        """Commit every item's rows in one transaction; returns each item's appended audit entries."""
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            grouped: Dict[Tuple[str, Tuple[str, ...]], List[tuple]] = {}
+            audit_rows, owners = [], []
+            for i, (ops, _) in enumerate(items):
+                for table, row in ops:
+                    if table == "audit":
+                        audit_rows.append(row)
+                        owners.append(i)
+                        continue
+                    cols = tuple(c for c in TABLES[table] if c in row)
+                    grouped.setdefault((table, cols), []).append(tuple(row[c] for c in cols))
+            for (table, cols), values in grouped.items():
+                conn.executemany(f"INSERT INTO {table} ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})",
+                                 values)
+            results: List[List[Tuple[int, str]]] = [[] for _ in items]
+            for owner, entry in zip(owners, audit.append(conn, audit_rows, self.checkpoint_every)):
+                results[owner].append(entry)
+            conn.execute("COMMIT")
+            return results
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _write_loop(self):
+        conn = self._conn()
+        q = self._queue
+        while True:
+            items = [q.get()]
+            deadline = time.monotonic() + self.batch_wait_ms / 1000.0
+            while len(items) < self.batch_max:
+                remaining = deadline - time.monotonic()
+                try:
+                    items.append(q.get(timeout=remaining) if remaining > 0 else q.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                results = self._apply(conn, items)
+                self.commits += 1
+                self.rows_written += sum(len(ops) for ops, _ in items)
+                for (_, fut), res in zip(items, results):
+                    fut.set_result(res)
+            except Exception as batch_error:
+                if len(items) == 1:
+                    self.write_errors += 1
+                    items[0][1].set_exception(batch_error)
+                    continue
+                # Isolate the failing item(s); everyone else still commits
+                self.retries += 1
+                for item in items:
+                    try:
+                        res = self._apply(conn, [item])[0]
+                        self.commits += 1
+                        self.rows_written += len(item[0])
+                        item[1].set_result(res)
+                    except Exception as e:
+                        self.write_errors += 1
+                        item[1].set_exception(e)
+
+    def transact(self, fn: Callable, *args, **kwargs):
+        """Run fn(conn, ...) in its own write transaction, outside the batched writer."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            out = fn(conn, *args, **kwargs)
+            conn.execute("COMMIT")
+            return out
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    # ---- reads ----
+
+    def read(self, fn: Callable, *args, **kwargs):
+        """Run fn(conn, ...) against one consistent snapshot (a read transaction under WAL)."""
+        conn = self._conn()
+        conn.execute("BEGIN")
+        try:
+            return fn(conn, *args, **kwargs)
+        finally:
+            conn.execute("COMMIT")
+
+    def get(self, table: str, key: str) -> Optional[Dict]:
+        row = self._conn().execute(f"SELECT * FROM {table} WHERE {PRIMARY_KEYS[table]} = ?", (key,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def page(self, table: str, where: Optional[Dict] = None, since: Optional[float] = None,
+             until: Optional[float] = None, limit: int = 50, cursor: Optional[str] = None) -> Dict:
+        """Newest-first page of `table` filtered by equality on `where` and created_at in [since, until)."""
+        key = PRIMARY_KEYS[table]
+        clauses, args = [], []
+        for col, val in (where or {}).items():
+            if val is not None:
+                if col not in TABLES[table]:
+                    raise ValueError(f"cannot filter {table} by {col}")
+                clauses.append(f"{col} = ?")
+                args.append(val)
+        if since is not None:
+            clauses.append("created_at >= ?")
+            args.append(since)
+        if until is not None:
+            clauses.append("created_at < ?")
+            args.append(until)
+        if cursor:
+            created_at, last = decode_cursor(cursor)
+            clauses.append(f"(created_at < ? OR (created_at = ? AND {key} < ?))")
+            args += [created_at, created_at, int(last) if key == "seq" else last]
+        sql = f"SELECT * FROM {table}"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += f" ORDER BY created_at DESC, {key} DESC LIMIT ?"
+        rows = [dict(r) for r in self._conn().execute(sql, args + [limit + 1]).fetchall()]
+        more = len(rows) > limit
+        rows = rows[:limit]
+        nxt = encode_cursor(rows[-1]["created_at"], rows[-1][key]) if more else None
+        return {"items": rows, "count": len(rows), "next_cursor": nxt}
+
+    def stats(self) -> Dict:
+        conn = self._conn()
+        counts = {t: conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0] for t in TABLES}
+        return {"path": self.path, "rows": counts, "commits": self.commits, "rows_written": self.rows_written,
+                "avg_rows_per_commit": round(self.rows_written / self.commits, 2) if self.commits else 0.0,
+                "retries": self.retries, "write_errors": self.write_errors,
+                "queued": self._queue.qsize()}
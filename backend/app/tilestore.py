@@ -0,0 +1,224 @@
+"""Memory-mapped tile store for preprocessed (2,H,W) tiles.
+
+Thousands of small per-tile .npy files are replaced by a few large shards:
+
+    <root>/images-00000.npy   (n, 2, H, W) float32
+    <root>/masks-00000.npy    (n, H, W) uint8      (only if some tile in the shard has a mask)
+    <root>/index.csv          id,shard,row,has_mask
+
+Shards are opened once with np.load(mmap_mode=...). A tile is then a view
+into the page cache: reading it costs no open() and no copy, and every
+process serving the same store shares the same physical pages.
+
+Pack existing per-tile files listed in the manifests with:
+
+    python -m backend.app.tilestore pack --manifests processed/manifests --out processed/tilestore
+"""
+import argparse
+import csv
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+INDEX_NAME = "index.csv"
+INDEX_COLS = ["id", "shard", "row", "has_mask"]
+
+
+def _shard_name(kind: str, shard: int) -> str:
+    return f"{kind}-{shard:05d}.npy"
+
+
+class TileStore:
+    """Read side. `mode` is passed to np.load: 'r' (read-only) or 'c' (copy-on-write,
+    writable views that still share pages until written, e.g. for torch.from_numpy)."""
+
+    def __init__(self, root: str, mode: str = "r", check_interval: float = 2.0):
+        self.root = root
+        self.mode = mode
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+        self._sig = None
+        self._index: Dict[str, Tuple[int, int, bool]] = {}
+        self._shards: Dict[Tuple[str, int], np.ndarray] = {}
+        self._refresh(force=True)
+
+    def _refresh(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.check_interval:
+            return
+        with self._lock:
+            p = os.path.join(self.root, INDEX_NAME)
+            try:
+                st = os.stat(p)
+                sig = (st.st_mtime_ns, st.st_size)
+            except OSError:
+                sig = None
+            if sig != self._sig:
+                index = {}
+                if sig is not None:
+                    with open(p, newline="") as f:
+                        # Fixed field names: indexes written before has_mask existed have 3 columns
+                        # (has_mask None -> the masks shard decides). The header row fails int().
+                        for r in csv.DictReader(f, fieldnames=INDEX_COLS):
+                            try:
+                                index[r["id"]] = (int(r["shard"]), int(r["row"]), r["has_mask"] != "0")
+                            except (TypeError, ValueError):
+                                continue  # header, or line still being appended by a writer
+                # Written shards are immutable, so already-mapped shards stay valid
+                self._index, self._sig = index, sig
+            self._checked_at = now
+
+    def _shard(self, kind: str, shard: int) -> Optional[np.ndarray]:
+        key = (kind, shard)
+        arr = self._shards.get(key)
+        if arr is None:
+            path = os.path.join(self.root, _shard_name(kind, shard))
+            if not os.path.exists(path):
+                return None
+            arr = np.load(path, mmap_mode=self.mode)
+            self._shards[key] = arr
+        return arr
+
+    def __len__(self) -> int:
+        self._refresh()
+        return len(self._index)
+
+    def __contains__(self, tile_id) -> bool:
+        self._refresh()
+        return str(tile_id) in self._index
+
+    def ids(self) -> List[str]:
+        self._refresh()
+        return list(self._index)
+
+    def image(self, tile_id) -> Optional[np.ndarray]:
+        """(2,H,W) view into the mapped shard, or None if the id is not stored."""
+        self._refresh()
+        loc = self._index.get(str(tile_id))
+        if loc is None:
+            return None
+        shard = self._shard("images", loc[0])
+        return None if shard is None else shard[loc[1]]
+
+    def mask(self, tile_id) -> Optional[np.ndarray]:
+        self._refresh()
+        loc = self._index.get(str(tile_id))
+        if loc is None or not loc[2]:
+            return None
+        shard = self._shard("masks", loc[0])
+        return None if shard is None else shard[loc[1]]
+
+
+class TileStoreWriter:
+    """Append tiles to a store. Each shard holds up to `shard_size` tiles; the index
+    is appended only after a shard is fully written, so readers never see partial shards."""
+
+    def __init__(self, root: str, shard_size: int = 1024):
+        os.makedirs(root, exist_ok=True)
+        self.root = root
+        self.shard_size = shard_size
+        self._pending: List[Tuple[str, np.ndarray, Optional[np.ndarray]]] = []
+        self._next_shard = self._find_next_shard()
+
+    def _find_next_shard(self) -> int:
+        shards = [int(n[len("images-"):-len(".npy")]) for n in os.listdir(self.root)
+                  if n.startswith("images-") and n.endswith(".npy")]
+        return max(shards) + 1 if shards else 0
+
+    def add(self, tile_id: str, image: np.ndarray, mask: Optional[np.ndarray] = None):
+        self._pending.append((str(tile_id), image, mask))
+        if len(self._pending) >= self.shard_size:
+            self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return
+        shard = self._next_shard
+        first = np.asarray(self._pending[0][1])
+        imgs = np.lib.format.open_memmap(os.path.join(self.root, _shard_name("images", shard)), mode="w+",
+                                         dtype=np.float32, shape=(len(self._pending),) + first.shape)
+        # Tiles without a mask get a zero row and has_mask=0, so one unmasked tile
+        # doesn't cost the rest of the shard their masks
+        msks = None
+        if any(m is not None for _, _, m in self._pending):
+            msks = np.lib.format.open_memmap(os.path.join(self.root, _shard_name("masks", shard)), mode="w+",
+                                             dtype=np.uint8, shape=(len(self._pending),) + first.shape[1:])
+        for i, (_, img, msk) in enumerate(self._pending):
+            imgs[i] = img
+            if msks is not None:
+                msks[i] = 0 if msk is None else msk
+        imgs.flush(); del imgs
+        if msks is not None:
+            msks.flush(); del msks
+        index_path = os.path.join(self.root, INDEX_NAME)
+        new = not os.path.exists(index_path)
+        with open(index_path, "a", newline="") as f:
+            w = csv.writer(f)
+            if new:
+                w.writerow(INDEX_COLS)
+            for i, (tid, _, msk) in enumerate(self._pending):
+                w.writerow([tid, shard, i, int(msk is not None)])
+        self._pending = []
+        self._next_shard += 1
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def pack_manifest_tiles(manifest_paths: Iterable[str], out_root: str, shard_size: int = 1024,
+                        project_root: str = ".", replace: Iterable[str] = ()) -> int:
+    """Copy per-tile .npy files referenced by manifests into a store. Already-stored ids are skipped,
+    except those in `replace` (e.g. tiles of re-processed scenes), which are written again; the
+    index row appended last wins, so readers switch to the new copy."""
+    existing = set(TileStore(out_root).ids()) if os.path.exists(os.path.join(out_root, INDEX_NAME)) else set()
+    existing -= set(replace)
+    n = 0
+    with TileStoreWriter(out_root, shard_size=shard_size) as w:
+        for mp in manifest_paths:
+            with open(mp, newline="") as f:
+                for r in csv.DictReader(f):
+                    img_path = r.get("image_path")
+                    tid = r.get("id") or (os.path.splitext(os.path.basename(img_path))[0] if img_path else None)
+                    if not tid or tid in existing:
+                        continue
+                    if img_path and not os.path.exists(img_path):
+                        img_path = os.path.join(project_root, img_path)
+                    if not img_path or not os.path.exists(img_path):
+                        continue
+                    msk_path = r.get("mask_path")
+                    if msk_path and not os.path.exists(msk_path):
+                        msk_path = os.path.join(project_root, msk_path)
+                    msk = np.load(msk_path, mmap_mode="r") if msk_path and os.path.exists(msk_path) else None
+                    w.add(tid, np.load(img_path, mmap_mode="r"), msk)
+                    existing.add(tid)
+                    n += 1
+    return n
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Vani tile store utilities")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    pk = sub.add_parser("pack", help="pack per-tile .npy files listed in manifests into a memory-mapped store")
+    pk.add_argument("--manifests", default=os.path.join("processed", "manifests"))
+    pk.add_argument("--out", default=os.path.join("processed", "tilestore"))
+    pk.add_argument("--shard-size", type=int, default=1024)
+    args = ap.parse_args(argv)
+    if args.cmd == "pack":
+        names = ["tiles.csv", "train.csv", "val.csv"]
+        paths = [os.path.join(args.manifests, n) for n in names if os.path.exists(os.path.join(args.manifests, n))]
+        n = pack_manifest_tiles(paths, args.out, shard_size=args.shard_size)
+        print(f"Packed {n} tiles into {args.out}")
+
+
+if __name__ == "__main__":
+    main()
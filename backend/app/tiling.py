@@ -0,0 +1,164 @@
+"""Sliding-window tiled inference for full Sentinel-1 scenes.
+
+UNetSmall pools three times, so a single forward pass needs H and W divisible
+by 8 and memory proportional to the whole scene. Here the scene is cut into
+overlapping tiles that are run in small batches. Overlapping logits are blended
+with a feathered (linear ramp) window, and finished rows are emitted strip by
+strip. Working memory is therefore bounded by one row of tiles, not the scene.
+"""
+from typing import Callable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+# forward(batch (B,C,h,w) float32) -> logits (B,h,w) float32
+Forward = Callable[[np.ndarray], np.ndarray]
+
+
+def torch_forward(model) -> Forward:
+    """Wrap a single-output segmentation module as a numpy batch forward."""
+    import torch
+
+    def forward(batch: np.ndarray) -> np.ndarray:
+        with torch.no_grad():
+            out = model(torch.from_numpy(np.ascontiguousarray(batch)))
+        return out[:, 0].cpu().numpy()
+    return forward
+
+
+def sigmoid(z: np.ndarray) -> np.ndarray:
+    """Overflow-free logistic function."""
+    return 0.5 * (1.0 + np.tanh(0.5 * z))
+
+
+def _ceil8(n: int) -> int:
+    return (n + 7) // 8 * 8
+
+
+def _starts(n: int, win: int, stride: int) -> List[int]:
+    """Window offsets covering [0, n); the last window is clamped to the edge."""
+    if n <= win:
+        return [0]
+    starts = list(range(0, n - win, stride))
+    starts.append(n - win)
+    return starts
+
+
+def _feather(n: int, overlap: int) -> np.ndarray:
+    """1D blending ramp: rises over `overlap` pixels at both ends, never zero."""
+    ramp = float(max(1, overlap))
+    i = np.arange(n, dtype=np.float32)
+    return np.minimum(np.minimum(i + 1, n - i) / ramp, 1.0).astype(np.float32)
+
+
+def _read_window(arr, y: int, x: int, th: int, tw: int) -> np.ndarray:
+    """Cut a (C,th,tw) float32 window, padding by reflection past the scene edge."""
+    win = np.asarray(arr[:, y:y + th, x:x + tw], dtype=np.float32)
+    ph, pw = th - win.shape[1], tw - win.shape[2]
+    if ph or pw:
+        mode = "reflect" if win.shape[1] > ph and win.shape[2] > pw else "edge"
+        win = np.pad(win, ((0, 0), (0, ph), (0, pw)), mode=mode)
+    return win
+
+
+def iter_tiled_logits(
+    arr,
+    forward: Forward,
+    tile: int = 256,
+    overlap: int = 32,
+    batch_size: int = 8,
+) -> Iterator[Tuple[int, np.ndarray]]:
+    """Yield (row_offset, blended_logits_strip) covering a (C,H,W) scene top to bottom.
+
+    `arr` can be any array-like sliceable as arr[:, y0:y1, x0:x1] (including a
+    np.memmap), so the scene itself never has to be cast to float32 in full.
+    """
+    if tile % 8 or tile <= 0:
+        raise ValueError("tile size must be a positive multiple of 8")
+    if not 0 <= overlap < tile:
+        raise ValueError("overlap must be in [0, tile)")
+    if batch_size < 1:
+        raise ValueError("batch_size must be >= 1")
+    _, H, W = arr.shape
+    th, tw = min(tile, _ceil8(H)), min(tile, _ceil8(W))
+    ys = _starts(H, th, th - overlap if th == tile else th)
+    xs = _starts(W, tw, tw - overlap if tw == tile else tw)
+    weight = np.outer(_feather(th, overlap), _feather(tw, overlap))
+
+    lo = 0
+    acc = np.zeros((0, W), dtype=np.float32)
+    wsum = np.zeros((0, W), dtype=np.float32)
+    for r, y in enumerate(ys):
+        # Grow the band buffer so it covers rows [lo, y + th)
+        grow = min(y + th, H) - (lo + acc.shape[0])
+        if grow > 0:
+            acc = np.concatenate([acc, np.zeros((grow, W), dtype=np.float32)])
+            wsum = np.concatenate([wsum, np.zeros((grow, W), dtype=np.float32)])
+        for b0 in range(0, len(xs), batch_size):
+            cols = xs[b0:b0 + batch_size]
+            batch = np.stack([_read_window(arr, y, x, th, tw) for x in cols])
+            logits = forward(batch)
+            h = min(th, H - y)
+            for x, lg in zip(cols, logits):
+                w = min(tw, W - x)
+                acc[y - lo:y - lo + h, x:x + w] += lg[:h, :w] * weight[:h, :w]
+                wsum[y - lo:y - lo + h, x:x + w] += weight[:h, :w]
+        # Rows above the next window row can no longer receive contributions
+        done = (ys[r + 1] if r + 1 < len(ys) else H) - lo
+        yield lo, acc[:done] / wsum[:done]
+        acc, wsum, lo = acc[done:], wsum[done:], lo + done
+
+
+def _logit_cut(threshold: float) -> float:
+    """sigmoid(z) > t  <=>  z > logit(t); skips the exp on every pixel."""
+    t = float(threshold)
+    return -np.inf if t <= 0 else np.inf if t >= 1 else float(np.log(t / (1.0 - t)))
+
+
+def tiled_predict(
+    arr,
+    forward: Forward,
+    tile: int = 256,
+    overlap: int = 32,
+    batch_size: int = 8,
+    threshold: Optional[float] = None,
+) -> np.ndarray:
+    """Run tiled inference over a whole scene.
+
+    Returns sigmoid probabilities as float32 (H,W), or a uint8 0/1 mask when
+    `threshold` is given (4x smaller, which matters for 10k x 10k scenes).
+    """
+    _, H, W = arr.shape
+    out = np.empty((H, W), dtype=np.float32 if threshold is None else np.uint8)
+    if threshold is not None:
+        cut = _logit_cut(threshold)
+    for y0, strip in iter_tiled_logits(arr, forward, tile, overlap, batch_size):
+        rows = slice(y0, y0 + strip.shape[0])
+        if threshold is None:
+            out[rows] = sigmoid(strip)
+        else:
+            out[rows] = strip > cut
+    return out
+
+
+def tiled_mask_and_prob(
+    arr,
+    forward: Forward,
+    threshold: float,
+    tile: int = 256,
+    overlap: int = 32,
+    batch_size: int = 8,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Run tiled inference and return a uint8 0/1 mask and uint8 0..255 probabilities.
+
+    Both are filled strip by strip, so the scene costs 2 bytes per pixel and
+    no full float32 probability map is ever built.
+    """
+    _, H, W = arr.shape
+    mask = np.empty((H, W), dtype=np.uint8)
+    prob = np.empty((H, W), dtype=np.uint8)
+    cut = _logit_cut(threshold)
+    for y0, strip in iter_tiled_logits(arr, forward, tile, overlap, batch_size):
+        rows = slice(y0, y0 + strip.shape[0])
+        mask[rows] = strip > cut
+        prob[rows] = np.rint(sigmoid(strip) * 255.0)
+    return mask, prob
@@ -0,0 +1,145 @@
+"""Async, pooled, cached client for the One Call 3.0 API.
+
+- One httpx.AsyncClient per event loop, so connections are kept alive and
+  reused.
+- Responses are cached for `ttl` seconds per lat/lon grid cell (`grid`
+  degrees). Upstream is queried at the cell centre, so every caller in a cell
+  sees the same document.
+- Concurrent misses for the same cell share one upstream request
+  (single-flight).
+- If upstream fails, a stale copy up to `stale_ttl` seconds old is served
+  instead of an error.
+
+/current, /forecast and /alerts are all cut from the same cached document, so
+loading the dashboard costs at most one upstream call.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+try:
+    import httpx
+    HTTPX_AVAILABLE = True
+except Exception:
+    HTTPX_AVAILABLE = False
+
+
+class WeatherClient:
+    def __init__(self, base_url: str, api_key: str, ttl: float = 600.0, stale_ttl: float = 6 * 3600.0,
+                 grid: float = 0.05, timeout: float = 10.0, max_connections: int = 20,
+                 max_entries: int = 4096, transport=None):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.grid = grid
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.max_entries = max_entries
+        self.transport = transport  # e.g. httpx.ASGITransport(app=weather_mock.app) in tests
+        self._cache: "OrderedDict[Tuple, Tuple[float, dict]]" = OrderedDict()
+        self._inflight = {}
+        self._client = None
+        self._loop = None
+        self.hits = self.misses = self.coalesced = self.upstream_calls = self.stale_served = self.errors = 0
+
+    def cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return (round(lat / self.grid), round(lon / self.grid))
+
+    def _http(self):
+        """Pooled client bound to the running loop (recreated if the loop changed)."""
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            limits = httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections)
+            self._client = httpx.AsyncClient(timeout=self.timeout, limits=limits, transport=self.transport)
+            self._loop = loop
+            self._inflight = {}
+        return self._client
+
+    async def _fetch(self, lat: float, lon: float, exclude: str) -> dict:
+        self.upstream_calls += 1
+        params = {"lat": lat, "lon": lon, "appid": self.api_key, "units": "metric", "exclude": exclude}
+        url = f"{self.base_url}/onecall"
+        if HTTPX_AVAILABLE:
+            res = await self._http().get(url, params=params)
+        else:
+            import requests
+            from starlette.concurrency import run_in_threadpool
+            res = await run_in_threadpool(requests.get, url, params=params, timeout=self.timeout)
+        res.raise_for_status()
+        return res.json()
+
+    def _store(self, key, data: dict):
+        self._cache[key] = (time.monotonic(), data)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    async def onecall(self, lat: float, lon: float, with_minutely: bool = False) -> Tuple[dict, str]:
+        """Return (document, source) with source in hit | miss | coalesced | stale.
+        Raises the upstream error when there is nothing cached to fall back on."""
+        ci, cj = self.cell(lat, lon)
+        key = (ci, cj, with_minutely)
+        entry = self._cache.get(key)
+        now = time.monotonic()
+        if entry is not None and now - entry[0] < self.ttl:
+            self.hits += 1
+            self._cache.move_to_end(key)
+            return entry[1], "hit"
+        if HTTPX_AVAILABLE:
+            self._http()  # resets in-flight bookkeeping if the loop changed
+        task: Optional[asyncio.Task] = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            source = "coalesced"
+        else:
+            self.misses += 1
+            source = "miss"
+            # The fetch runs as its own task that every caller shields on, so a cancelled
+            # caller (client disconnect, timeout) leaves the others waiting on a live request
+            task = asyncio.get_running_loop().create_task(self._fill(key, ci, cj, with_minutely))
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())  # no "never retrieved" warning
+            self._inflight[key] = task
+        try:
+            return await asyncio.shield(task), source
+        except Exception as e:
+            return self._stale_or_raise(key, now, e)
+
+    async def _fill(self, key, ci: int, cj: int, with_minutely: bool) -> dict:
+        try:
+            data = await self._fetch(round(ci * self.grid, 6), round(cj * self.grid, 6),
+                                     "" if with_minutely else "minutely")
+            self._store(key, data)
+            return data
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            if self._inflight.get(key) is asyncio.current_task():
+                self._inflight.pop(key, None)
+
+    def _stale_or_raise(self, key, now: float, error: Exception) -> Tuple[dict, str]:
+        entry = self._cache.get(key)
+        if entry is not None and now - entry[0] < self.stale_ttl:
+            self.stale_served += 1
+            return entry[1], "stale"
+        raise error
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "upstream_calls": self.upstream_calls,
+            "stale_served": self.stale_served,
+            "errors": self.errors,
+            "ttl_s": self.ttl,
+            "grid_deg": self.grid,
+        }
@@ -0,0 +1,100 @@
+"""Mock One Call 3.0 upstream.
+
+mock_onecall() is the demo payload served when no WEATHER_API_KEY is set.
+`app` serves that same payload over HTTP so the pooled weather client can be
+exercised end to end without hitting OpenWeather:
+
+    uvicorn backend.app.weather_mock:app --port 9001
+    WEATHER_API_URL=http://127.0.0.1:9001 WEATHER_API_KEY=test uvicorn backend.app.main:app
+
+GET /control?fail=1&delay_ms=200 switches on simulated outages/latency and
+GET /control reports how many upstream calls were received.
+"""
+import asyncio
+import time
+
+from fastapi import FastAPI, HTTPException
+
+
+def mock_onecall(lat: float, lon: float) -> dict:
+    now = int(time.time())
+    return {
+        "lat": lat,
+        "lon": lon,
+        "timezone": "Asia/Kolkata",
+        "timezone_offset": 19800,
+        "current": {
+            "dt": now,
+            "temp": 28.5,
+            "feels_like": 30.2,
+            "pressure": 1008,
+            "humidity": 78,
+            "dew_point": 24.1,
+            "uvi": 0.5,
+            "clouds": 85,
+            "visibility": 8000,
+            "wind_speed": 4.5,
+            "wind_deg": 240,
+            "weather": [{"id": 501, "main": "Rain", "description": "heavy rain", "icon": "10d"}],
+            "rain": {"1h": 12.5}
+        },
+        "hourly": [
+            {
+                "dt": now + i*3600,
+                "temp": 28 - i*0.5,
+                "feels_like": 29 - i*0.5,
+                "pressure": 1008,
+                "humidity": 75 + i,
+                "wind_speed": 4 + i*0.3,
+                "weather": [{"id": 501, "main": "Rain", "description": "moderate rain", "icon": "10d"}],
+                "pop": 0.8 - i*0.05
+            } for i in range(8)
+        ],
+        "daily": [
+            {"dt": now + i*86400, "temp": {"day": 30-i, "min": 24, "max": 32-i, "night": 26, "eve": 28, "morn": 25},
+             "feels_like": {"day": 32, "night": 27, "eve": 29, "morn": 26},
+             "pressure": 1008, "humidity": 78, "wind_speed": 4.5, "wind_deg": 240, "clouds": 85,
+             "pop": 0.9 - i*0.1, "rain": 95 - i*10, "uvi": 5.2,
+             "weather": [{"id": 501, "main": "Rain", "description": "heavy rain", "icon": "10d"}],
+             "summary": "Heavy rain expected with flood risk"
+            } for i in range(7)
+        ],
+        "alerts": [
+            {
+                "sender_name": "India Meteorological Department (IMD)",
+                "event": "Heavy Rainfall Warning",
+                "start": now,
+                "end": now + 172800,
+                "description": "Heavy to very heavy rainfall expected in coastal Odisha. Flood risk HIGH. Farmers advised to harvest ready crops immediately and prepare drainage systems.",
+                "tags": ["Flood", "Rain"]
+            }
+        ]
+    }
+
+
+app = FastAPI(title="Mock One Call 3.0 upstream")
+_state = {"calls": 0, "fail": False, "delay_ms": 0}
+
+
+@app.get("/onecall")
+async def onecall(lat: float, lon: float, appid: str = "", units: str = "metric", exclude: str = ""):
+    _state["calls"] += 1
+    if _state["delay_ms"]:
+        await asyncio.sleep(_state["delay_ms"] / 1000.0)
+    if _state["fail"]:
+        raise HTTPException(status_code=503, detail="simulated upstream outage")
+    data = mock_onecall(lat, lon)
+    for part in filter(None, (p.strip() for p in exclude.split(","))):
+        data.pop(part, None)
+    return data
+
+
+@app.get("/control")
+def control(fail: int = None, delay_ms: int = None, reset: int = 0):
+    if fail is not None:
+        _state["fail"] = bool(fail)
+    if delay_ms is not None:
+        _state["delay_ms"] = max(0, delay_ms)
+    if reset:
+        _state["calls"] = 0
+    return dict(_state)
@@ -0,0 +1,104 @@
+"""Export the served models to TorchScript and ONNX (picked up by INFERENCE_BACKEND, see backend/app/backends.py)
+
+    python export_models.py                              # both models, both formats
+    python export_models.py --models unet --formats onnx
+
+BatchNorm is folded into the U-Net convolutions first. Each export is checked
+against the eager model and timed before it is written next to its checkpoint.
+"""
+import argparse, json, time
+from pathlib import Path
+import numpy as np
+import torch
+
+from backend.app.backends import artifact_path, onnx_runner, torch_runner
+from backend.app.nets import FTTransformer, UNetSmall, fold_batchnorm
+
+ROOT = Path(__file__).parent
+MODELS = ROOT / 'models'
+
+
+def load_unet(path):
+    model = UNetSmall(in_ch=2, out_ch=1)
+    model.load_state_dict(torch.load(path, map_location='cpu'))
+    return model.eval()
+
+
+def load_ft(path, meta_path):
+    with open(meta_path) as f:
+        meta = json.load(f)
+    cont_cols = meta.get('cont_cols') or meta.get('features') or []
+    soil_vocab = meta.get('soil_vocab', ['loam', 'clay', 'sandy'])
+    model = FTTransformer(len(cont_cols), len(soil_vocab))
+    model.load_state_dict(torch.load(path, map_location='cpu'))
+    return model.eval(), len(cont_cols), len(soil_vocab)
+
+
+def timeit(fn, inputs, reps=10):
+    fn(*inputs)
+    t0 = time.perf_counter()
+    for _ in range(reps):
+        fn(*inputs)
+    return (time.perf_counter() - t0) / reps * 1000.0
+
+
+def export(name, model, checkpoint, example, input_names, dynamic_axes, formats, fold_bn=False):
+    """Write the requested artifacts for one model and report parity/latency against eager."""
+    eager = torch_runner(model)
+    ref = eager(*example)
+    print(f'{name}: eager {timeit(eager, example):.1f} ms/batch')
+    if fold_bn:
+        model = fold_batchnorm(model)
+    tensors = tuple(torch.from_numpy(a) for a in example)
+    if 'torchscript' in formats:
+        path = artifact_path(str(checkpoint), 'torchscript')
+        with torch.no_grad():
+            ts = torch.jit.freeze(torch.jit.trace(model, tensors))
+        ts.save(path)
+        run = torch_runner(torch.jit.load(path).eval())
+        print(f'  torchscript -> {path} | max|diff| {np.abs(run(*example) - ref).max():.2e} | {timeit(run, example):.1f} ms/batch')
+    if 'onnx' in formats:
+        path = artifact_path(str(checkpoint), 'onnx')
+        torch.onnx.export(model, tensors, path, input_names=input_names, output_names=['out'],
+                          dynamic_axes=dynamic_axes, opset_version=17, dynamo=False)
+        try:
+            run = onnx_runner(path)
+        except ImportError:
+            print(f'  onnx -> {path} (install onnxruntime to verify)')
+        else:
+            print(f'  onnx -> {path} | max|diff| {np.abs(run(*example) - ref).max():.2e} | {timeit(run, example):.1f} ms/batch')
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--models', nargs='+', default=['unet', 'ft'], choices=['unet', 'ft'])
+    ap.add_argument('--formats', nargs='+', default=['torchscript', 'onnx'], choices=['torchscript', 'onnx'])
+    ap.add_argument('--models-dir', default=str(MODELS))
+    args = ap.parse_args()
+    mdir = Path(args.models_dir)
+    rng = np.random.default_rng(0)
+
+    if 'unet' in args.models:
+        ckpt = mdir / 'best_unet.pt'
+        if ckpt.exists():
+            example = (rng.random((8, 2, 256, 256), dtype=np.float32),)
+            export('unet', load_unet(ckpt), ckpt, example, ['image'],
+                   {'image': {0: 'batch', 2: 'height', 3: 'width'}, 'out': {0: 'batch', 2: 'height', 3: 'width'}},
+                   args.formats, fold_bn=True)
+        else:
+            print(f'unet: {ckpt} not found, skipped')
+
+    if 'ft' in args.models:
+        ckpt = mdir / 'best_tabtransformer.pt'
+        meta = mdir / 'tab_meta.json'
+        if ckpt.exists() and meta.exists():
+            model, n_cont, n_cat = load_ft(ckpt, meta)
+            example = (rng.standard_normal((64, n_cont), dtype=np.float32), rng.integers(0, n_cat, 64).astype(np.int64))
+            export('ft_transformer', model, ckpt, example, ['x_cont', 'x_cat'],
+                   {'x_cont': {0: 'batch'}, 'x_cat': {0: 'batch'}, 'out': {0: 'batch'}}, args.formats)
+        else:
+            print(f'ft_transformer: {ckpt} or {meta} not found, skipped')
+
+
+if __name__ == '__main__':
+    main()
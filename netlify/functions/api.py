@@ -6,6 +6,14 @@ from pathlib import Path
 project_root = Path(__file__).parent.parent.parent
 sys.path.insert(0, str(project_root))
 
+# Load models on first use instead of warming them up on every cold start
+os.environ.setdefault("MODEL_WARMUP", "0")
+# Lambda has no /dev/shm, so claim PDFs render on a thread instead of a process pool
+os.environ.setdefault("REPORT_WORKERS", "0")
+# Only /tmp is writable on Lambda; point STORE_PATH at a persistent volume for real deployments
+os.environ.setdefault("STORE_PATH", "/tmp/vani.db")
+os.environ.setdefault("FLOOD_TILES_DIR", "/tmp/flood_tiles")
+
 from mangum import Mangum
 from backend.app.main import app
 
@@ -0,0 +1,354 @@
+"""Sen1Floods11 preprocessing: VV/VH GeoTIFF scenes -> normalized 256x256 .npy tiles + manifests
+
+Replaces the scene loop in notebooks/preprocessing.ipynb:
+
+    python preprocess.py                                   # RAW_DIR = $SEN1FLOODS11_DIR or data/sen1floods11
+    python preprocess.py --raw /data/s1f11 --workers 4 --pack
+
+- Scenes are either separate VV / VH rasters (+ optional *mask*), as in the
+  notebook, or 2-band *_S1Hand.tif stacks (+ *_LabelHand.tif). They are read
+  window by window with rasterio, so a scene is never fully in memory.
+- Pass 1 estimates each band's p1/p99 with a streaming histogram quantile
+  estimator. The histogram has QUANT_BINS bins over the range of a decimated
+  read, with outliers clamped into the edge bins, so the error is at most one
+  bin. Pass 2 reads one tile row at a time, scales to [0, 1] (nodata/NaN -> 0)
+  and writes the tiles.
+- Scenes run in a process pool. A scene that fails is reported, listed with
+  its error in manifests/scenes.csv, and makes the exit code 1. It is never
+  silently dropped.
+- Manifests carry south/west/north/east (EPSG:4326) and date for
+  /api/segment/unet/by-field. The date comes from the file name (YYYYMMDD or
+  YYYY-MM-DD), a DATE-like GeoTIFF tag, or --date. Masked tiles go to
+  train/val (a stable 80/20 split by tile id); unmasked ones go to tiles.csv.
+- Each finished scene leaves a marker in processed/.done holding its input
+  signature and tile records. Reruns skip unchanged scenes and redo changed or
+  half-written ones, and the manifests are rebuilt from the markers.
+  --pack then adds new tiles to the memory-mapped tile store, and re-adds the
+  tiles of scenes whose signature changed since they were last packed.
+"""
+import argparse, csv, glob, hashlib, json, os, re, sys, time, traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+import numpy as np
+
+from backend.app.catalog import normalize_date
+from backend.app.ndvi import hist_percentiles
+
+ROOT = Path(__file__).parent
+TILE_SIZE = 256
+QUANT_BINS = 4096
+MANIFEST_COLS = ['id', 'image_path', 'mask_path', 'scene_id', 'south', 'west', 'north', 'east', 'date']
+SCENE_COLS = ['scene_id', 'status', 'tiles', 'date', 'south', 'west', 'north', 'east',
+              'vv_lo', 'vv_hi', 'vh_lo', 'vh_hi', 'seconds', 'error']
+DATE_RE = re.compile(r'(?<!\d)(20\d{2})-?(\d{2})-?(\d{2})(?!\d)')
+STRIP = re.compile(r'(_?VV|_?VH|_?mask|_S1Hand|_LabelHand)', re.IGNORECASE)
+
+
+# ---- discovery ----
+
+def scene_key(path):
+    return STRIP.sub('', Path(path).stem)
+
+
+def discover(raw_dir):
+    """[{scene_id, vv, vh, band offsets, mask}] for every complete scene under raw_dir."""
+    files = sorted(glob.glob(str(Path(raw_dir) / '**' / '*.tif'), recursive=True))
+    by = {}
+    for p in files:
+        name = Path(p).stem
+        k = scene_key(p)
+        slot = ('stack' if re.search('S1Hand', name, re.I) else 'label' if re.search('LabelHand|mask', name, re.I)
+                else 'vv' if re.search('VV', name) else 'vh' if re.search('VH', name) else None)
+        if slot:
+            by.setdefault(k, {})[slot] = p
+    scenes = []
+    for k, f in sorted(by.items()):
+        if 'stack' in f:
+            scenes.append({'scene_id': k, 'vv': f['stack'], 'vv_band': 1, 'vh': f['stack'], 'vh_band': 2,
+                           'mask': f.get('label')})
+        elif 'vv' in f and 'vh' in f:
+            scenes.append({'scene_id': k, 'vv': f['vv'], 'vv_band': 1, 'vh': f['vh'], 'vh_band': 1,
+                           'mask': f.get('label')})
+    return scenes
+
+
+def signature(scene, params):
+    """Changes when any input file or tiling parameter changes."""
+    h = hashlib.sha256(json.dumps(params, sort_keys=True).encode())
+    for key in ('vv', 'vh', 'mask'):
+        p = scene.get(key)
+        if p:
+            st = os.stat(p)
+            h.update(f'{key}|{os.path.abspath(p)}|{st.st_size}|{st.st_mtime_ns}|'.encode())
+    return h.hexdigest()[:24]
+
+
+def scene_date(scene, default=None):
+    for key in ('vv', 'vh'):
+        m = DATE_RE.search(Path(scene[key]).name)
+        if m:
+            return '-'.join(m.groups())
+    import rasterio
+    with rasterio.open(scene['vv']) as src:
+        tags = {**src.tags(), **src.tags(scene['vv_band'])}
+    for k, v in tags.items():
+        if 'DATE' in k.upper() and DATE_RE.search(str(v).replace(':', '-')):
+            return '-'.join(DATE_RE.search(str(v).replace(':', '-')).groups())
+    return normalize_date(default)
+
+
+# ---- per-band statistics ----
+
+class StreamingQuantiles:
+    """Fixed-bin histogram over [lo, hi] (outliers land in the edge bins); quantiles within one bin width."""
+
+    def __init__(self, lo, hi, bins=QUANT_BINS):
+        if not hi > lo:
+            hi = lo + 1e-6
+        self.lo, self.hi, self.bins = float(lo), float(hi), bins
+        self.hist = np.zeros(bins, dtype=np.int64)
+        self.count = 0
+
+    def update(self, values):
+        v = values[np.isfinite(values)]
+        if v.size:
+            k = ((v - self.lo) * (self.bins / (self.hi - self.lo))).astype(np.int64)
+            self.hist += np.bincount(np.clip(k, 0, self.bins - 1), minlength=self.bins)
+            self.count += v.size
+
+    def quantiles(self, qs):
+        if self.count == 0:
+            return [float('nan')] * len(qs)
+        out = hist_percentiles(self.hist[None, :], np.array([self.count]), qs, self.lo, self.hi)
+        return [float(v) for v in out[:, 0]]
+
+
+def _read(src, band, window=None, out_shape=None):
+    a = src.read(band, window=window, out_shape=out_shape, masked=True).astype('float32')
+    return a.filled(np.nan) if np.ma.isMaskedArray(a) else a
+
+
+def band_percentiles(path, band, pmin, pmax, block=1024, bins=QUANT_BINS):
+    import rasterio
+    from rasterio.windows import Window
+    with rasterio.open(path) as src:
+        f = max(1, max(src.height, src.width) // 1024)
+        preview = _read(src, band, out_shape=(max(1, src.height // f), max(1, src.width // f)))
+        finite = preview[np.isfinite(preview)]
+        if finite.size == 0:
+            return float('nan'), float('nan')
+        est = StreamingQuantiles(finite.min(), finite.max(), bins)
+        for y in range(0, src.height, block):
+            for x in range(0, src.width, block):
+                est.update(_read(src, band, Window(x, y, min(block, src.width - x), min(block, src.height - y))))
+    return tuple(est.quantiles([pmin, pmax]))
+
+
+# ---- one scene ----
+
+def _save(path, arr):
+    tmp = f'{path}.tmp.npy'
+    np.save(tmp, arr)
+    os.replace(tmp, path)
+
+
+def process_scene(scene, out_dir, tile=TILE_SIZE, pmin=1.0, pmax=99.0, min_valid=0.05, default_date=None):
+    """Tile one scene; returns its scene row and manifest records. Raises on unreadable input."""
+    import rasterio
+    from rasterio.warp import transform_bounds
+    from rasterio.windows import Window, bounds as window_bounds
+    t0 = time.perf_counter()
+    img_dir, msk_dir = Path(out_dir) / 'images', Path(out_dir) / 'masks'
+    img_dir.mkdir(parents=True, exist_ok=True)
+    msk_dir.mkdir(parents=True, exist_ok=True)
+    sid = scene['scene_id']
+    date = scene_date(scene, default_date)
+    (vv_lo, vv_hi), (vh_lo, vh_hi) = (band_percentiles(scene[k], scene[f'{k}_band'], pmin, pmax) for k in ('vv', 'vh'))
+    records = []
+    with rasterio.open(scene['vv']) as vv_src, rasterio.open(scene['vh']) as vh_src:
+        if (vh_src.height, vh_src.width) != (vv_src.height, vv_src.width):
+            raise ValueError(f'VV {vv_src.shape} and VH {vh_src.shape} differ in size')
+        msk_src = rasterio.open(scene['mask']) if scene.get('mask') else None
+        try:
+            if msk_src is not None and (msk_src.height, msk_src.width) != (vv_src.height, vv_src.width):
+                raise ValueError(f'mask {msk_src.shape} and VV {vv_src.shape} differ in size')
+            H, W = vv_src.height, vv_src.width
+            crs = vv_src.crs or 'EPSG:4326'
+            for y in range(0, H - tile + 1, tile):
+                win = Window(0, y, W, tile)
+                vv = _read(vv_src, scene['vv_band'], win)
+                vh = _read(vh_src, scene['vh_band'], win)
+                valid = np.isfinite(vv)
+                strip = np.stack([np.clip((vv - vv_lo) / (vv_hi - vv_lo + 1e-6), 0, 1),
+                                  np.clip((vh - vh_lo) / (vh_hi - vh_lo + 1e-6), 0, 1)])
+                strip = np.nan_to_num(strip, nan=0.0).astype('float32')
+                msk = (msk_src.read(1, window=win) > 0).astype('uint8') if msk_src is not None else None
+                for x in range(0, W - tile + 1, tile):
+                    if np.count_nonzero(valid[:, x:x + tile]) < min_valid * tile * tile:
+                        continue
+                    tid = f'{sid}_{y // tile}_{x // tile}'
+                    img_path = img_dir / f'{tid}.npy'
+                    _save(img_path, np.ascontiguousarray(strip[:, :, x:x + tile]))
+                    msk_path = ''
+                    if msk is not None:
+                        msk_path = msk_dir / f'{tid}.npy'
+                        _save(msk_path, np.ascontiguousarray(msk[:, x:x + tile]))
+                    west, south, east, north = transform_bounds(
+                        crs, 'EPSG:4326', *window_bounds(Window(x, y, tile, tile), vv_src.transform))
+                    records.append({'id': tid, 'image_path': _rel(img_path), 'mask_path': _rel(msk_path) if msk_path else '',
+                                    'scene_id': sid, 'south': south, 'west': west, 'north': north, 'east': east,
+                                    'date': date or ''})
+            west, south, east, north = transform_bounds(crs, 'EPSG:4326', *vv_src.bounds)
+        finally:
+            if msk_src is not None:
+                msk_src.close()
+    row = {'scene_id': sid, 'status': 'ok', 'tiles': len(records), 'date': date or '',
+           'south': south, 'west': west, 'north': north, 'east': east,
+           'vv_lo': vv_lo, 'vv_hi': vv_hi, 'vh_lo': vh_lo, 'vh_hi': vh_hi,
+           'seconds': round(time.perf_counter() - t0, 2), 'error': ''}
+    return row, records
+
+
+def _rel(path):
+    try:
+        return str(Path(path).resolve().relative_to(ROOT.resolve()))
+    except ValueError:
+        return str(path)
+
+
+def _run(scene, out_dir, opts, sig, marker):
+    """Pool entry point: process a scene and write its marker last, so an interrupted scene is redone."""
+    try:
+        row, records = process_scene(scene, out_dir, **opts)
+    except Exception as e:
+        return {'scene_id': scene['scene_id'], 'status': 'failed', 'tiles': 0, 'error': f'{type(e).__name__}: {e}',
+                'trace': traceback.format_exc()}, []
+    tmp = f'{marker}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump({'signature': sig, 'scene': row, 'records': records}, f)
+    os.replace(tmp, marker)
+    return row, records
+
+
+# ---- manifests ----
+
+def is_val(tile_id, frac):
+    return int(hashlib.sha1(tile_id.encode()).hexdigest()[:8], 16) / 0xFFFFFFFF < frac
+
+
+def write_csv(path, cols, rows):
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w', newline='') as f:
+        w = csv.DictWriter(f, fieldnames=cols, extrasaction='ignore')
+        w.writeheader()
+        w.writerows(rows)
+    os.replace(tmp, path)
+
+
+def write_manifests(man_dir, scene_rows, records, val_frac):
+    man_dir.mkdir(parents=True, exist_ok=True)
+    masked = [r for r in records if r['mask_path']]
+    train = [r for r in masked if not is_val(r['id'], val_frac)]
+    val = [r for r in masked if is_val(r['id'], val_frac)]
+    unmasked = [r for r in records if not r['mask_path']]
+    out = {'train.csv': train, 'val.csv': val, 'tiles.csv': unmasked}
+    for name, rows in out.items():
+        if rows or name != 'tiles.csv' or (man_dir / name).exists():
+            write_csv(man_dir / name, MANIFEST_COLS, rows)
+    write_csv(man_dir / 'scenes.csv', SCENE_COLS, scene_rows)
+    return {k: len(v) for k, v in out.items()}
+
+
+def pack(man_dir, done_dir, scene_ids, store):
+    """Pack manifest tiles into the tile store. A scene's tiles are re-written when the store holds
+    them from an older signature (markers remember which signature was packed into which store)."""
+    from backend.app.tilestore import pack_manifest_tiles
+    key = os.path.abspath(store)
+    stale, markers = set(), {}
+    for sid in scene_ids:
+        path = done_dir / f'{sid}.json'
+        with open(path) as f:
+            m = json.load(f)
+        if m.get('packed', {}).get(key) != m['signature']:
+            stale.update(r['id'] for r in m['records'])
+            markers[path] = m
+    paths = [str(man_dir / n) for n in ('tiles.csv', 'train.csv', 'val.csv') if (man_dir / n).exists()]
+    n = pack_manifest_tiles(paths, store, project_root=str(ROOT), replace=stale)
+    for path, m in markers.items():
+        m.setdefault('packed', {})[key] = m['signature']
+        tmp = f'{path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(m, f)
+        os.replace(tmp, path)
+    return n, len(markers)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--raw', default=os.getenv('SEN1FLOODS11_DIR', str(ROOT / 'data' / 'sen1floods11')))
+    ap.add_argument('--out', default=str(ROOT / 'processed'))
+    ap.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    ap.add_argument('--tile', type=int, default=TILE_SIZE)
+    ap.add_argument('--pmin', type=float, default=1.0)
+    ap.add_argument('--pmax', type=float, default=99.0)
+    ap.add_argument('--min-valid', type=float, default=0.05, help='min fraction of valid VV pixels per tile')
+    ap.add_argument('--val-frac', type=float, default=0.2)
+    ap.add_argument('--date', default=None, help='date for scenes with none in the file name or tags')
+    ap.add_argument('--force', action='store_true', help='reprocess every scene')
+    ap.add_argument('--pack', action='store_true', help='add new and changed tiles to the memory-mapped tile store')
+    args = ap.parse_args()
+
+    out_dir = Path(args.out)
+    done_dir, man_dir = out_dir / '.done', out_dir / 'manifests'
+    done_dir.mkdir(parents=True, exist_ok=True)
+    scenes = discover(args.raw)
+    print(f'[preprocess] {len(scenes)} scenes under {args.raw}')
+    opts = {'tile': args.tile, 'pmin': args.pmin, 'pmax': args.pmax, 'min_valid': args.min_valid,
+            'default_date': args.date}
+    rows, records, todo = {}, {}, []
+    for s in scenes:
+        sig = signature(s, opts)
+        marker = done_dir / f"{s['scene_id']}.json"
+        if not args.force and marker.exists():
+            with open(marker) as f:
+                m = json.load(f)
+            if m.get('signature') == sig:
+                rows[s['scene_id']], records[s['scene_id']] = {**m['scene'], 'status': 'cached'}, m['records']
+                continue
+        todo.append((s, sig, str(marker)))
+    print(f'[preprocess] {len(rows)} unchanged, {len(todo)} to process with {args.workers} workers')
+
+    t0 = time.perf_counter()
+    failed = []
+    if args.workers <= 1:
+        results = (_run(s, out_dir, opts, sig, m) for s, sig, m in todo)
+    else:
+        pool = ProcessPoolExecutor(max_workers=args.workers)
+        results = (f.result() for f in as_completed([pool.submit(_run, s, out_dir, opts, sig, m) for s, sig, m in todo]))
+    for i, (row, recs) in enumerate(results, 1):
+        rows[row['scene_id']], records[row['scene_id']] = row, recs
+        if row['status'] == 'failed':
+            failed.append(row)
+            print(f"[preprocess] FAILED {row['scene_id']}: {row['error']}", file=sys.stderr)
+        else:
+            print(f"[preprocess] {i}/{len(todo)} {row['scene_id']}: {row['tiles']} tiles in {row['seconds']}s")
+    if args.workers > 1:
+        pool.shutdown()
+
+    all_records = [r for sid in sorted(records) for r in records[sid]]
+    counts = write_manifests(man_dir, [rows[k] for k in sorted(rows)], all_records, args.val_frac)
+    undated = sum(1 for r in rows.values() if r['status'] != 'failed' and not r.get('date'))
+    print(f'[preprocess] manifests {counts} in {man_dir} ({time.perf_counter() - t0:.1f}s)')
+    if undated:
+        print(f'[preprocess] {undated} scenes have no date (pass --date or encode it in the file name)')
+    if args.pack:
+        store = os.getenv('TILE_STORE_DIR', str(out_dir / 'tilestore'))
+        n, refreshed = pack(man_dir, done_dir, [sid for sid, r in rows.items() if r['status'] != 'failed'], store)
+        print(f'[preprocess] packed {n} tiles into {store} ({refreshed} scenes re-packed after changes)')
+    if failed:
+        print(f'[preprocess] {len(failed)} scenes failed; see {man_dir / "scenes.csv"}', file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""Accuracy vs latency of int8 quantization against fp32 (INFERENCE_QUANT, see backend/app/quant.py)
+
+    python quant_report.py                       # prints a markdown report
+    python quant_report.py --out models/quant_report.md --calib 32 --eval 64
+
+U-Net: static int8 vs fp32 on processed tiles (calibration and evaluation tiles
+are disjoint). IoU is computed with iou_score against the fp32 mask, and
+against the ground-truth mask where tiles have one.
+FT-Transformer: dynamic int8 vs fp32 yield predictions on rows jittered
+around the DLInput defaults (absolute error in q/ha).
+"""
+import argparse, copy, json, time
+from pathlib import Path
+import numpy as np
+import torch
+
+from backend.app.catalog import TileCatalog
+from backend.app.nets import FTTransformer, UNetSmall, iou_score
+from backend.app.quant import quantize_ft_dynamic, quantize_unet_static, sample_tiles, select_engine
+from backend.app.tilestore import TileStore
+
+ROOT = Path(__file__).parent
+MODELS = ROOT / 'models'
+# DLInput defaults (backend/app/main.py), used to draw FT-Transformer rows
+FT_DEFAULTS = {
+    'ndvi_mean': 0.35, 'ndvi_std': 0.05, 'evi_mean': 0.3, 'avg_temp_c': 29.0, 'rainfall_mm': 260.0,
+    'plant_density_plants_m2': 20.0, 'fertilizer_kg_ha': 90.0, 'irrigation_mm': 40.0, 'elevation_m': 100.0,
+    'slope_pct': 1.0, 'prior_yield_qha': 35.0, 'sowing_doy': 180,
+}
+
+
+def ms_per_call(fn, reps=5):
+    fn()
+    t0 = time.perf_counter()
+    for _ in range(reps):
+        fn()
+    return (time.perf_counter() - t0) / reps * 1000.0
+
+
+def unet_report(args, engine):
+    ckpt = MODELS / 'best_unet.pt'
+    if not ckpt.exists():
+        return [f'U-Net: {ckpt} not found, skipped']
+    tiles = sample_tiles(TileCatalog(str(ROOT / 'processed' / 'manifests')),
+                         TileStore(str(ROOT / 'processed' / 'tilestore')), str(ROOT), args.calib + args.eval)
+    calib, evals = tiles[:args.calib], tiles[args.calib:]
+    if not calib or not evals:
+        return [f'U-Net: need more than {args.calib} processed tiles (found {len(tiles)}), skipped']
+    fp32 = UNetSmall(in_ch=2, out_ch=1)
+    fp32.load_state_dict(torch.load(ckpt, map_location='cpu'))
+    fp32.eval()
+    int8 = quantize_unet_static(copy.deepcopy(fp32), (img for img, _ in calib), engine)
+    iou_fp32, iou_gt_fp32, iou_gt_int8 = [], [], []
+    with torch.no_grad():
+        for img, msk in evals:
+            x = torch.from_numpy(img)[None]
+            a, b = fp32(x), int8(x)
+            iou_fp32.append(iou_score(b, (torch.sigmoid(a) > args.threshold).float(), thr=args.threshold))
+            if msk is not None:
+                y = torch.from_numpy(np.asarray(msk, dtype=np.float32))[None, None]
+                iou_gt_fp32.append(iou_score(a, y, thr=args.threshold))
+                iou_gt_int8.append(iou_score(b, y, thr=args.threshold))
+        batch = torch.from_numpy(np.stack([img for img, _ in evals[:args.batch]]))
+        t_fp32 = ms_per_call(lambda: fp32(batch))
+        t_int8 = ms_per_call(lambda: int8(batch))
+    n = len(batch)
+    lines = [
+        f'## U-Net (static int8, engine {engine}, {len(calib)} calibration / {len(evals)} eval tiles)', '',
+        '| model | ms / tile | IoU vs fp32 mask | IoU vs ground truth |', '|---|---|---|---|',
+        f'| fp32 | {t_fp32 / n:.1f} | 1.000 | {np.mean(iou_gt_fp32):.3f} |' if iou_gt_fp32 else f'| fp32 | {t_fp32 / n:.1f} | 1.000 | n/a |',
+        f'| int8 | {t_int8 / n:.1f} | {np.mean(iou_fp32):.3f} (min {np.min(iou_fp32):.3f}) | '
+        + (f'{np.mean(iou_gt_int8):.3f} |' if iou_gt_int8 else 'n/a |'),
+        '', f'Speed-up: {t_fp32 / t_int8:.2f}x (batch of {n}).',
+    ]
+    return lines
+
+
+def ft_report(args, engine):
+    ckpt, meta_path, scaler_path = MODELS / 'best_tabtransformer.pt', MODELS / 'tab_meta.json', MODELS / 'tab_scaler.joblib'
+    if not (ckpt.exists() and meta_path.exists() and scaler_path.exists()):
+        return ['FT-Transformer: model artifacts not found, skipped']
+    import joblib
+    meta = json.loads(meta_path.read_text())
+    cont_cols = meta.get('cont_cols') or meta.get('features') or []
+    soil_vocab = meta.get('soil_vocab', ['loam', 'clay', 'sandy'])
+    fp32 = FTTransformer(len(cont_cols), len(soil_vocab))
+    fp32.load_state_dict(torch.load(ckpt, map_location='cpu'))
+    fp32.eval()
+    int8 = quantize_ft_dynamic(copy.deepcopy(fp32), engine)
+    rng = np.random.default_rng(0)
+    base = np.array([FT_DEFAULTS.get(c, 0.0) for c in cont_cols], dtype=np.float32)
+    x = base * (1 + 0.2 * rng.standard_normal((args.rows, len(cont_cols)))).astype(np.float32)
+    xc = torch.from_numpy(joblib.load(scaler_path).transform(x).astype(np.float32))
+    xcat = torch.from_numpy(rng.integers(0, len(soil_vocab), args.rows).astype(np.int64))
+    with torch.no_grad():
+        a, b = fp32(xc, xcat).squeeze(1).numpy(), int8(xc, xcat).squeeze(1).numpy()
+        t_fp32 = ms_per_call(lambda: fp32(xc[:64], xcat[:64]))
+        t_int8 = ms_per_call(lambda: int8(xc[:64], xcat[:64]))
+    err = np.abs(b - a)
+    return [
+        f'## FT-Transformer (dynamic int8 Linear + attention, engine {engine}, {args.rows} rows)', '',
+        '| model | ms / 64 rows | mean abs yield error vs fp32 (q/ha) | p99 | max |', '|---|---|---|---|---|',
+        f'| fp32 | {t_fp32:.2f} | 0 | 0 | 0 |',
+        f'| int8 | {t_int8:.2f} | {err.mean():.4f} | {np.percentile(err, 99):.4f} | {err.max():.4f} |',
+        '', f'Speed-up: {t_fp32 / t_int8:.2f}x. Mean |fp32 yield| is {np.abs(a).mean():.2f} q/ha.',
+    ]
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--calib', type=int, default=32, help='calibration tiles (QUANT_CALIB_TILES)')
+    ap.add_argument('--eval', type=int, default=64, help='evaluation tiles')
+    ap.add_argument('--batch', type=int, default=8, help='tiles per timed U-Net batch')
+    ap.add_argument('--rows', type=int, default=4096, help='FT-Transformer rows')
+    ap.add_argument('--threshold', type=float, default=0.5)
+    ap.add_argument('--engine', default=None, help='x86 | fbgemm | qnnpack')
+    ap.add_argument('--out', default=None, help='also write the report to this file')
+    args = ap.parse_args()
+    engine = select_engine(args.engine)
+    lines = ['# int8 quantization vs fp32', '', f'torch {torch.__version__}, {torch.get_num_threads()} threads', '']
+    lines += unet_report(args, engine) + [''] + ft_report(args, engine)
+    report = '\n'.join(lines) + '\n'
+    print(report)
+    if args.out:
+        Path(args.out).write_text(report)
+
+
+if __name__ == '__main__':
+    main()
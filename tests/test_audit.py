@@ -0,0 +1,100 @@
+import hashlib
+import sqlite3
+
+import pytest
+
+from backend.app import audit
+from backend.app.store import SCHEMA
+
+
+def _ref_root(leaves):
+    """Naive RFC 6962 Merkle Tree Hash, straight from the definition."""
+    if not leaves:
+        return hashlib.sha256(b"").digest()
+    if len(leaves) == 1:
+        return hashlib.sha256(b"\x00" + leaves[0]).digest()
+    k = 1 << ((len(leaves) - 1).bit_length() - 1)
+    return hashlib.sha256(b"\x01" + _ref_root(leaves[:k]) + _ref_root(leaves[k:])).digest()
+
+
+def _conn():
+    conn = sqlite3.connect(":memory:")
+    conn.executescript(SCHEMA)
+    audit.migrate(conn)
+    return conn
+
+
+def _rows(n, start=0):
+    return [{"created_at": 1000.0 + i, "entity": "claim", "entity_id": f"c{i}", "hash": f"{i:064x}"}
+            for i in range(start, start + n)]
+
+
+def _entries(conn):
+    return [bytes.fromhex(r[0]) for r in conn.execute("SELECT entry_hash FROM audit ORDER BY seq")]
+
+
+def test_roots_and_proofs_match_reference():
+    conn = _conn()
+    for size in range(1, 65):
+        audit.append(conn, _rows(1, size - 1))
+        leaves = _entries(conn)
+        root = audit.root(conn, size)
+        assert root == _ref_root(leaves)
+        for i in range(size):
+            proof = audit.inclusion_proof(conn, i, size)
+            assert audit.verify_inclusion(audit.leaf_hash(leaves[i].hex()), i, size, proof, root)
+        if size > 1:
+            bad = audit.leaf_hash(leaves[0].hex())
+            assert not audit.verify_inclusion(bad, size - 1, size, audit.inclusion_proof(conn, size - 1, size), root)
+    # Roots of earlier tree sizes stay reproducible after the log has grown
+    for size in (1, 7, 32, 33):
+        assert audit.root(conn, size) == _ref_root(_entries(conn)[:size])
+
+
+def test_checkpoints_and_verify_entry():
+    conn = _conn()
+    audit.append(conn, _rows(20), checkpoint_every=8)
+    assert [r[0] for r in conn.execute("SELECT tree_size FROM audit_checkpoints ORDER BY tree_size")] == [8, 16]
+    out = audit.verify_entry(conn, 10, record_hash=f"{9:064x}")
+    assert out["verified"] and out["tree_size"] == 16
+    assert audit.verify_entry(conn, 10, record_hash="0" * 64)["checks"]["record_matches"] is False
+    assert audit.verify_chain(conn) == {"ok": True, "checked": 20, "first_bad_seq": None, "reason": None}
+
+
+def test_tampered_entry_is_caught():
+    conn = _conn()
+    audit.append(conn, _rows(12))
+    with pytest.raises(sqlite3.DatabaseError, match="append-only"):
+        conn.execute("UPDATE audit SET hash = ? WHERE seq = 5", ("f" * 64,))
+    conn.execute("DROP TRIGGER audit_no_update")
+    conn.execute("UPDATE audit SET hash = ? WHERE seq = 5", ("f" * 64,))
+    out = audit.verify_chain(conn)
+    assert not out["ok"] and out["first_bad_seq"] == 5 and out["reason"] == "entry hash mismatch"
+    assert audit.verify_chain(conn, start=6)["ok"]
+    assert not audit.verify_entry(conn, 5)["checks"]["entry_hash_valid"]
+
+
+def test_migrate_chains_legacy_rows():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE audit (seq INTEGER PRIMARY KEY, created_at REAL NOT NULL, entity TEXT NOT NULL, "
+                 "entity_id TEXT NOT NULL, hash TEXT NOT NULL)")
+    legacy = _rows(5)
+    conn.executemany("INSERT INTO audit (seq, created_at, entity, entity_id, hash) VALUES (?, ?, ?, ?, ?)",
+                     [(10 * (i + 1), r["created_at"], r["entity"], r["entity_id"], r["hash"])
+                      for i, r in enumerate(legacy)])
+    audit.migrate(conn)
+    assert [r[0] for r in conn.execute("SELECT seq FROM audit ORDER BY seq")] == [1, 2, 3, 4, 5]
+    assert audit.verify_chain(conn)["ok"]
+    assert audit.root(conn, 5) == _ref_root(_entries(conn))
+
+    # Same chain as appending the rows to a fresh log
+    fresh = _conn()
+    audit.append(fresh, legacy)
+    assert _entries(fresh) == _entries(conn)
+
+    # New appends continue the migrated chain; a second migrate is a no-op
+    audit.append(conn, _rows(3, 5))
+    audit.migrate(conn)
+    assert audit.verify_chain(conn)["checked"] == 8
+    with pytest.raises(sqlite3.DatabaseError):
+        conn.execute("DELETE FROM audit WHERE seq = 1")
@@ -0,0 +1,25 @@
+import pytest
+
+from backend.app.maskcodec import negotiate
+
+
+@pytest.mark.parametrize("accept, fmt", [
+    (None, "png_base64"),
+    ("application/json", "png_base64"),
+    ("image/png", "png"),
+    ("application/json, image/png;q=0.5", "png_base64"),
+    ("image/png;q=0, application/json", "png_base64"),
+    ("image/png;q=0", "png_base64"),
+    ("application/json;q=0.5, image/png", "png"),
+    ("image/png, application/octet-stream", "png"),
+    ("text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8", "png_base64"),
+    ("application/geo+json;q=0.9, multipart/mixed;q=0.9", "geojson"),
+])
+def test_negotiate_accept(accept, fmt):
+    assert negotiate(accept) == fmt
+
+
+def test_negotiate_override():
+    assert negotiate("image/png", "rle") == "rle"
+    with pytest.raises(ValueError):
+        negotiate(None, "jpeg")
@@ -0,0 +1,15 @@
+from backend.app.mvt import BUFFER, EXTENT, lonlat_range, tile_lonlat_bounds
+
+
+def test_buffered_range_covers_neighbour_slivers():
+    z, x, y = 14, 11700, 7300
+    west, south, east, north = tile_lonlat_bounds(z, x, y)
+    eps = (east - west) * (BUFFER / EXTENT) / 4
+    # A box just right of the tile's east edge: outside tile x, but inside its buffer
+    h = (north - south) / 3
+    box = (east + eps / 2, south + h, east + eps, north - h)
+    assert lonlat_range(z, *box) == (x + 1, y, x + 1, y)
+    x0, y0, x1, y1 = lonlat_range(z, *box, buffer=BUFFER)
+    assert (x0, x1) == (x, x + 1) and (y0, y1) == (y, y)
+    bw, bs, be, bn = tile_lonlat_bounds(z, x, y, BUFFER)
+    assert bw <= box[0] <= be and bs <= box[1] <= bn
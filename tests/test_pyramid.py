@@ -0,0 +1,81 @@
+import numpy as np
+
+from backend.app.mvt import lonlat_range
+from backend.app.pyramid import MASK_ALPHA, TILE, FloodPyramid, native_zoom, resample
+
+B = (20.0, 85.0, 20.2, 85.2)       # south, west, north, east: 0.2 deg, base z12
+A = (20.075, 85.075, 20.125, 85.125)  # 0.05 deg inside B, base z15
+
+
+def _tiles(pyr, bounds, z):
+    s, w, n, e = bounds
+    x0, y0, x1, y1 = lonlat_range(z, w, s, e, n)
+    return [(x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)]
+
+
+def test_finer_scene_composites_over_coarser_base(tmp_path):
+    pyr = FloodPyramid(str(tmp_path), min_zoom=10, max_zoom=18)
+    wet, dry = np.ones((500, 500), bool), np.zeros((1000, 1000), bool)
+    assert native_zoom(B, 500) == 12 and native_zoom(A, 1000) == 15
+    assert pyr.add(B, mask=wet)["zoom"] == 12
+    before = {t: pyr._read("mask", 12, *t) for t in _tiles(pyr, B, 12)}
+    assert all(v is not None for v in before.values())
+
+    assert pyr.add(A, mask=dry)["zoom"] == 15
+    for (x, y), old in before.items():
+        new = pyr._read("mask", 12, x, y)
+        assert new is not None, (x, y)
+        _, in_a = resample(np.ones((1, 1)), A, 12, x, y)
+        # Outside A's footprint (two z12 pixels of slack for the partly covered edge) nothing changes
+        near = in_a.copy()
+        for _ in range(2):
+            grown = near.copy()
+            grown[1:, :] |= near[:-1, :]; grown[:-1, :] |= near[1:, :]
+            grown[:, 1:] |= near[:, :-1]; grown[:, :-1] |= near[:, 1:]
+            near = grown
+        outside = ~near
+        np.testing.assert_array_equal(new[outside], old[outside])
+        # Well inside, A (dry, newest) wins
+        inner = in_a.copy()
+        for _ in range(2):
+            inner[1:, :] &= inner[:-1, :].copy(); inner[:-1, :] &= inner[1:, :].copy()
+            inner[:, 1:] &= inner[:, :-1].copy(); inner[:, :-1] &= inner[:, 1:].copy()
+        assert (new[inner] == 0).all()
+    # Zoomed out, A shows up as a hole in B's flood, not as a cleared tile
+    for t in _tiles(pyr, B, 10):
+        tile = pyr._read("mask", 10, *t)
+        assert tile is not None and tile.max() == MASK_ALPHA
+
+
+def test_overview_is_mean_of_children(tmp_path):
+    pyr = FloodPyramid(str(tmp_path), min_zoom=13, max_zoom=15)
+    rng = np.random.default_rng(0)
+    prob = rng.random((1000, 1000))
+    pyr.add(A, prob=prob)
+    for x, y in _tiles(pyr, A, 14):
+        quad = np.zeros((2 * TILE, 2 * TILE))
+        for dy in (0, 1):
+            for dx in (0, 1):
+                child = pyr._read("prob", 15, 2 * x + dx, 2 * y + dy)
+                if child is not None:
+                    quad[dy * TILE:(dy + 1) * TILE, dx * TILE:(dx + 1) * TILE] = child
+        parent = pyr._read("prob", 14, x, y)
+        expect = np.rint(quad.reshape(TILE, 2, TILE, 2).mean(axis=(1, 3)))
+        got = np.zeros((TILE, TILE)) if parent is None else parent
+        np.testing.assert_array_equal(got, expect)
+
+
+def test_submit_drops_when_queue_full(tmp_path):
+    import threading
+    pyr = FloodPyramid(str(tmp_path), min_zoom=14, max_zoom=15, max_pending=2)
+    gate = threading.Event()
+    add = pyr.add
+    pyr.add = lambda *a, **k: (gate.wait(5), add(*a, **k))[1]
+    futs = [pyr.submit(A, mask=np.ones((1000, 1000), bool)) for _ in range(4)]
+    assert [f is None for f in futs] == [False, False, True, True]
+    assert pyr.full() and pyr.stats()["dropped"] == 2
+    gate.set()
+    for f in futs[:2]:
+        f.result()
+    pyr.close()
+    assert pyr.stats()["pending"] == 0 and not pyr.full()
@@ -0,0 +1,66 @@
+import sqlite3
+
+import pytest
+
+from backend.app.store import Store, decode_cursor, encode_cursor
+
+
+def _run(i, created_at):
+    return {"model_run_id": f"run{i:03d}", "field_id": "F1" if i % 2 else "F2", "created_at": created_at}
+
+
+def _drain(store, table, **kw):
+    items, cursor, pages = [], None, 0
+    while True:
+        page = store.page(table, cursor=cursor, **kw)
+        items += page["items"]
+        pages += 1
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return items, pages
+
+
+def test_cursor_pagination_with_ties(tmp_path):
+    store = Store(str(tmp_path / "vani.db"))
+    # Ten rows share each timestamp, so pages must split ties on the key
+    store.insert_many("model_runs", [_run(i, 100.0 + i // 10) for i in range(47)])
+    items, pages = _drain(store, "model_runs", limit=6)
+    assert pages == 8
+    ids = [r["model_run_id"] for r in items]
+    assert ids == sorted(ids, key=lambda k: (100.0 + int(k[3:]) // 10, k), reverse=True)
+    assert len(set(ids)) == 47
+
+    f1, _ = _drain(store, "model_runs", where={"field_id": "F1"}, since=101.0, until=104.0, limit=4)
+    assert {r["model_run_id"] for r in f1} == {f"run{i:03d}" for i in range(10, 40) if i % 2}
+
+
+def test_cursor_pagination_on_seq_key(tmp_path):
+    store = Store(str(tmp_path / "vani.db"))
+    store.insert_many("flood_results", [{"created_at": 5.0, "field_id": "F1", "source": "sar"} for _ in range(9)])
+    items, _ = _drain(store, "flood_results", limit=4)
+    assert [r["seq"] for r in items] == list(range(9, 0, -1))
+
+
+def test_cursor_round_trip_and_rejects_garbage():
+    assert decode_cursor(encode_cursor(1712345678.123456, "run001")) == (1712345678.123456, "run001")
+    with pytest.raises(ValueError):
+        decode_cursor("not a cursor!")
+
+
+def test_group_commit_isolates_failing_item(tmp_path):
+    store = Store(str(tmp_path / "vani.db"), batch_wait_ms=200)
+    store.insert("model_runs", _run(0, 1.0))
+    audit_row = {"created_at": 2.0, "entity": "claim", "entity_id": "c1", "hash": "ab" * 32}
+    futs = [
+        store.write([("model_runs", _run(1, 2.0)), ("audit", audit_row)], wait=False),
+        store.write([("model_runs", _run(0, 3.0))], wait=False),  # duplicate key
+        store.write([("model_runs", _run(2, 4.0)), ("audit", {**audit_row, "entity_id": "c2"})], wait=False),
+    ]
+    assert [seq for seq, _ in futs[0].result(timeout=10)] == [1]
+    with pytest.raises(sqlite3.IntegrityError):
+        futs[1].result(timeout=10)
+    assert [seq for seq, _ in futs[2].result(timeout=10)] == [2]
+    assert store.retries == 1 and store.write_errors == 1
+    assert store.get("model_runs", "run000")["created_at"] == 1.0
+    assert store.get("model_runs", "run002") is not None
+    assert store.stats()["rows"]["audit"] == 2
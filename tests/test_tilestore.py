@@ -0,0 +1,65 @@
+import csv
+import os
+
+import numpy as np
+
+from backend.app.tilestore import INDEX_NAME, TileStore, TileStoreWriter, pack_manifest_tiles
+
+
+def _manifest(path, rows):
+    with open(path, "w", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(["id", "image_path", "mask_path"])
+        w.writerows(rows)
+
+
+def test_mixed_manifests_keep_masks(tmp_path):
+    rows = {"tiles.csv": [], "train.csv": []}
+    for i in range(8):
+        img = tmp_path / f"t{i}.npy"
+        np.save(img, np.full((2, 4, 4), i, dtype=np.float32))
+        msk = ""
+        if i >= 3:
+            msk = tmp_path / f"m{i}.npy"
+            np.save(msk, np.full((4, 4), i % 2, dtype=np.uint8) + (i == 5))
+        rows["train.csv" if msk else "tiles.csv"].append([f"t{i}", str(img), str(msk)])
+    for name, r in rows.items():
+        _manifest(tmp_path / name, r)
+
+    out = str(tmp_path / "store")
+    assert pack_manifest_tiles([str(tmp_path / "tiles.csv"), str(tmp_path / "train.csv")], out, shard_size=4) == 8
+    store = TileStore(out)
+    for i in range(8):
+        assert float(store.image(f"t{i}")[0, 0, 0]) == i
+        if i < 3:
+            assert store.mask(f"t{i}") is None
+        else:
+            np.testing.assert_array_equal(store.mask(f"t{i}"), np.load(tmp_path / f"m{i}.npy"))
+
+
+def test_legacy_index_without_has_mask(tmp_path):
+    root = str(tmp_path)
+    with TileStoreWriter(root, shard_size=2) as w:
+        w.add("a", np.zeros((2, 4, 4), np.float32), np.ones((4, 4), np.uint8))
+        w.add("b", np.zeros((2, 4, 4), np.float32), np.ones((4, 4), np.uint8))
+    with open(os.path.join(root, INDEX_NAME), "w", newline="") as f:
+        f.write("id,shard,row\na,0,0\nb,0,1\n")
+    store = TileStore(root)
+    assert store.ids() == ["a", "b"]
+    assert int(store.mask("b").sum()) == 16
+
+
+def test_replace_repacks_changed_tiles(tmp_path):
+    for i in range(3):
+        np.save(tmp_path / f"t{i}.npy", np.full((2, 4, 4), i, dtype=np.float32))
+    _manifest(tmp_path / "tiles.csv", [[f"t{i}", str(tmp_path / f"t{i}.npy"), ""] for i in range(3)])
+    man, out = [str(tmp_path / "tiles.csv")], str(tmp_path / "store")
+    assert pack_manifest_tiles(man, out, shard_size=2) == 3
+
+    np.save(tmp_path / "t1.npy", np.full((2, 4, 4), 7, dtype=np.float32))
+    assert pack_manifest_tiles(man, out, shard_size=2) == 0
+    assert float(TileStore(out).image("t1")[0, 0, 0]) == 1
+    assert pack_manifest_tiles(man, out, shard_size=2, replace=["t1"]) == 1
+    store = TileStore(out)
+    assert sorted(store.ids()) == ["t0", "t1", "t2"]
+    assert [float(store.image(f"t{i}")[0, 0, 0]) for i in range(3)] == [0, 7, 2]
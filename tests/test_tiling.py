@@ -0,0 +1,16 @@
+import numpy as np
+
+from backend.app.tiling import tiled_mask_and_prob, tiled_predict
+
+
+def _forward(batch):
+    return (batch[:, 0] - batch[:, 1]) * 8.0
+
+
+def test_mask_and_prob_match_float_path():
+    arr = np.random.default_rng(0).random((2, 300, 517)).astype(np.float32)
+    prob = tiled_predict(arr, _forward, tile=128, overlap=16, batch_size=3)
+    mask, prob8 = tiled_mask_and_prob(arr, _forward, 0.5, tile=128, overlap=16, batch_size=3)
+    assert mask.dtype == prob8.dtype == np.uint8
+    np.testing.assert_array_equal(mask, tiled_predict(arr, _forward, tile=128, overlap=16, batch_size=3, threshold=0.5))
+    np.testing.assert_array_equal(prob8, np.rint(prob * 255).astype(np.uint8))
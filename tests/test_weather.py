@@ -0,0 +1,76 @@
+import asyncio
+
+import httpx
+import pytest
+
+from backend.app import weather_mock
+from backend.app.weather import WeatherClient
+
+
+def _client(**kw) -> WeatherClient:
+    return WeatherClient("http://upstream", "test", transport=httpx.ASGITransport(app=weather_mock.app), **kw)
+
+
+async def _control(client: WeatherClient, **params) -> dict:
+    res = await client._http().get("http://upstream/control", params=params)
+    return res.json()
+
+
+def run(coro_fn):
+    async def main():
+        client = _client()
+        await _control(client, fail=0, delay_ms=0, reset=1)
+        try:
+            await coro_fn(client)
+        finally:
+            await _control(client, fail=0, delay_ms=0)
+            await client.aclose()
+    asyncio.run(main())
+
+
+def test_miss_then_hit():
+    async def body(c):
+        doc, source = await c.onecall(20.0, 85.0)
+        assert source == "miss" and "minutely" not in doc and doc["current"]
+        assert (await c.onecall(20.01, 85.01))[1] == "hit"  # same grid cell
+        assert (await c.onecall(21.0, 85.0))[1] == "miss"
+        assert (await _control(c))["calls"] == 2
+    run(body)
+
+
+def test_concurrent_misses_coalesce():
+    async def body(c):
+        await _control(c, delay_ms=100)
+        results = await asyncio.gather(*(c.onecall(20.0, 85.0) for _ in range(5)))
+        assert sorted(s for _, s in results) == ["coalesced"] * 4 + ["miss"]
+        assert (await _control(c))["calls"] == 1
+    run(body)
+
+
+def test_stale_served_when_upstream_fails():
+    async def body(c):
+        c.ttl = 0.0
+        await c.onecall(20.0, 85.0)
+        await _control(c, fail=1)
+        doc, source = await c.onecall(20.0, 85.0)
+        assert source == "stale" and doc["current"]
+        assert c.stats()["errors"] == 1
+        with pytest.raises(httpx.HTTPStatusError):
+            await c.onecall(30.0, 85.0)  # nothing cached to fall back on
+    run(body)
+
+
+def test_cancelled_leader_does_not_strand_followers():
+    async def body(c):
+        await _control(c, delay_ms=200)
+        leader = asyncio.create_task(c.onecall(20.0, 85.0))
+        await asyncio.sleep(0.02)
+        follower = asyncio.create_task(c.onecall(20.0, 85.0))
+        await asyncio.sleep(0.02)
+        leader.cancel()
+        doc, source = await asyncio.wait_for(follower, timeout=2.0)
+        assert source == "coalesced" and doc["current"]
+        assert leader.cancelled()
+        assert (await c.onecall(20.0, 85.0))[1] == "hit"
+        assert (await _control(c))["calls"] == 1
+    run(body)
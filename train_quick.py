@@ -69,11 +69,8 @@ def dice_loss(pred, target, smooth=1.):
 def loss_fn(pred, target):
     return bce(pred, target) + dice_loss(pred, target)
 
-def iou_score(pred, target, thr=0.5, eps=1e-6):
-    pred_bin = (torch.sigmoid(pred) > thr).float()
-    inter = (pred_bin * target).sum(dim=(1,2,3))
-    union = pred_bin.sum(dim=(1,2,3)) + target.sum(dim=(1,2,3)) - inter
-    return ((inter + eps) / (union + eps)).mean().item()
+# Shared with the serving code and quant_report.py
+from backend.app.nets import iou_score
 
 # Synthetic dataset
 def synth(n=64, size=256):
@@ -102,11 +99,29 @@ class DS(Dataset):
         if self.aug and random.random() < 0.5:
             x = x[:, :, ::-1].copy()
             y = y[:, ::-1].copy()
-        return torch.from_numpy(x), torch.from_numpy(y)[None, ...]
+        # Store tiles are copy-on-write memmap views, so from_numpy shares their pages (no copy)
+        return torch.from_numpy(x), torch.from_numpy(y)[None, ...].float()
 
-print('Generating synthetic data...')
-Xtr, Ytr = synth(96)
-Xv, Yv = synth(24)
+def from_tile_store(root, val_frac=0.2):
+    """Train/val lists of zero-copy tile views from a packed tile store (tiles with masks only)."""
+    import sys
+    sys.path.insert(0, str(ROOT))
+    from backend.app.tilestore import TileStore
+    store = TileStore(root, mode='c')
+    ids = [i for i in store.ids() if store.mask(i) is not None]
+    random.shuffle(ids)
+    n_val = int(len(ids) * val_frac)
+    split = lambda ix: ([store.image(i) for i in ix], [store.mask(i) for i in ix])
+    return split(ids[n_val:]) + split(ids[:n_val])
+
+TILE_STORE = os.getenv('UNET_TILE_STORE')
+if TILE_STORE:
+    print(f'Loading tiles from store {TILE_STORE}...')
+    Xtr, Ytr, Xv, Yv = from_tile_store(TILE_STORE)
+else:
+    print('Generating synthetic data...')
+    Xtr, Ytr = synth(96)
+    Xv, Yv = synth(24)
 train_ds = DS(Xtr, Ytr, aug=True)
 val_ds = DS(Xv, Yv, aug=False)
 train_loader = DataLoader(train_ds, batch_size=8, shuffle=True, num_workers=0)